@@ -1,76 +1,602 @@
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import APIRouter, Depends, FastAPI, Header, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
+from typing import List, Optional
 import parser
-import uvicorn
+from artifact import SchemaStore
+from cache import open_cache
+from images import ImageEnricher, default_provider
+from classifier import load_classifier
+from cascade import Cascade
+from pool import is_retryable
+from server import mark_ready, serve, shared_dir, workers_ready
+import metrics
+import argparse
+import asyncio
+import json
 import os
+import time
 
-app = FastAPI()
+# Schema, prompt, matchers and rules come from a compiled artifact that is
+# hot-swapped when api_schema.json changes or POST /admin/reload is called
+SCHEMA_FILE = "api_schema.json"
+# Deterministic pre-extractor in front of the model (RULES_ENABLED=0 turns it off)
+RULES_ENABLED = os.environ.get("RULES_ENABLED", "1") != "0"
+# Shared secret for /admin endpoints; without one they only answer requests from this host
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+LOCAL_CLIENTS = {"127.0.0.1", "::1", "localhost"}
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["http://localhost:3000"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+# Default / maximum number of batch items in flight against Ollama
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", "4"))
+BATCH_MAX_CONCURRENCY = 64
+# Processes serving the API (see server.py); each uses one core for validation and matching
+API_WORKERS = int(os.environ.get("API_WORKERS", "1"))
+# WARMUP=0 reports ready without loading the model or priming caches first
+WARMUP = os.environ.get("WARMUP", "1") != "0"
+WARMUP_RETRY = 5.0  # seconds between warm-up attempts while Ollama is unreachable or failing
+METRICS_FLUSH = 1.0  # seconds between a worker's metrics snapshots (prefork only)
+# Cold start is measured from here; forked workers inherit the parent's value
+PROCESS_STARTED = time.time()
 
-# Load schema and prompt once at startup
-SCHEMA_FILE = "api_schema.json"
-if not os.path.exists(SCHEMA_FILE):
-    raise RuntimeError(f"Schema file {SCHEMA_FILE} not found")
+class Preloaded:
+    """
+    The expensive, read-only part of the API state: the schema store with
+    its compiled artifact (prompt, enum sets, matcher indexes, rules) and
+    the category classifier. It is built once and handed to every app, so
+    forked workers share it instead of each loading their own.
+    """
+
+    def __init__(self, schema_file=SCHEMA_FILE):
+        if not os.path.exists(schema_file):
+            raise RuntimeError(f"Schema file {schema_file} not found")
+        self.store = SchemaStore(schema_file)
+        # Fixed num_ctx for single and packed calls, the same in every worker (see parser.context_sizes)
+        self.context_sizes = parser.context_sizes(self.store.current.schema)
+        print(f"num_ctx: {self.context_sizes[0]} for single calls, {self.context_sizes[1]} for packed batches")
+        # CATEGORY_MODE=classifier predicts category/subcategory locally instead of asking the model
+        self.classifier = load_classifier() if parser.CATEGORY_MODE == "classifier" else None
+
+class Service:
+    """
+    Everything one API process serves requests with: the preloaded schema
+    and classifier plus its own result cache (an SQLite handle), image
+    enricher and model cascade, which must not be shared across a fork.
+    """
+
+    def __init__(self, preloaded):
+        self.store = preloaded.store
+        self.classifier = preloaded.classifier
+        self.cache = open_cache()
+        image_provider = default_provider()
+        # Under prefork, workers share lookups so a poll can land on any of them
+        images_dir = os.path.join(shared_dir(), "images") if shared_dir() is not None else None
+        self.enricher = ImageEnricher(image_provider, shared_dir=images_dir) if image_provider else None
+        # CASCADE_MODELS="small,large" tries the small model first (see cascade.py)
+        self.cascade = Cascade.from_env()
+        workers = workers_ready()
+        if workers and parser.OLLAMA_HOSTS:
+            # Host caps are for the whole server; each worker gets its share
+            parser.configure_pool(parser.OLLAMA_HOSTS, share=workers[1])
+        self.ready = False
+        self.startup = {}
+        self.warmup_error = None
+        self.warmup_failed = False
+
+    async def warm_up(self):
+        """
+        Loads every model this worker will call and runs a first parse (see
+        parser.warm_up_async), retrying while Ollama isn't up, then marks
+        the worker ready for /readyz and records the cold-start time. An
+        error retrying can't fix (a model Ollama doesn't have, any other
+        4xx) stops the warm-up and leaves the worker unready.
+        """
+        compiled = self.store.current
+        models = self.cascade.models if self.cascade is not None else [parser.MODEL_NAME]
+        timings = {}
+        attempts = 0
+        while WARMUP:
+            attempts += 1
+            try:
+                for model in models:
+                    timings[model] = await parser.warm_up_async(compiled.system_prompt, compiled.schema, model)
+                break
+            except Exception as e:
+                self.warmup_error = f"{type(e).__name__}: {e}"
+                if not is_retryable(e):
+                    self.warmup_failed = True
+                    print(f"Warm-up failed ({self.warmup_error}); not retrying. Is the model pulled?")
+                    return
+                print(f"Warm-up failed ({self.warmup_error}); retrying in {WARMUP_RETRY:.0f}s")
+                await asyncio.sleep(WARMUP_RETRY)
+        cold_start = time.time() - PROCESS_STARTED
+        metrics.COLD_START_SECONDS.set(cold_start)
+        for model, steps in timings.items():
+            for step, seconds in steps.items():
+                metrics.WARMUP_SECONDS.set(seconds, model=model, step=step)
+        self.startup = {
+            "cold_start_seconds": round(cold_start, 3),
+            "warmup_attempts": attempts,
+            "warmup_seconds": {model: {step: round(seconds, 3) for step, seconds in steps.items()}
+                               for model, steps in timings.items()},
+        }
+        self.warmup_error = None
+        self.ready = True
+        mark_ready()
+        print(f"Worker {os.getpid()} ready after {cold_start:.1f}s: {self.startup['warmup_seconds']}")
+
+async def flush_metrics(directory):
+    """Keeps this worker's metrics snapshot fresh for whichever worker serves /metrics."""
+    try:
+        while True:
+            await asyncio.to_thread(metrics.REGISTRY.dump, directory)
+            await asyncio.sleep(METRICS_FLUSH)
+    finally:
+        metrics.REGISTRY.dump(directory)
+
+@asynccontextmanager
+async def lifespan(app):
+    service = app.state.service
+    tasks = [asyncio.create_task(service.store.watch()),
+             # /healthz answers while this runs; /readyz waits for it
+             asyncio.create_task(service.warm_up())]
+    if shared_dir() is not None:
+        tasks.append(asyncio.create_task(flush_metrics(shared_dir())))
+    yield
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await parser.close_async_client()
+    # Flushes background cache writes; a prefork worker exits without running thread cleanup
+    await asyncio.to_thread(service.cache.close)
+
+class RequestMetrics:
+    """
+    ASGI middleware recording each request's latency and in-flight count.
+    A request is timed until its last body chunk is sent, so streamed
+    responses (/parse/stream, batches) count their whole duration; an
+    http middleware's call_next returns as soon as the headers are ready.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status = 500
+
+        async def send_recording_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        with metrics.REQUESTS_IN_FLIGHT.track():
+            try:
+                await self.app(scope, receive, send_recording_status)
+            finally:
+                # Label by route template, not raw URL, to keep series bounded
+                route = scope.get("route")
+                path = route.path if route is not None else "unmatched"
+                metrics.REQUEST_SECONDS.observe(time.perf_counter() - start, method=scope["method"], path=path,
+                                                status=str(status))
 
-schema = parser.load_schema(SCHEMA_FILE)
-system_prompt = parser.construct_prompt(schema)
+router = APIRouter()
+
+def create_app(preloaded=None):
+    """
+    Builds the API app. `preloaded` (a Preloaded) is shared, so several
+    apps, e.g. the workers forked by server.serve, reuse one compiled
+    schema; without it the schema is loaded here.
+    """
+    app = FastAPI(lifespan=lifespan)
+    app.state.service = Service(preloaded or Preloaded())
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["http://localhost:3000"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    app.add_middleware(RequestMetrics)
+    app.include_router(router)
+    return app
+
+def __getattr__(name):
+    # `uvicorn api:app` and `api.app` get a default single-process app, built on first use
+    if name == "app":
+        app = globals()["app"] = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def get_service(request: Request):
+    return request.app.state.service
 
 class ParseRequest(BaseModel):
     description: str
+    callback_url: Optional[str] = None
+    # Only extract these properties (default: all of them)
+    fields: Optional[List[str]] = None
+
+class ImageRequest(BaseModel):
+    product_name: str
+    callback_url: Optional[str] = None
+
+class BatchParseRequest(BaseModel):
+    descriptions: List[str]
+    concurrency: Optional[int] = None
+    pack: Optional[bool] = None
+
+def check_callback(service, callback_url):
+    """400 for a callback_url outside IMAGE_CALLBACK_HOSTS, before any work is done for the request."""
+    if callback_url and service.enricher is not None:
+        try:
+            service.enricher.check_callback(callback_url)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+async def parse_with(service, compiled, description, stats=None, fields=None):
+    """Parses against one compiled schema version; callers pin it for the whole request."""
+    rules = compiled.rules if RULES_ENABLED else None
+    if service.cascade is not None:
+        return await service.cascade.parse_async(description, compiled.system_prompt, compiled.schema,
+                                                 cache=service.cache, stats=stats, rules=rules,
+                                                 classifier=service.classifier, fields=fields)
+    return await parser.parse_description_async(description, compiled.system_prompt, compiled.schema,
+                                                cache=service.cache, stats=stats, rules=rules,
+                                                classifier=service.classifier, fields=fields)
 
-@app.post("/parse")
-async def parse_product(request: ParseRequest):
+@router.post("/parse")
+async def parse_product(request: ParseRequest, response: Response, service: Service = Depends(get_service)):
     if not request.description:
         raise HTTPException(status_code=400, detail="Description cannot be empty")
+    compiled = service.store.current
+    try:
+        fields = parser.select_fields(compiled.schema, request.fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    check_callback(service, request.callback_url)
     
     print(f"Parsing description: {request.description[:50]}...")
     try:
-        result = parser.parse_description(request.description, system_prompt, schema)
+        stats = {}
+        result = await parse_with(service, compiled, request.description, stats, fields)
+        metrics.observe_parse(stats, ok=bool(result))
         if not result:
              raise HTTPException(status_code=500, detail="Failed to parse description")
+        print(parser.format_usage(stats))
         
-        # Try to fetch an image
-        if "product_name" in result:
-                try:
-                    from ddgs import DDGS
-                    # Retry logic for rate limits
-                    max_retries = 3
-                    for attempt in range(max_retries):
-                        try:
-                            with DDGS() as ddgs:
-                                keywords = result["product_name"]
-                                # Search for images
-                                images = list(ddgs.images(keywords, max_results=1))
-                                if images:
-                                    result["image_url"] = images[0]["image"]
-                                    break
-                        except Exception as inner_e:
-                            print(f"Image search attempt {attempt+1} failed: {inner_e}")
-                            if attempt < max_retries - 1:
-                                import time
-                                time.sleep(2) # Wait before retrying
-                            else:
-                                raise inner_e
-
-                except Exception as e:
-                    print(f"Image search failed after retries: {e}")
+        # Image lookup runs in the background; clients poll /image or pass a callback_url
+        if result.get("product_name") and service.enricher is not None:
+            with metrics.stage(stats, 'image'):
+                image = service.enricher.request(result["product_name"], request.callback_url)
+            metrics.STAGE_SECONDS.observe(stats['timings']['image'], stage='image')
+            if image["image_url"]:
+                result["image_url"] = image["image_url"]
+            else:
+                result["image_status"] = image["status"]
 
+        response.headers["Server-Timing"] = metrics.server_timing(stats)
+        response.headers["X-Schema-Version"] = compiled.version
         return result
     except Exception as e:
         print(f"Error parsing: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/schema")
-async def get_schema():
-    return schema
+def sse(event, data):
+    """One server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def stream_events(service, compiled, description, callback_url=None, fields=None):
+    """SSE body for /parse/stream: field events as values complete, then the final result."""
+    stats = {}
+    rules = compiled.rules if RULES_ENABLED else None
+    events = parser.stream_description_async(description, compiled.system_prompt, compiled.schema,
+                                             cache=service.cache, stats=stats, rules=rules,
+                                             classifier=service.classifier, fields=fields)
+    async for event in events:
+        kind = event.pop("event")
+        if kind == "result":
+            result = event["result"]
+            metrics.observe_parse(stats, ok=bool(result))
+            if result and result.get("product_name") and service.enricher is not None:
+                image = service.enricher.request(result["product_name"], callback_url)
+                if image["image_url"]:
+                    result["image_url"] = image["image_url"]
+                else:
+                    result["image_status"] = image["status"]
+            print(parser.format_usage(stats))
+            yield sse("result", result)
+            yield sse("timing", {"server_timing": metrics.server_timing(stats)})
+        elif kind == "error":
+            metrics.observe_parse(stats, ok=False)
+            yield sse("error", {"detail": event["error"]})
+        else:
+            yield sse(kind, event)
+
+def stream_response(service, description, callback_url=None, fields=None):
+    if not description:
+        raise HTTPException(status_code=400, detail="Description cannot be empty")
+    compiled = service.store.current
+    try:
+        fields = parser.select_fields(compiled.schema, fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    check_callback(service, callback_url)
+    print(f"Streaming parse: {description[:50]}...")
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "X-Schema-Version": compiled.version}
+    return StreamingResponse(stream_events(service, compiled, description, callback_url, fields),
+                             media_type="text/event-stream", headers=headers)
+
+@router.post("/parse/stream")
+async def parse_stream(request: ParseRequest, service: Service = Depends(get_service)):
+    """
+    Server-sent events version of /parse. Emits `field` events
+    ({"field": ..., "value": ...}) as each value completes in the model's
+    output, then one `result` event with the validated object (or `error`).
+    `fields` limits both to those properties, as in /parse.
+    """
+    return stream_response(service, request.description, request.callback_url, request.fields)
+
+@router.get("/parse/stream")
+async def parse_stream_get(description: str, fields: Optional[List[str]] = Query(None),
+                           service: Service = Depends(get_service)):
+    """Same as POST /parse/stream, for EventSource clients (`?fields=brand&fields=color`)."""
+    return stream_response(service, description, fields=fields)
+
+async def run_batch(service, descriptions, concurrency, compiled):
+    """
+    Parses descriptions with at most `concurrency` in flight; yields NDJSON lines as they finish.
+    Every item uses the same compiled schema version.
+    """
+    pending = asyncio.Queue()
+    done = asyncio.Queue()
+    for item in enumerate(descriptions):
+        pending.put_nowait(item)
+
+    async def worker():
+        while True:
+            try:
+                index, description = pending.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            if isinstance(description, Exception):
+                line = {"index": index, "error": str(description)}
+            elif not description:
+                line = {"index": index, "error": "Description cannot be empty"}
+            else:
+                try:
+                    stats = {}
+                    result = await parse_with(service, compiled, description, stats)
+                    metrics.observe_parse(stats, ok=bool(result))
+                    if result:
+                        line = {"index": index, "result": result}
+                    else:
+                        line = {"index": index, "error": "Failed to parse description"}
+                except Exception as e:
+                    line = {"index": index, "error": str(e)}
+            await done.put(line)
+
+    workers = [asyncio.create_task(worker()) for _ in range(min(concurrency, len(descriptions)))]
+    try:
+        for _ in range(len(descriptions)):
+            line = await done.get()
+            yield json.dumps(line) + "\n"
+    finally:
+        # Client went away or we finished; stop any remaining work
+        for w in workers:
+            w.cancel()
+
+async def run_packed_batch(service, descriptions, concurrency, compiled):
+    """
+    Like run_batch, but sends several descriptions per model call (see
+    parser.parse_packed); `concurrency` is the number of packs in flight.
+    Lines are yielded as each pack finishes.
+    """
+    valid = [(i, d) for i, d in enumerate(descriptions) if d and not isinstance(d, Exception)]
+    for index, description in enumerate(descriptions):
+        if isinstance(description, Exception):
+            yield json.dumps({"index": index, "error": str(description)}) + "\n"
+        elif not description:
+            yield json.dumps({"index": index, "error": "Description cannot be empty"}) + "\n"
+
+    rules = compiled.rules if RULES_ENABLED else None
+    stats = {}
+    items = parser.iter_packed_async([d for _, d in valid], compiled.system_prompt, compiled.schema,
+                                     cache=service.cache, stats=stats, rules=rules, classifier=service.classifier,
+                                     concurrency=concurrency)
+    try:
+        async for position, result in items:
+            index = valid[position][0]
+            metrics.PARSES.inc(outcome="ok" if result else "failed")
+            if result:
+                yield json.dumps({"index": index, "result": result}) + "\n"
+            else:
+                yield json.dumps({"index": index, "error": "Failed to parse description"}) + "\n"
+    finally:
+        await items.aclose()
+        # Summed over packed calls and single calls, including those of a batch cut short
+        metrics.observe_tokens(stats)
+    if valid:
+        print(f"Packed batch: {stats['packed_items']} items in {stats['packed_calls']} packed calls, "
+              f"{stats['single_calls']} single calls, {stats['fallbacks']} single-call fallbacks")
+
+def read_ndjson(body):
+    """Descriptions from an NDJSON body: one JSON string or {"description": ...} per line."""
+    descriptions = []
+    for raw in body.splitlines():
+        if not raw.strip():
+            continue
+        try:
+            item = json.loads(raw)
+            if isinstance(item, dict):
+                item = item.get("description")
+            if item is not None and not isinstance(item, str):
+                raise ValueError("description must be a string")
+            descriptions.append(item)
+        except ValueError as e:
+            # Report bad lines inline instead of failing the batch
+            descriptions.append(ValueError(f"Invalid NDJSON line: {e}"))
+    return descriptions
+
+@router.post("/parse/batch")
+async def parse_batch(request: Request, concurrency: int = BATCH_CONCURRENCY, pack: bool = False,
+                      service: Service = Depends(get_service)):
+    """
+    Batch parse. Body is either JSON {"descriptions": [...], "concurrency": n}
+    or NDJSON (Content-Type: application/x-ndjson). Streams one NDJSON line per
+    item in completion order: {"index": i, "result": {...}} or {"index": i, "error": "..."}.
+    With pack=true, several descriptions share each model call.
+    """
+    body = await request.body()
+    if "ndjson" in request.headers.get("content-type", ""):
+        descriptions = read_ndjson(body.decode("utf-8", errors="replace"))
+    else:
+        try:
+            batch = BatchParseRequest.model_validate_json(body)
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        descriptions = batch.descriptions
+        if batch.concurrency is not None:
+            concurrency = batch.concurrency
+        if batch.pack is not None:
+            pack = batch.pack
+
+    if not descriptions:
+        raise HTTPException(status_code=400, detail="Batch cannot be empty")
+    concurrency = max(1, min(concurrency, BATCH_MAX_CONCURRENCY))
+
+    print(f"Parsing batch of {len(descriptions)} descriptions (concurrency {concurrency}{', packed' if pack else ''})...")
+    compiled = service.store.current
+    run = run_packed_batch if pack else run_batch
+    lines = run(service, descriptions, concurrency, compiled)
+    return StreamingResponse(lines, media_type="application/x-ndjson",
+                             headers={"X-Schema-Version": compiled.version})
+
+@router.get("/schema")
+async def get_schema(response: Response, service: Service = Depends(get_service)):
+    compiled = service.store.current
+    response.headers["X-Schema-Version"] = compiled.version
+    return compiled.schema
+
+@router.post("/admin/reload")
+async def reload_schema(request: Request, x_admin_token: Optional[str] = Header(default=None),
+                        service: Service = Depends(get_service)):
+    """
+    Recompiles api_schema.json and swaps it in. Requests already running
+    finish on the version they started with. Requires X-Admin-Token when
+    ADMIN_TOKEN is set, and a client on this host when it isn't. With
+    several workers this reloads the one that got the request; the others
+    pick the change up from the file watcher.
+    """
+    if ADMIN_TOKEN:
+        if x_admin_token != ADMIN_TOKEN:
+            raise HTTPException(status_code=403, detail="Invalid admin token")
+    elif request.client is None or request.client.host not in LOCAL_CLIENTS:
+        raise HTTPException(status_code=403, detail="Set ADMIN_TOKEN to reload the schema from another host")
+    try:
+        previous, current = await asyncio.to_thread(service.store.reload)
+    except Exception as e:
+        raise HTTPException(status_code=422, detail=f"Schema not reloaded, still serving {service.store.current.version}: {e}")
+    return {"previous": previous, "version": current, "changed": previous != current}
+
+def get_enricher(service):
+    if service.enricher is None:
+        raise HTTPException(status_code=404, detail="Image enrichment is disabled")
+    return service.enricher
+
+@router.get("/image")
+async def get_image(product_name: str, wait: float = 0.0, service: Service = Depends(get_service)):
+    """
+    Image lookup status for a product name: found, not_found, pending, or
+    unknown if nothing looked it up. Never starts a search (POST /image
+    and /parse do); `wait` long-polls a pending lookup up to that many seconds.
+    Any worker answers for a lookup another worker started.
+    """
+    enricher = get_enricher(service)
+    status = enricher.status(product_name)
+    if status["status"] == "pending" and wait > 0:
+        try:
+            status = await asyncio.wait_for(enricher.wait(product_name), timeout=min(wait, 30.0))
+        except asyncio.TimeoutError:
+            status = enricher.status(product_name)
+    return status
+
+@router.post("/image")
+async def start_image(request: ImageRequest, service: Service = Depends(get_service)):
+    """Starts an image lookup for a product name (unless one is cached or running) and returns its status."""
+    enricher = get_enricher(service)
+    check_callback(service, request.callback_url)
+    return enricher.request(request.product_name, request.callback_url)
+
+@router.get("/metrics")
+async def get_metrics():
+    """
+    Prometheus text exposition of stage timings, counters and in-flight
+    gauges. With several workers it covers all of them (see metrics.Registry).
+    """
+    directory = shared_dir()
+    if directory is None:
+        return Response(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+    metrics.REGISTRY.dump(directory)
+    return Response(await asyncio.to_thread(metrics.REGISTRY.render, directory), media_type=metrics.CONTENT_TYPE)
+
+@router.get("/healthz")
+async def healthz():
+    """Liveness: the process is up. Answers during warm-up too."""
+    return {"status": "ok"}
+
+@router.get("/readyz")
+async def readyz(response: Response, service: Service = Depends(get_service)):
+    """
+    Readiness: 503 until the warm-up has loaded the model and run a first
+    parse, so a load balancer only routes requests that will be fast. With
+    several workers it waits for all of them, whichever one answers, since
+    they share the port. "failed" means the warm-up hit an error retrying
+    won't fix. The ready answer includes this worker's cold-start and
+    warm-up times.
+    """
+    workers = workers_ready()
+    counts = {"workers": {"ready": workers[0], "total": workers[1]}} if workers else {}
+    if not service.ready:
+        response.status_code = 503
+        return {"status": "failed" if service.warmup_failed else "warming_up", "pid": os.getpid(),
+                "error": service.warmup_error, **counts}
+    if workers and workers[0] < workers[1]:
+        response.status_code = 503
+        return {"status": "warming_up", "pid": os.getpid(), **counts}
+    return {"status": "ready", "pid": os.getpid(), **counts, **service.startup}
+
+@router.get("/cache/stats")
+async def get_cache_stats(service: Service = Depends(get_service)):
+    stats = service.cache.stats()
+    stats["pid"] = os.getpid()
+    if service.enricher is not None:
+        stats["images"] = service.enricher.stats()
+    if RULES_ENABLED:
+        stats["rules"] = service.store.current.rules.stats()
+    stats["schema"] = service.store.stats()
+    stats["startup"] = {"ready": service.ready, **service.startup}
+    stats["coalescing"] = parser.coalescing_stats()
+    pool = parser.get_pool()
+    if pool is not None:
+        stats["hosts"] = pool.stats()
+    if service.cascade is not None:
+        stats["cascade"] = service.cascade.stats()
+    return stats
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Runs the product parser API.")
+    arg_parser.add_argument('--host', default="0.0.0.0")
+    arg_parser.add_argument('--port', type=int, default=8000)
+    arg_parser.add_argument('--workers', type=int, default=API_WORKERS,
+                            help="Worker processes; they share one preloaded schema (default: API_WORKERS or 1)")
+    args = arg_parser.parse_args()
+    serve(create_app, Preloaded, host=args.host, port=args.port, workers=max(1, args.workers))
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    main()
@@ -0,0 +1,212 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import pickle
+import threading
+import time
+
+import matcher
+import parser
+import rules
+import token_matcher
+from cache import forget_fingerprint
+from matcher import SchemaMatcher, register_matcher, unregister_matcher
+from parser import construct_prompt, forget_schema
+from rules import RuleExtractor
+
+
+# Bump when CompiledSchema changes shape
+ARTIFACT_FORMAT = 2
+ARTIFACT_SUFFIX = ".artifact"
+POLL_INTERVAL = 2.0  # seconds between schema file checks
+# Modules whose code decides what an artifact holds (prompt, matcher indexes, rules)
+COMPILER_MODULES = (matcher, parser, rules, token_matcher)
+
+
+def artifact_path(schema_path):
+    """schema.json -> schema.artifact"""
+    return os.path.splitext(schema_path)[0] + ARTIFACT_SUFFIX
+
+
+def source_version(data):
+    """Version id of a schema: a hash of the file's bytes."""
+    return hashlib.sha256(data).hexdigest()[:16]
+
+
+def compiler_version():
+    """Hash of the source of this module and COMPILER_MODULES; an artifact built by other code is stale."""
+    digest = hashlib.sha256()
+    for path in [__file__] + [module.__file__ for module in COMPILER_MODULES]:
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+COMPILER_VERSION = compiler_version()
+
+
+class CompiledSchema:
+    """
+    Everything derived from one schema file: the parsed schema, the rendered
+    system prompt, per-field enum sets, the matcher indexes and the rule
+    pre-extractor. It is built once by `compile_schema` and loaded with a
+    single unpickle. Apart from the rule extractor's usage counters (calls,
+    short circuits), nothing in it changes afterwards, so a request can keep
+    using the instance it started with while a newer one is swapped in.
+    """
+
+    def __init__(self, schema, version, source=None):
+        self.format = ARTIFACT_FORMAT
+        self.compiler = COMPILER_VERSION
+        self.schema = schema
+        self.version = version
+        self.source = source
+        self.compiled_at = time.time()
+        self.system_prompt = construct_prompt(schema)
+        self.enums = {key: frozenset(prop.get("values", []))
+                      for key, prop in schema.get("properties", {}).items() if prop.get("type") == "enum"}
+        self.matcher = SchemaMatcher(schema)
+        self.rules = RuleExtractor(schema)
+
+    def activate(self):
+        """Registers the prebuilt matcher so validate_and_normalize doesn't rebuild it."""
+        register_matcher(self.schema, self.matcher)
+        return self
+
+    def deactivate(self):
+        """Drops this version's entries from the per-schema memos once nothing serves it any more."""
+        unregister_matcher(self.schema)
+        forget_fingerprint(self.schema)
+        forget_schema(self.schema)
+
+    def info(self):
+        return {"version": self.version, "source": self.source, "compiled_at": self.compiled_at,
+                "fields": list(self.schema.get("properties", {}))}
+
+
+def compile_schema(schema_path, output=None):
+    """Compiles a schema JSON file into an artifact next to it. Returns the CompiledSchema."""
+    with open(schema_path, 'rb') as f:
+        data = f.read()
+    compiled = CompiledSchema(json.loads(data), source_version(data), schema_path)
+    output = output or artifact_path(schema_path)
+    tmp = f"{output}.{os.getpid()}.tmp"  # API workers may all recompile the same schema at once
+    try:
+        with open(tmp, 'wb') as f:
+            pickle.dump(compiled, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, output)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+    return compiled
+
+
+def load_or_compile(schema_path):
+    """
+    The CompiledSchema for a schema file, from its artifact when that was
+    built from the same bytes by the same code (COMPILER_VERSION); otherwise the
+    schema is compiled (and the artifact rewritten). Raises on a bad schema.
+    """
+    with open(schema_path, 'rb') as f:
+        version = source_version(f.read())
+    path = artifact_path(schema_path)
+    if os.path.exists(path):
+        try:
+            with open(path, 'rb') as f:
+                compiled = pickle.load(f)
+            if (compiled.format == ARTIFACT_FORMAT and compiled.version == version
+                    and compiled.compiler == COMPILER_VERSION):
+                return compiled.activate()
+        except Exception as e:
+            print(f"Ignoring unreadable artifact {path}: {e}")
+    return compile_schema(schema_path).activate()
+
+
+class SchemaStore:
+    """
+    Holds the active CompiledSchema and swaps in a new one when the schema
+    file changes (`watch`) or on demand (`reload`). The new version is
+    fully built before the swap, and the swap is one reference assignment,
+    so requests never see a half-loaded schema. Callers read `current`
+    once per request and keep that object, which pins their version. A
+    schema that fails to load leaves the current version in place, and
+    `watch` tries it again at the next poll until it loads. The
+    memos keyed by schema (matcher, fingerprint, prompts) are cleared of a
+    version at the swap after the one that retired it, once requests
+    pinned to it have long finished, so reloads don't accumulate them.
+    """
+
+    def __init__(self, schema_path, poll_interval=POLL_INTERVAL):
+        self.path = schema_path
+        self.poll_interval = poll_interval
+        self._stamp = self._file_stamp()
+        self.current = load_or_compile(schema_path)
+        self.reloads = 0
+        self.last_error = None
+        self._retired = None  # the version the last swap replaced
+        self._lock = threading.Lock()
+
+    def _file_stamp(self):
+        try:
+            st = os.stat(self.path)
+            return st.st_mtime_ns, st.st_size
+        except OSError:
+            return None
+
+    def reload(self):
+        """Loads the schema file again. Returns (previous version, current version)."""
+        with self._lock:
+            previous = self.current
+            # Taken before loading, so a change made meanwhile is picked up next time
+            stamp = self._file_stamp()
+            try:
+                compiled = load_or_compile(self.path)
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+                if error != self.last_error:  # watch retries every poll; say it once
+                    print(f"Schema reload failed, keeping version {previous.version}: {error}")
+                self.last_error = error
+                raise
+            self._stamp = stamp
+            self.last_error = None
+            if compiled.version != previous.version:
+                self.current = compiled
+                self.reloads += 1
+                if self._retired is not None:
+                    self._retired.deactivate()
+                self._retired = previous
+                print(f"Schema reloaded: {previous.version} -> {compiled.version}")
+            else:
+                compiled.deactivate()
+            return previous.version, self.current.version
+
+    async def watch(self):
+        """Polls the schema file and reloads it when its mtime or size changes. Run as a task."""
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            if self._file_stamp() != self._stamp:
+                try:
+                    await asyncio.to_thread(self.reload)
+                except Exception:
+                    pass  # reported in last_error; the old version keeps serving
+
+    def stats(self):
+        return {**self.current.info(), "reloads": self.reloads, "last_error": self.last_error}
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Compiles schema JSON files into fast-loading artifacts.")
+    arg_parser.add_argument('schemas', nargs='+', help="Schema JSON files (artifact is written next to each)")
+    args = arg_parser.parse_args()
+    for schema_path in args.schemas:
+        started = time.perf_counter()
+        compiled = compile_schema(schema_path)
+        print(f"{schema_path} -> {artifact_path(schema_path)} (version {compiled.version}, "
+              f"{time.perf_counter() - started:.3f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+import difflib
+import random
+import sys
+import time
+
+import matcher
+
+SCHEMA_FILE = "schema.json"
+FIELDS = ["subcategory", "brand", "color", "material"]
+NUM_QUERIES = 500
+SEED = 42
+
+
+def load_schema(filepath):
+    """Loads the schema without importing parser (which needs ollama)."""
+    import json
+    with open(filepath, 'r') as f:
+        return json.load(f)
+
+
+def legacy_match(v, valid_values):
+    """The original per-call difflib scan from validate_and_normalize."""
+    if not v: return None
+    v = str(v).lower().strip()
+    if v in valid_values:
+        return v
+    matches = difflib.get_close_matches(v, valid_values, n=1, cutoff=0.6)
+    if matches:
+        return matches[0]
+    return v
+
+
+def make_queries(schema, n, seed):
+    """Builds (field, raw value) pairs: exact hits, typos, case changes and junk."""
+    rng = random.Random(seed)
+    props = schema["properties"]
+    queries = []
+    for _ in range(n):
+        field = rng.choice(FIELDS)
+        value = list(rng.choice(props[field]["values"]))
+        kind = rng.random()
+        if kind < 0.5:
+            for _ in range(rng.randint(1, 3)):
+                if value:
+                    value[rng.randrange(len(value))] = rng.choice("abcdefghijklmnop ")
+        elif kind < 0.7:
+            value = list("".join(value).title())
+        elif kind < 0.8:
+            value = list("".join(rng.choice("abcdefghijklmnopqrstuvwxyz ") for _ in range(rng.randint(3, 15))))
+        queries.append((field, "".join(value)))
+    return queries
+
+
+def bench(label, fn, queries):
+    start = time.perf_counter()
+    out = [fn(field, raw) for field, raw in queries]
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {elapsed * 1000:9.1f} ms total  {elapsed / len(queries) * 1e6:9.1f} us/value")
+    return out, elapsed
+
+
+def main():
+    schema = load_schema(sys.argv[1] if len(sys.argv) > 1 else SCHEMA_FILE)
+    props = schema["properties"]
+    queries = make_queries(schema, NUM_QUERIES, SEED)
+    print(f"{len(queries)} lookups over fields: " + ", ".join(f"{f}={len(props[f]['values'])}" for f in FIELDS))
+
+    expected, legacy_time = bench("difflib scan", lambda f, v: legacy_match(v, props[f]["values"]), queries)
+
+    start = time.perf_counter()
+    m = matcher.SchemaMatcher(schema)
+    print(f"{'build index':<28} {(time.perf_counter() - start) * 1000:9.1f} ms")
+
+    cold, cold_time = bench("indexed (cold memo)", m.normalize, queries)
+    warm, warm_time = bench("indexed (warm memo)", m.normalize, queries)
+
+    mismatches = [(q, e, c) for q, e, c in zip(queries, expected, cold) if e != c]
+    for q, e, c in mismatches[:10]:
+        print(f"MISMATCH {q}: difflib={e!r} indexed={c!r}")
+    print(f"Identical results: {not mismatches and cold == warm}")
+    print(f"Speedup: {legacy_time / cold_time:.1f}x cold, {legacy_time / warm_time:.1f}x warm")
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,390 @@
+import argparse
+import asyncio
+import json
+import os
+import resource
+import socket
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from mock_ollama import MockOllamaServer
+
+SCHEMA_FILE = "schema.json"
+DESCRIPTION = "Heavy duty 10ft orange extension cord. Brand: PowerMax. Weight: 2lbs."
+CONCURRENCY = [1, 4, 16]
+REQUESTS = 64
+WORKERS = [1, 2, 4]
+API_STARTUP_TIMEOUT = 60.0  # seconds to wait for `api.py --workers N` to answer
+MICRO_ITERATIONS = 2000
+SCENARIOS = ["construct_prompt", "validate_and_normalize", "parse_description", "parse_description_async",
+             "stream_description_async", "parse_packed", "api_parse"]
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100.0 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def summarize(name, latencies, elapsed, concurrency=None, failures=0, **extra):
+    """One machine-readable result row; latencies are in seconds, reported in ms."""
+    latencies = sorted(latencies)
+    row = {
+        "scenario": name,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "failures": failures,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "requests_per_sec": round(len(latencies) / elapsed, 2) if elapsed else None,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    row.update(extra)
+    print(f"{name:<26} c={str(concurrency or '-'):<3} p50={row['p50_ms']:9.3f}ms p95={row['p95_ms']:9.3f}ms "
+          f"p99={row['p99_ms']:9.3f}ms {row['requests_per_sec'] or 0:10.1f} req/s  rss={row['peak_rss_mb']}MB", file=sys.stderr)
+    return row
+
+
+def time_calls(fn, iterations):
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        t = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - t)
+    return latencies, time.perf_counter() - started
+
+
+def bench_construct_prompt(parser, schema, args):
+    latencies, elapsed = time_calls(lambda: parser.construct_prompt(schema), args.iterations)
+    return [summarize("construct_prompt", latencies, elapsed)]
+
+
+def bench_validate(parser, schema, args):
+    from mock_ollama import DEFAULT_RESPONSE
+    # Fresh dict each call: validate_and_normalize edits its input in place
+    canned = json.dumps(DEFAULT_RESPONSE)
+    latencies, elapsed = time_calls(lambda: parser.validate_and_normalize(json.loads(canned), schema), args.iterations)
+    return [summarize("validate_and_normalize", latencies, elapsed)]
+
+
+def bench_parse_sync(parser, schema, args):
+    system_prompt = parser.construct_prompt(schema)
+    rows = []
+    for concurrency in args.concurrency:
+        def one(i):
+            t = time.perf_counter()
+            ok = parser.parse_description(f"{DESCRIPTION} #{i}", system_prompt, schema) is not None
+            return time.perf_counter() - t, ok
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(one, range(args.requests)))
+        elapsed = time.perf_counter() - started
+        rows.append(summarize("parse_description", [r[0] for r in results], elapsed, concurrency,
+                              failures=sum(1 for r in results if not r[1])))
+    return rows
+
+
+async def _run_async(make_call, requests, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    failures = 0
+
+    async def one(i):
+        nonlocal failures
+        async with semaphore:
+            t = time.perf_counter()
+            ok = await make_call(i)
+            latencies.append(time.perf_counter() - t)
+            if not ok:
+                failures += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    return latencies, time.perf_counter() - started, failures
+
+
+def bench_parse_async(parser, schema, args):
+    system_prompt = parser.construct_prompt(schema)
+    rows = []
+    for concurrency in args.concurrency:
+        async def call(i):
+            return await parser.parse_description_async(f"{DESCRIPTION} #{i}", system_prompt, schema) is not None
+
+        async def run():
+            try:
+                return await _run_async(call, args.requests, concurrency)
+            finally:
+                await parser.close_async_client()
+
+        latencies, elapsed, failures = asyncio.run(run())
+        rows.append(summarize("parse_description_async", latencies, elapsed, concurrency, failures=failures))
+    return rows
+
+
+def bench_stream_async(parser, schema, args):
+    """Streaming parse; reports time to the first field event next to the full latency."""
+    system_prompt = parser.construct_prompt(schema)
+    rows = []
+    for concurrency in args.concurrency:
+        first_fields = []
+
+        async def call(i):
+            t = time.perf_counter()
+            first = None
+            ok = False
+            async for event in parser.stream_description_async(f"{DESCRIPTION} #{i}", system_prompt, schema):
+                if event["event"] == "field" and first is None:
+                    first = time.perf_counter() - t
+                ok = event["event"] == "result"
+            if first is not None:
+                first_fields.append(first)
+            return ok
+
+        async def run():
+            try:
+                return await _run_async(call, args.requests, concurrency)
+            finally:
+                await parser.close_async_client()
+
+        latencies, elapsed, failures = asyncio.run(run())
+        first_fields.sort()
+        rows.append(summarize("stream_description_async", latencies, elapsed, concurrency, failures=failures,
+                              first_field_p50_ms=round(percentile(first_fields, 50) * 1000, 3),
+                              first_field_p95_ms=round(percentile(first_fields, 95) * 1000, 3)))
+    return rows
+
+
+def bench_packed(parser, schema, args):
+    """
+    The same items parsed with one call each and with packed calls
+    (parse_packed). Use --prompt-token-latency so the mock charges for
+    prompt evaluation, which is what packing saves.
+    """
+    system_prompt = parser.construct_prompt(schema)
+    descriptions = [f"{DESCRIPTION} #{i}" for i in range(args.requests)]
+    rows = []
+    for concurrency in args.concurrency:
+        for mode in ("single", "packed"):
+            usage = {}
+
+            def add_usage(stats):
+                for field in ('prompt_eval_count', 'eval_count'):
+                    usage[field] = usage.get(field, 0) + (stats.get(field) or 0)
+
+            async def run():
+                try:
+                    if mode == "single":
+                        async def call(i):
+                            stats = {}
+                            ok = await parser.parse_description_async(descriptions[i], system_prompt, schema, stats=stats)
+                            add_usage(stats)
+                            return ok is not None
+                        latencies, elapsed, failures = await _run_async(call, len(descriptions), concurrency)
+                        return latencies, elapsed, failures, len(descriptions)
+                    # Each item's latency is the time until its pack came back
+                    stats = {}
+                    latencies, failures = [], 0
+                    started = time.perf_counter()
+                    async for _, result in parser.iter_packed_async(descriptions, system_prompt, schema, stats=stats,
+                                                                    concurrency=concurrency):
+                        latencies.append(time.perf_counter() - started)
+                        failures += result is None
+                    add_usage(stats)
+                    return latencies, time.perf_counter() - started, failures, stats['packed_calls'] + stats['single_calls'] + stats['fallbacks']
+                finally:
+                    await parser.close_async_client()
+
+            latencies, elapsed, failures, calls = asyncio.run(run())
+            rows.append(summarize(f"parse_{mode}", latencies, elapsed, concurrency, failures=failures, model_calls=calls,
+                                  prompt_tokens_per_item=round(usage.get('prompt_eval_count', 0) / len(descriptions), 1),
+                                  output_tokens_per_sec=round(usage.get('eval_count', 0) / elapsed, 1)))
+    return rows
+
+
+def bench_api(parser, schema, args):
+    """The FastAPI /parse route in-process (ASGI transport, no sockets on our side)."""
+    import httpx
+    import api
+    from cache import ResultCache
+    rows = []
+    app = api.create_app()
+    for concurrency in args.concurrency:
+        app.state.service.cache = ResultCache(None)  # fresh per level: measure inference, not cache hits
+        async def run():
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=300) as client:
+                async def call(i):
+                    response = await client.post("/parse", json={"description": f"{DESCRIPTION} #{i}"})
+                    return response.status_code == 200
+                try:
+                    return await _run_async(call, args.requests, concurrency)
+                finally:
+                    await parser.close_async_client()
+
+        latencies, elapsed, failures = asyncio.run(run())
+        rows.append(summarize("api_parse", latencies, elapsed, concurrency, failures=failures))
+    return rows
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _memory_mb(pid):
+    """(Rss, Pss) in MB summed over a process and its children, from /proc; (None, None) elsewhere."""
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            children = f.read().split()
+        rss = pss = 0
+        for process in [pid] + children:
+            with open(f"/proc/{process}/smaps_rollup") as f:
+                for line in f:
+                    if line.startswith("Rss:"):
+                        rss += int(line.split()[1])
+                    elif line.startswith("Pss:"):
+                        pss += int(line.split()[1])
+        return round(rss / 1024, 1), round(pss / 1024, 1)
+    except OSError:
+        return None, None
+
+
+def _http_load(url, start, count, concurrency, tag):
+    """One load-generator process: `count` POST /parse calls. Returns (latencies, failures)."""
+    import httpx
+
+    async def run():
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        async with httpx.AsyncClient(base_url=url, timeout=300, limits=limits) as client:
+            async def call(i):
+                # Unique per run so the workers' result cache can't answer
+                response = await client.post("/parse", json={"description": f"{DESCRIPTION} #{tag}-{start + i}"})
+                return response.status_code == 200
+            latencies, _, failures = await _run_async(call, count, concurrency)
+            return latencies, failures
+
+    return asyncio.run(run())
+
+
+def bench_api_workers(parser, schema, args):
+    """
+    Requests/sec of `api.py --workers N` over real sockets, for each N in
+    --workers. Load comes from several client processes so the generator
+    isn't the bottleneck. server_pss_mb is the server processes' proportional
+    memory, which stays well below server_rss_mb when the preloaded schema
+    is shared.
+    """
+    import httpx
+    rows = []
+    clients = max(1, min(4, os.cpu_count() or 1))
+    for workers in args.workers:
+        port = _free_port()
+        url = f"http://127.0.0.1:{port}"
+        server = subprocess.Popen([sys.executable, "api.py", "--host", "127.0.0.1", "--port", str(port),
+                                   "--workers", str(workers)], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            deadline = time.monotonic() + API_STARTUP_TIMEOUT
+            while True:
+                try:
+                    if httpx.get(url + "/readyz", timeout=1).status_code == 200:
+                        break
+                except httpx.HTTPError:
+                    pass
+                if server.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError(f"api.py --workers {workers} did not start")
+                time.sleep(0.2)
+            for concurrency in args.concurrency:
+                tag = f"{workers}-{concurrency}-{time.time_ns()}"
+                share = [args.requests // clients + (1 if i < args.requests % clients else 0) for i in range(clients)]
+                started = time.perf_counter()
+                with ProcessPoolExecutor(max_workers=clients) as pool:
+                    futures = [pool.submit(_http_load, url, sum(share[:i]), n, max(1, concurrency // clients), tag)
+                               for i, n in enumerate(share) if n]
+                    results = [future.result() for future in futures]
+                elapsed = time.perf_counter() - started
+                rss, pss = _memory_mb(server.pid)
+                rows.append(summarize(f"api_workers_{workers}", [l for r in results for l in r[0]], elapsed,
+                                      concurrency, failures=sum(r[1] for r in results), workers=workers,
+                                      server_rss_mb=rss, server_pss_mb=pss))
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+    return rows
+
+
+BENCHMARKS = {
+    "construct_prompt": bench_construct_prompt,
+    "validate_and_normalize": bench_validate,
+    "parse_description": bench_parse_sync,
+    "parse_description_async": bench_parse_async,
+    "stream_description_async": bench_stream_async,
+    "parse_packed": bench_packed,
+    "api_parse": bench_api,
+    "api_workers": bench_api_workers,
+}
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Measures the overhead around the model using a mock Ollama server.")
+    arg_parser.add_argument('--latency', type=float, default=0.05, help="Mock model latency in seconds")
+    arg_parser.add_argument('--token-latency', type=float, default=0.0, help="Mock per-token latency in seconds")
+    arg_parser.add_argument('--prompt-token-latency', type=float, default=0.0,
+                            help="Mock per-prompt-token latency in seconds (prompt evaluation cost)")
+    arg_parser.add_argument('--requests', type=int, default=REQUESTS, help="Requests per concurrency level")
+    arg_parser.add_argument('--iterations', type=int, default=MICRO_ITERATIONS, help="Iterations for in-process micro benchmarks")
+    arg_parser.add_argument('--concurrency', default=",".join(map(str, CONCURRENCY)), help="Comma-separated levels")
+    arg_parser.add_argument('--scenarios', default=",".join(SCENARIOS), help="Comma-separated subset of: " + ", ".join(BENCHMARKS))
+    arg_parser.add_argument('--workers', default=",".join(map(str, WORKERS)),
+                            help="Comma-separated API worker counts for the api_workers scenario")
+    arg_parser.add_argument('--schema', default=SCHEMA_FILE)
+    arg_parser.add_argument('--output', default=None, help="Write JSON results here instead of stdout")
+    args = arg_parser.parse_args()
+    args.concurrency = [int(c) for c in args.concurrency.split(",") if c]
+    args.workers = [int(w) for w in args.workers.split(",") if w]
+
+    mock = MockOllamaServer(latency=args.latency, token_latency=args.token_latency,
+                            prompt_token_latency=args.prompt_token_latency).start()
+    # Point every client at the mock before parser/api read their settings
+    os.environ["OLLAMA_HOST"] = mock.url
+    os.environ.setdefault("IMAGE_PROVIDER", "none")
+    import parser
+
+    schema = parser.load_schema(args.schema)
+    results = []
+    try:
+        for name in args.scenarios.split(","):
+            results.extend(BENCHMARKS[name](parser, schema, args))
+    finally:
+        mock.stop()
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": sys.version.split()[0],
+        "mock": {"latency_s": args.latency, "token_latency_s": args.token_latency,
+                 "prompt_token_latency_s": args.prompt_token_latency, "requests_served": mock.requests,
+                 "max_in_flight": mock.max_in_flight},
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
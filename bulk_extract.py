@@ -0,0 +1,293 @@
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import parser
+import cascade as cascade_module
+from artifact import load_or_compile
+from cache import open_cache
+from classifier import load_classifier
+from dataset import build_description
+
+DATASET_FILE = 'archive/amazon-products.csv'
+OUTPUT_FILE = 'archive/extracted.jsonl'
+WORKERS = 4
+CHECKPOINT_EVERY = 5.0  # seconds
+PROGRESS_EVERY = 2.0  # seconds
+
+
+class CSVStream:
+    """
+    Streams CSV records from a binary file while tracking byte offsets.
+
+    csv.reader pulls physical lines one at a time and never reads ahead of
+    the record it returns, so after each record `offset` is exactly where the
+    next record starts. That offset is what the checkpoint stores.
+    """
+
+    def __init__(self, filepath):
+        csv.field_size_limit(sys.maxsize)
+        self.file = open(filepath, 'rb')
+        self.size = os.fstat(self.file.fileno()).st_size
+        self.offset = 0
+        self._reader = csv.reader(self._lines())
+        self.fieldnames = next(self._reader, None)
+        self.data_start = self.offset
+
+    def _lines(self):
+        while True:
+            line = self.file.readline()
+            if not line:
+                return
+            self.offset += len(line)
+            yield line.decode('utf-8', errors='ignore')
+
+    def seek(self, offset):
+        """Continues reading from a record boundary returned by `offset`."""
+        self.file.seek(offset)
+        self.offset = offset
+
+    def __iter__(self):
+        """Yields (start offset, row dict)."""
+        while True:
+            start = self.offset
+            record = next(self._reader, None)
+            if record is None:
+                return
+            yield start, dict(zip(self.fieldnames, record))
+
+    def close(self):
+        self.file.close()
+
+
+class Checkpoint:
+    """
+    Resume state, written atomically next to the output file.
+
+    Rows finish out of order, so we keep the lowest row that is not done yet
+    (`next_row`, plus its byte offset in the input) and the set of rows above
+    it that are already done. `output_size` is the length of the output file
+    when the checkpoint was taken; anything after that is truncated on resume
+    and redone, so every row appears in the output exactly once.
+    """
+
+    def __init__(self, path, input_path):
+        self.path = path
+        self.input_path = os.path.abspath(input_path)
+        self.next_row = 0
+        self.next_offset = None
+        self.done = set()
+        self.output_size = 0
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path, 'r') as f:
+            state = json.load(f)
+        if state.get('input') != self.input_path:
+            print(f"Error: checkpoint {self.path} belongs to {state.get('input')}; remove it or pick another --output.")
+            sys.exit(1)
+        self.next_row = state['next_row']
+        self.next_offset = state['next_offset']
+        self.done = set(state['done'])
+        self.output_size = state['output_size']
+        return True
+
+    def save(self):
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({
+                'input': self.input_path,
+                'next_row': self.next_row,
+                'next_offset': self.next_offset,
+                'done': sorted(self.done),
+                'output_size': self.output_size,
+            }, f)
+        os.replace(tmp, self.path)
+
+    def mark_done(self, row, offsets, stream_offset):
+        """Records a finished row and advances the low-water mark past contiguous done rows."""
+        self.done.add(row)
+        while self.next_row in self.done:
+            self.done.discard(self.next_row)
+            offsets.pop(self.next_row, None)
+            self.next_row += 1
+        # Rows not read yet start where the stream currently is
+        self.next_offset = offsets.get(self.next_row, stream_offset)
+
+
+def format_eta(seconds):
+    if seconds is None:
+        return "?"
+    seconds = int(seconds)
+    return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m{seconds % 60:02d}s"
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Resumable bulk extraction over a product CSV.")
+    arg_parser.add_argument('--input', default=DATASET_FILE, help="CSV feed to extract")
+    arg_parser.add_argument('--output', default=OUTPUT_FILE, help="JSONL file to append results to")
+    arg_parser.add_argument('--workers', type=int, default=WORKERS, help="Concurrent Ollama requests")
+    arg_parser.add_argument('--limit', type=int, default=None, help="Stop after processing this many rows in this run")
+    arg_parser.add_argument('--schema', default=parser.SCHEMA_FILE)
+    arg_parser.add_argument('--restart', action='store_true', help="Ignore any checkpoint and start over")
+    arg_parser.add_argument('--no-rules', action='store_true', help="Always ask the model, even when rules fill every field")
+    arg_parser.add_argument('--hosts', default=parser.OLLAMA_HOSTS,
+                            help="Comma-separated Ollama hosts to spread requests over (host=N caps one host)")
+    arg_parser.add_argument('--cascade', default=cascade_module.CASCADE_MODELS,
+                            help="Comma-separated models, smallest first; later ones only see answers the earlier "
+                                 "ones weren't confident about")
+    args = arg_parser.parse_args()
+
+    if not os.path.exists(args.input):
+        print(f"Error: Dataset file '{args.input}' not found.")
+        sys.exit(1)
+
+    if not os.path.exists(args.schema):
+        print(f"Error: Schema file '{args.schema}' not found.")
+        sys.exit(1)
+
+    # Prompt, matchers and rules come precompiled from the schema artifact
+    compiled = load_or_compile(args.schema)
+    schema = compiled.schema
+    system_prompt = compiled.system_prompt
+    cache = open_cache()
+    rules = None if args.no_rules else compiled.rules
+    classifier = load_classifier() if parser.CATEGORY_MODE == "classifier" else None
+    pool = parser.configure_pool(args.hosts)
+    if pool is not None:
+        print(f"Routing over {len(pool.backends)} Ollama hosts: {', '.join(b.host for b in pool.backends)}")
+    models = [m.strip() for m in (args.cascade or "").split(",") if m.strip()]
+    cascade = cascade_module.Cascade(models) if models else None
+    if cascade is not None:
+        print(f"Cascading over models: {' -> '.join(models)}")
+
+    checkpoint = Checkpoint(args.output + '.ckpt', args.input)
+    stream = CSVStream(args.input)
+    if not args.restart and checkpoint.load():
+        # Drop output written after the last checkpoint; those rows get redone
+        with open(args.output, 'ab') as f:
+            f.truncate(checkpoint.output_size)
+        stream.seek(checkpoint.next_offset)
+        print(f"Resuming at row {checkpoint.next_row} ({len(checkpoint.done)} later rows already done)")
+    else:
+        open(args.output, 'w').close()
+        checkpoint.next_offset = stream.data_start
+
+    out = open(args.output, 'ab')
+    offsets = {}  # row -> byte offset of its record, for rows below the low-water mark window
+    in_flight = {}
+    completed = 0
+    errors = 0
+    taken = 0  # rows this run has picked up, for --limit
+    started = time.time()
+    start_offset = stream.offset
+    last_checkpoint = last_progress = started
+
+    def parse_row(description):
+        if cascade is not None:
+            return cascade.parse(description, system_prompt, schema, cache=cache, rules=rules, classifier=classifier)
+        return parser.parse_description(description, system_prompt, schema, cache=cache, rules=rules, classifier=classifier)
+
+    def record(row, line):
+        nonlocal completed, errors
+        out.write((json.dumps(line) + "\n").encode('utf-8'))
+        completed += 1
+        if 'error' in line:
+            errors += 1
+        checkpoint.mark_done(row, offsets, stream.offset)
+
+    def save_checkpoint():
+        out.flush()
+        checkpoint.output_size = out.tell()
+        checkpoint.save()
+
+    def collect(futures):
+        for future in futures:
+            row, asin = in_flight.pop(future)
+            result = future.result()
+            line = {'row': row, 'asin': asin}
+            if result:
+                line['result'] = result
+            else:
+                line['error'] = "Failed to parse description"
+            record(row, line)
+
+    def report(final=False):
+        elapsed = max(time.time() - started, 1e-9)
+        rate = completed / elapsed
+        byte_rate = (stream.offset - start_offset) / elapsed
+        eta = (stream.size - stream.offset) / byte_rate if byte_rate > 0 else None
+        pct = stream.offset / stream.size * 100 if stream.size else 100.0
+        label = "Done" if final else "Progress"
+        print(f"{label}: {completed} rows ({errors} failed), {rate:.2f} rows/sec, {pct:.1f}% of input, ETA {format_eta(0 if final else eta)}")
+
+    executor = ThreadPoolExecutor(max_workers=args.workers)
+    row = checkpoint.next_row - 1
+    try:
+        save_checkpoint()
+        for offset, data in stream:
+            row += 1
+            offsets[row] = offset
+            if row in checkpoint.done:
+                continue
+            if args.limit is not None and taken >= args.limit:
+                break
+            taken += 1
+
+            description = build_description(data)
+            if not description:
+                record(row, {'row': row, 'asin': data.get('asin'), 'error': "Empty description"})
+                continue
+
+            # Keep a bounded backlog so memory does not grow with the file
+            while len(in_flight) >= args.workers * 2:
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(finished)
+            in_flight[executor.submit(parse_row, description)] = (row, data.get('asin'))
+
+            now = time.time()
+            if now - last_progress >= PROGRESS_EVERY:
+                report()
+                last_progress = now
+            if now - last_checkpoint >= CHECKPOINT_EVERY:
+                save_checkpoint()
+                last_checkpoint = now
+
+        collect(wait(in_flight).done)
+        save_checkpoint()
+        report(final=True)
+    except KeyboardInterrupt:
+        print(f"\nInterrupted; finishing {len(in_flight)} in-flight rows before saving checkpoint (Ctrl-C again to skip)...")
+        for future in in_flight:
+            future.cancel()
+        try:
+            collect([f for f in wait(in_flight).done if not f.cancelled()])
+        except KeyboardInterrupt:
+            pass
+        # Rows that did not finish stay below the low-water mark and are redone on resume
+        in_flight.clear()
+        save_checkpoint()
+        report()
+        print(f"Checkpoint saved to {checkpoint.path}; run the same command again to resume.")
+    finally:
+        executor.shutdown(wait=False)
+        out.close()
+        stream.close()
+        print(f"Cache: {cache.stats()}")
+        print(f"Coalesced: {parser.coalescing_stats()}")
+        if rules is not None:
+            print(f"Rules: {rules.stats()}")
+        if pool is not None:
+            print(f"Hosts: {pool.stats()}")
+        if cascade is not None:
+            print(f"Cascade: {cascade.stats()}")
+        cache.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+CACHE_FILE = ".parse_cache.sqlite"
+MEMORY_ITEMS = 2048
+DISK_ITEMS = 200000
+TTL_SECONDS = 30 * 24 * 3600
+
+
+# id(schema) -> (schema, fingerprint)
+_FINGERPRINTS = {}
+
+
+def schema_fingerprint(schema):
+    """Stable hash of a schema, computed once per schema object."""
+    entry = _FINGERPRINTS.get(id(schema))
+    if entry is None or entry[0] is not schema:
+        digest = hashlib.sha256(json.dumps(schema, sort_keys=True).encode('utf-8')).hexdigest()
+        entry = (schema, digest)
+        _FINGERPRINTS[id(schema)] = entry
+    return entry[1]
+
+
+def forget_fingerprint(schema):
+    """Drops a schema's memoized fingerprint, e.g. once a newer schema version has replaced it."""
+    entry = _FINGERPRINTS.get(id(schema))
+    if entry is not None and entry[0] is schema:
+        _FINGERPRINTS.pop(id(schema), None)
+
+
+def normalize_description(description):
+    """Collapses whitespace so trivially different copies share a cache entry."""
+    return " ".join(str(description).split())
+
+
+def make_key(model, system_prompt, description, schema, options=None):
+    """Cache key over everything that can change the model's answer."""
+    h = hashlib.sha256()
+    for part in (
+        model,
+        hashlib.sha256(system_prompt.encode('utf-8')).hexdigest(),
+        schema_fingerprint(schema),
+        json.dumps(options or {}, sort_keys=True),
+        normalize_description(description),
+    ):
+        h.update(part.encode('utf-8'))
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+class ResultCache:
+    """
+    Two-tier cache of raw model output (the JSON string Ollama returned).
+
+    The in-memory tier is an LRU of `memory_items` entries. The disk tier is a
+    SQLite table capped at `disk_items` rows and `ttl` seconds. Pass
+    `path=None` for a memory-only cache. Keys come from `make_key`, so a new
+    model, prompt or schema simply stops hitting old entries, and those
+    entries age out through the TTL and size limits.
+
+    SQLite calls block, so code on an event loop uses `get_async` and
+    `put(..., background=True)`: a memory hit is still answered inline,
+    while disk reads run in a thread and disk writes on one background
+    writer thread. Memory and disk have separate locks, so a memory lookup
+    never waits behind a disk write.
+    """
+
+    def __init__(self, path=CACHE_FILE, memory_items=MEMORY_ITEMS, disk_items=DISK_ITEMS, ttl=TTL_SECONDS):
+        self.path = path
+        self.memory_items = memory_items
+        self.disk_items = disk_items
+        self.ttl = ttl
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()  # memory tier and counters
+        self._db_lock = threading.Lock()
+        self._db = None
+        self._writer = None  # background disk writes, started on first use
+        self._puts_since_evict = 0
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                " key TEXT PRIMARY KEY,"
+                " content TEXT NOT NULL,"
+                " created REAL NOT NULL,"
+                " accessed REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results(accessed)")
+            self._db.commit()
+            self._evict_disk()
+
+    def get(self, key):
+        """Returns the cached content string, or None on a miss."""
+        now = time.time()
+        content = self._from_memory(key, now)
+        return content if content is not None else self._from_disk(key, now)
+
+    async def get_async(self, key):
+        """get for code on an event loop: the disk lookup, if any, runs in a thread."""
+        now = time.time()
+        content = self._from_memory(key, now)
+        if content is not None:
+            return content
+        if self._db is None:
+            return self._from_disk(key, now)  # nothing to read, just counts the miss
+        return await asyncio.to_thread(self._from_disk, key, now)
+
+    def _from_memory(self, key, now):
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None or now - entry[1] >= self.ttl:
+                return None
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def _from_disk(self, key, now):
+        """The disk tier's entry (copied into memory) or None; counts the lookup either way."""
+        row = None
+        with self._db_lock:
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT content, created FROM results WHERE key = ?", (key,)
+                ).fetchone()
+                if row and now - row[1] < self.ttl:
+                    self._db.execute("UPDATE results SET accessed = ? WHERE key = ?", (now, key))
+                    self._db.commit()
+                else:
+                    row = None
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self._remember(key, row[0], row[1])
+            self.hits += 1
+            self.disk_hits += 1
+            return row[0]
+
+    def put(self, key, content, background=False):
+        """
+        Stores content in both tiers. With `background`, the disk write is
+        left to the writer thread and this returns once memory has it.
+        """
+        now = time.time()
+        with self._lock:
+            self._remember(key, content, now)
+            if self._db is None:
+                return
+            if background and self._writer is None:
+                self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cache-writer")
+            writer = self._writer
+        if background:
+            writer.submit(self._write_logged, key, content, now)
+        else:
+            self._write(key, content, now)
+
+    def _write(self, key, content, now):
+        with self._db_lock:
+            if self._db is None:
+                return
+            self._db.execute(
+                "INSERT OR REPLACE INTO results (key, content, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, content, now, now),
+            )
+            self._db.commit()
+            self._puts_since_evict += 1
+            if self._puts_since_evict >= 100:
+                self._evict_disk()
+
+    def _write_logged(self, key, content, now):
+        # Nobody waits on a background write, so its errors would otherwise vanish
+        try:
+            self._write(key, content, now)
+        except sqlite3.Error as e:
+            print(f"Warning: could not write result cache entry ({e}); it stays in memory only.")
+
+    def _remember(self, key, content, created):
+        self._memory[key] = (content, created)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def _evict_disk(self):
+        """Drops expired rows, then the least recently used rows over the cap."""
+        self._puts_since_evict = 0
+        self._db.execute("DELETE FROM results WHERE created < ?", (time.time() - self.ttl,))
+        self._db.execute(
+            "DELETE FROM results WHERE key IN ("
+            " SELECT key FROM results ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+            (self.disk_items,),
+        )
+        self._db.commit()
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        with self._db_lock:
+            if self._db is not None:
+                self._db.execute("DELETE FROM results")
+                self._db.commit()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "memory_items": len(self._memory),
+        }
+
+    def close(self):
+        """Waits for background writes, then closes the disk tier."""
+        if self._writer is not None:
+            self._writer.shutdown(wait=True)
+            self._writer = None
+        with self._db_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+def open_cache(path=CACHE_FILE):
+    """Opens the default cache, falling back to memory-only if the file is unusable."""
+    try:
+        return ResultCache(path)
+    except sqlite3.Error as e:
+        print(f"Warning: could not open result cache '{path}' ({e}); using memory only.")
+        return ResultCache(None)
@@ -0,0 +1,192 @@
+import os
+import threading
+import time
+from collections import Counter, deque
+
+import parser
+from matcher import get_matcher
+from metrics import CASCADE_ESCALATIONS, CASCADE_TIER_SECONDS
+from rules import required_fields
+
+
+# Models from smallest to largest, e.g. "qwen2.5:1.5b,mistral" (unset = no cascade)
+CASCADE_MODELS = os.environ.get("CASCADE_MODELS")
+# An answer escalates when the mean match score of its enum values is below this...
+MIN_CONFIDENCE = float(os.environ.get("CASCADE_MIN_CONFIDENCE", "0.85"))
+# ...or an enum value only fuzzy-matched below this (an exact hit scores 1.0)...
+MIN_ENUM_SCORE = float(os.environ.get("CASCADE_MIN_ENUM_SCORE", "0.8"))
+# ...or more than this many required fields (rules.required_fields) are empty
+MAX_EMPTY_REQUIRED = int(os.environ.get("CASCADE_MAX_EMPTY_REQUIRED", "1"))
+LATENCY_WINDOW = 1000  # recent calls kept per tier for percentiles
+
+
+def _empty(value):
+    return value is None or value == "" or value == []
+
+
+class Cascade:
+    """
+    Runs the cheapest model first and only escalates answers it doesn't trust.
+
+    Each tier's answer is scored from signals that cost nothing extra: whether
+    the output was valid JSON or needed repair, how well enum values matched
+    the schema (exact hit, fuzzy score, or no match), and how many required
+    fields came back empty. Confidence is the mean score of the enum values
+    only; free-text fields have nothing to score against. A value of an
+    open enum (brand, color...) that matches nothing may just be new, so it
+    is left out of the mean rather than counted against the answer. A
+    constrained enum (category) that matches nothing is always weak. Required
+    fields are the same ones that let rules skip the model
+    (rules.required_fields). An answer that passes every threshold is
+    returned; otherwise the next model gets the description. The last model's
+    answer is always accepted. Per-tier calls, escalation rate, reasons and
+    latency percentiles are kept in `stats()`.
+    """
+
+    def __init__(self, models, min_confidence=MIN_CONFIDENCE, min_enum_score=MIN_ENUM_SCORE,
+                 max_empty_required=MAX_EMPTY_REQUIRED):
+        if not models:
+            raise ValueError("Cascade needs at least one model")
+        self.models = list(models)
+        self.min_confidence = min_confidence
+        self.min_enum_score = min_enum_score
+        self.max_empty_required = max_empty_required
+        self._lock = threading.Lock()
+        self._tiers = {model: {"calls": 0, "accepted": 0, "escalated": 0, "reasons": Counter(),
+                               "latencies": deque(maxlen=LATENCY_WINDOW)} for model in self.models}
+
+    @classmethod
+    def from_env(cls):
+        """The cascade configured by CASCADE_MODELS, or None."""
+        models = [m.strip() for m in (CASCADE_MODELS or "").split(",") if m.strip()]
+        return cls(models) if models else None
+
+    def assess(self, raw, schema, repaired=False, fields=None):
+        """
+        (confidence 0..1, reasons to escalate) for one answer's
+        pre-normalization output. An answer with no enum values to score
+        has confidence 1.0 and is judged on the other signals.
+        """
+        if not isinstance(raw, dict):
+            return 0.0, ["invalid_json"]
+        reasons = ["repaired_json"] if repaired else []
+        matcher = get_matcher(schema)
+        scores = []
+        weak_enum = False
+        for key, value in raw.items():
+            if key not in matcher.fields or _empty(value):
+                continue
+            constrained = key in parser.CONSTRAINED_ENUMS
+            for item in value if isinstance(value, list) else [value]:
+                matched, score = matcher.match(key, str(item))
+                if score and matched.lower() == str(item).strip().lower():
+                    score = 1.0  # the matcher lowercases its input, so "Acme" is only a fuzzy hit for "Acme"
+                if score == 0.0 and not constrained:
+                    continue  # an open enum's new value: no evidence either way
+                if score < self.min_enum_score:
+                    weak_enum = True
+                scores.append(score)
+        if weak_enum:
+            reasons.append("weak_enum")
+        required = [key for key in required_fields(schema) if fields is None or key in fields]
+        if sum(1 for key in required if _empty(raw.get(key))) > self.max_empty_required:
+            reasons.append("empty_required")
+        confidence = sum(scores) / len(scores) if scores else 1.0
+        if repaired:
+            confidence *= 0.5
+        if confidence < self.min_confidence:
+            reasons.append("low_confidence")
+        return confidence, reasons
+
+    def _judge(self, tier, result, tier_stats, schema, seconds, fields=None):
+        """Whether to keep this tier's answer; records the tier's stats."""
+        model = self.models[tier]
+        confidence, reasons = None, []
+        if result is None:
+            reasons = ["failed"]
+        elif not tier_stats.get('short_circuit'):
+            confidence, reasons = self.assess(tier_stats.get('raw_output'), schema, tier_stats.get('repaired', False),
+                                              fields)
+        last = tier == len(self.models) - 1
+        accepted = not reasons or (last and result is not None)
+        CASCADE_TIER_SECONDS.observe(seconds, model=model)
+        with self._lock:
+            entry = self._tiers[model]
+            entry["calls"] += 1
+            entry["latencies"].append(seconds)
+            if accepted:
+                entry["accepted"] += 1
+            elif not last:
+                entry["escalated"] += 1
+                entry["reasons"].update(reasons)
+        if not accepted and not last:
+            for reason in reasons:
+                CASCADE_ESCALATIONS.inc(model=model, reason=reason)
+        tier_stats['confidence'] = confidence
+        return accepted
+
+    def _finish(self, stats, tier, tier_stats, history):
+        if stats is None:
+            return
+        stats.update(tier_stats)
+        stats['model'] = self.models[tier]
+        stats['tiers'] = history
+        if tier:
+            # Time spent on the answers that were thrown away
+            escalated = sum(entry["seconds"] for entry in history[:-1])
+            stats.setdefault('timings', {})['escalation'] = escalated
+
+    def parse(self, description, system_prompt, schema, cache=None, stats=None, rules=None, classifier=None,
+              fields=None):
+        """parse_description through the cascade. `stats` gets the answering tier's stats plus 'model' and 'tiers'."""
+        history = []
+        for tier, model in enumerate(self.models):
+            tier_stats = {}
+            started = time.perf_counter()
+            result = parser.parse_description(description, system_prompt, schema, cache, tier_stats, rules, classifier,
+                                              model=model, fields=fields)
+            seconds = time.perf_counter() - started
+            accepted = self._judge(tier, result, tier_stats, schema, seconds, fields)
+            history.append({"model": model, "confidence": tier_stats['confidence'], "accepted": accepted,
+                            "seconds": seconds})
+            if accepted:
+                self._finish(stats, tier, tier_stats, history)
+                return result
+        return None
+
+    async def parse_async(self, description, system_prompt, schema, cache=None, stats=None, rules=None,
+                          classifier=None, fields=None):
+        history = []
+        for tier, model in enumerate(self.models):
+            tier_stats = {}
+            started = time.perf_counter()
+            result = await parser.parse_description_async(description, system_prompt, schema, cache, tier_stats, rules,
+                                                          classifier, model=model, fields=fields)
+            seconds = time.perf_counter() - started
+            accepted = self._judge(tier, result, tier_stats, schema, seconds, fields)
+            history.append({"model": model, "confidence": tier_stats['confidence'], "accepted": accepted,
+                            "seconds": seconds})
+            if accepted:
+                self._finish(stats, tier, tier_stats, history)
+                return result
+        return None
+
+    def stats(self):
+        tiers = []
+        with self._lock:
+            for model in self.models:
+                entry = self._tiers[model]
+                latencies = sorted(entry["latencies"])
+                tiers.append({
+                    "model": model,
+                    "calls": entry["calls"],
+                    "accepted": entry["accepted"],
+                    "escalated": entry["escalated"],
+                    "escalation_rate": round(entry["escalated"] / entry["calls"], 4) if entry["calls"] else 0.0,
+                    "reasons": dict(entry["reasons"]),
+                    "p50_ms": round(latencies[len(latencies) // 2] * 1000, 1) if latencies else None,
+                    "p95_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000, 1)
+                    if latencies else None,
+                })
+        return {"models": self.models, "min_confidence": self.min_confidence, "min_enum_score": self.min_enum_score,
+                "max_empty_required": self.max_empty_required, "tiers": tiers}
@@ -0,0 +1,205 @@
+import json
+import math
+import os
+import re
+import zlib
+from collections import Counter, defaultdict
+
+
+CLASSIFIER_FILE = "classifier.json"
+FORMAT_VERSION = 1
+# Hashed feature space for word unigrams and bigrams
+N_FEATURES = 2 ** 18
+# Centroid weights kept per class; the rest are pruned to keep the model small and fast
+TOP_FEATURES = {"category": 4000, "subcategory": 300}
+# Feature sums kept per class while training (a multiple of the above); bounds trainer memory
+TRAIN_FEATURES = {field: 8 * top_n for field, top_n in TOP_FEATURES.items()}
+# Only the start of a description is used, the same budget the parser sends
+MAX_TEXT = 1000
+TOKEN = re.compile(r'[a-z0-9]+')
+
+
+def features(text):
+    """Hashed unigram + bigram counts of the (truncated, lowercased) text."""
+    words = TOKEN.findall(text[:MAX_TEXT].lower())
+    mask = N_FEATURES - 1
+    counts = Counter(zlib.crc32(w.encode()) & mask for w in words)
+    counts.update(zlib.crc32(f"{a} {b}".encode()) & mask for a, b in zip(words, words[1:]))
+    return counts
+
+
+def _unit(weights):
+    norm = math.sqrt(sum(w * w for w in weights.values()))
+    return {f: w / norm for f, w in weights.items()} if norm else {}
+
+
+def _tf(counts):
+    """Sublinear, L2-normalized term frequencies."""
+    return _unit({f: 1.0 + math.log(c) for f, c in counts.items()})
+
+
+class CentroidTrainer:
+    """
+    Accumulates a hashed TF-IDF nearest-centroid model in one pass.
+
+    Each document adds its normalized term frequencies to its class sums
+    and its features to the document frequencies. IDF is applied when the
+    model is built, so no second pass over the data is needed. Trainers
+    from separate byte ranges merge by addition. A class keeps at most
+    2 x TRAIN_FEATURES sums: past that, all but its TRAIN_FEATURES largest
+    are dropped, so memory depends on the number of classes, not rows.
+    The model only keeps the TOP_FEATURES best per class, well inside that.
+    """
+
+    def __init__(self):
+        self.docs = 0
+        self.df = Counter()
+        self.sums = {field: defaultdict(Counter) for field in TOP_FEATURES}
+        self.class_docs = {field: Counter() for field in TOP_FEATURES}
+        self.parents = defaultdict(Counter)  # subcategory -> category counts
+
+    def add(self, text, category, subcategory=None):
+        if not category or not text:
+            return
+        counts = features(text)
+        if not counts:
+            return
+        tf = _tf(counts)
+        self.docs += 1
+        self.df.update(counts.keys())
+        for field, label in (("category", category), ("subcategory", subcategory)):
+            if label:
+                self._add_sums(field, label, tf)
+                self.class_docs[field][label] += 1
+        if subcategory:
+            self.parents[subcategory][category] += 1
+
+    def _add_sums(self, field, label, weights):
+        sums = self.sums[field][label]
+        sums.update(weights)
+        keep = TRAIN_FEATURES[field]
+        if len(sums) > 2 * keep:
+            self.sums[field][label] = Counter(dict(sums.most_common(keep)))
+
+    def merge(self, other):
+        self.docs += other.docs
+        self.df.update(other.df)
+        for field in TOP_FEATURES:
+            for label, sums in other.sums[field].items():
+                self._add_sums(field, label, sums)
+            self.class_docs[field].update(other.class_docs[field])
+        for subcategory, parents in other.parents.items():
+            self.parents[subcategory].update(parents)
+        return self
+
+    def build(self, labels=None):
+        """
+        The trained CentroidClassifier. `labels` optionally restricts each
+        field to the given values (e.g. the ones that made it into the schema).
+        """
+        idf = {f: math.log((1 + self.docs) / (1 + n)) + 1.0 for f, n in self.df.items()}
+        used = set()
+        fields = {}
+        for field, top_n in TOP_FEATURES.items():
+            allowed = set(labels[field]) if labels and field in labels else None
+            names = sorted(label for label in self.sums[field] if allowed is None or label in allowed)
+            index = defaultdict(list)
+            for i, label in enumerate(names):
+                n = self.class_docs[field][label]
+                centroid = {f: s / n * idf[f] for f, s in self.sums[field][label].items()}
+                top = sorted(centroid.items(), key=lambda item: -item[1])[:top_n]
+                for f, w in _unit(dict(top)).items():
+                    index[f].append((i, w))
+                    used.add(f)
+            fields[field] = (names, dict(index))
+        parents = {sub: counts.most_common(1)[0][0] for sub, counts in self.parents.items()}
+        return CentroidClassifier({f: idf[f] for f in used}, fields, parents)
+
+
+class CentroidClassifier:
+    """
+    Predicts category and subcategory by cosine similarity to class centroids.
+
+    Centroids are stored as an inverted index (feature -> [(class, weight)]),
+    so a prediction only touches the classes that share a feature with the
+    text; it takes well under a millisecond on CPU.
+    """
+
+    def __init__(self, idf, fields, parents=None):
+        self.idf = idf
+        self.fields = fields  # field -> (labels, {feature: [(label index, weight)]})
+        self.parents = parents or {}
+
+    def vector(self, text):
+        counts = features(text)
+        return _unit({f: (1.0 + math.log(c)) * self.idf[f] for f, c in counts.items() if f in self.idf})
+
+    def scores(self, field, vector):
+        """{label: cosine similarity} for every class sharing a feature with the vector."""
+        labels, index = self.fields[field]
+        totals = defaultdict(float)
+        for f, w in vector.items():
+            for i, cw in index.get(f, ()):
+                totals[i] += w * cw
+        return {labels[i]: score for i, score in totals.items()}
+
+    def predict(self, text):
+        """{'category': ..., 'subcategory': ...} for the fields it has an opinion on."""
+        vector = self.vector(text)
+        if not vector:
+            return {}
+        result = {}
+        categories = self.scores("category", vector) if "category" in self.fields else {}
+        if categories:
+            result["category"] = max(categories.items(), key=lambda item: (item[1], item[0]))[0]
+        subcategories = self.scores("subcategory", vector) if "subcategory" in self.fields else {}
+        if subcategories:
+            # Prefer a subcategory that belongs to the predicted category
+            category = result.get("category")
+            consistent = {s: v for s, v in subcategories.items() if self.parents.get(s) == category}
+            result["subcategory"] = max((consistent or subcategories).items(), key=lambda item: (item[1], item[0]))[0]
+        return result
+
+    def save(self, filepath):
+        data = {
+            "version": FORMAT_VERSION,
+            "n_features": N_FEATURES,
+            "idf": {str(f): round(w, 5) for f, w in self.idf.items()},
+            "fields": {
+                field: {
+                    "labels": labels,
+                    "index": {str(f): [[i, round(w, 5)] for i, w in postings] for f, postings in index.items()},
+                }
+                for field, (labels, index) in self.fields.items()
+            },
+            "parents": self.parents,
+        }
+        tmp = filepath + ".tmp"
+        with open(tmp, 'w') as f:
+            json.dump(data, f, separators=(',', ':'))
+        os.replace(tmp, filepath)
+
+    @classmethod
+    def load(cls, filepath):
+        with open(filepath, 'r') as f:
+            data = json.load(f)
+        if data.get("version") != FORMAT_VERSION or data.get("n_features") != N_FEATURES:
+            raise ValueError(f"{filepath} was built by an incompatible version; rerun generate_schema.py --train-classifier")
+        idf = {int(f): w for f, w in data["idf"].items()}
+        fields = {
+            field: (spec["labels"], {int(f): [tuple(p) for p in postings] for f, postings in spec["index"].items()})
+            for field, spec in data["fields"].items()
+        }
+        return cls(idf, fields, data.get("parents"))
+
+
+def load_classifier(filepath=CLASSIFIER_FILE):
+    """The saved classifier, or None (with a warning) if it is missing or unreadable."""
+    if not os.path.exists(filepath):
+        print(f"Warning: classifier '{filepath}' not found; run generate_schema.py --train-classifier to train it.")
+        return None
+    try:
+        return CentroidClassifier.load(filepath)
+    except (ValueError, KeyError) as e:
+        print(f"Warning: could not load classifier '{filepath}': {e}")
+        return None
@@ -0,0 +1,12 @@
+DESCRIPTION_MAX_CHARS = 1000
+
+
+def build_description(row):
+    """Builds the parser input for a dataset row."""
+    # Amazon has title, description, features
+    description = (row.get('title') or '') + " " + (row.get('description') or '')
+    description = description.strip()
+    # Truncate if too long to save context window and time
+    if len(description) > DESCRIPTION_MAX_CHARS:
+        description = description[:DESCRIPTION_MAX_CHARS] + "..."
+    return description
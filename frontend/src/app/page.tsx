@@ -18,6 +18,7 @@ type Product = {
   brand?: string;
   features?: string[];
   image_url?: string;
+  image_status?: string;
 };
 
 export default function Home() {
@@ -28,25 +29,69 @@ export default function Home() {
 
 
 
+  // The image lookup finishes after /parse returns; long-poll for it
+  const loadImage = async (product: Product) => {
+    try {
+      const params = new URLSearchParams({ product_name: product.product_name!, wait: "10" });
+      const response = await fetch(`http://localhost:8000/image?${params}`);
+      if (!response.ok) return;
+      const image = await response.json();
+      if (image.image_url) {
+        setProducts([{ ...product, image_url: image.image_url }]);
+      }
+    } catch {
+      // Image is optional
+    }
+  };
+
+  // Fields arrive over server-sent events as the model produces them
   const handleParse = async () => {
     if (!description.trim()) return;
     setLoading(true);
     setError("");
+    setProducts([{}]);
 
     try {
-      const response = await fetch("http://localhost:8000/parse", {
+      const response = await fetch("http://localhost:8000/parse/stream", {
         method: "POST",
         headers: { "Content-Type": "application/json" },
         body: JSON.stringify({ description }),
       });
 
-      if (!response.ok) {
+      if (!response.ok || !response.body) {
         throw new Error("Failed to parse description");
       }
 
-      const data = await response.json();
-      setProducts([data]);
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = "";
+      let partial: Product = {};
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const events = buffer.split("\n\n");
+        buffer = events.pop() ?? "";
+        for (const raw of events) {
+          const event = raw.match(/^event: (.*)$/m)?.[1];
+          const data = raw.match(/^data: (.*)$/m)?.[1];
+          if (!event || !data) continue;
+          const payload = JSON.parse(data);
+          if (event === "field") {
+            partial = { ...partial, [payload.field]: payload.value };
+            setProducts([partial]);
+          } else if (event === "result") {
+            setProducts([payload]);
+            if (payload.image_status === "pending" && payload.product_name) {
+              loadImage(payload);
+            }
+          } else if (event === "error") {
+            throw new Error(payload.detail || "Failed to parse description");
+          }
+        }
+      }
     } catch (err: any) {
+      setProducts([]);
       setError(err.message || "Something went wrong");
     } finally {
       setLoading(false);
@@ -1,30 +1,149 @@
+import argparse
 import csv
+import hashlib
 import json
+import pickle
 import re
 import os
 import sys
 import ast
 from collections import Counter
+from multiprocessing import Pool
+
+from classifier import CLASSIFIER_FILE, CentroidTrainer
+from sketch import SpaceSaving
+from token_matcher import SEPARATORS, TokenMatcher
 
 # File paths
 AMAZON_CSV = 'archive/amazon-products.csv'
 OUTPUT_SCHEMA = 'schema.json'
 
-def load_csv_data(filepath):
-    """Loads CSV data into a list of dictionaries."""
-    data = []
-    if not os.path.exists(filepath):
-        print(f"Warning: {filepath} not found.")
-        return data
-    
-    # Increase field size limit for large descriptions
+# Parallel mode reads the file in this many byte-range chunks per worker
+CHUNKS_PER_WORKER = 4
+BLOCK_SIZE = 4 * 1024 * 1024
+
+# Values tracked per open-ended property (subcategory, brand, color); 10x the
+# 999 kept in the schema, so the top lists are exact unless the tail is huge
+SKETCH_SIZE = 10000
+# Counter state for incremental runs (see SchemaState)
+STATE_SUFFIX = ".state"
+STATE_FORMAT = 1
+# Leading bytes hashed to tell an appended-to input from a replaced one
+FINGERPRINT_BYTES = 64 * 1024
+
+# Extensive list of valid known colors and modifiers
+VALID_COLOR_TOKENS = {
+    'beige', 'black', 'blue', 'brown', 'burgundy', 'camel', 'charcoal', 'cobalt', 'copper', 
+    'coral', 'cream', 'crimson', 'cyan', 'dark', 'gold', 'gray', 'green', 'grey', 'indigo', 
+    'ivory', 'khaki', 'lavender', 'light', 'lilac', 'magenta', 'maroon', 'matte', 'metallic', 
+    'mint', 'multicolor', 'mustard', 'navy', 'nude', 'olive', 'orange', 'peach', 'pink', 
+    'plum', 'purple', 'red', 'rose', 'royal', 'ruby', 'rust', 'sage', 'salmon', 'sand', 
+    'silver', 'sky', 'tan', 'taupe', 'teal', 'turquoise', 'violet', 'white', 'yellow', 
+    'amber', 'aqua', 'azure', 'bronze', 'chocolate', 'coffee', 'emerald', 'fuchsia', 
+    'garnet', 'hazel', 'jade', 'lime', 'mocha', 'pearl', 'platinum', 'sapphire', 'scarlet', 
+    'sienna', 'slate', 'smoke', 'steel', 'titanium', 'topaz', 'vanilla', 'zinc', 'champagne',
+    'clear', 'crystal', 'transparent'
+}
+
+# Exclude misleading tokens that might look like colors or are common garbage
+COLOR_STOP_WORDS = {'large', 'medium', 'small', 'size', 'pack', 'set', 'pair', 'x-large', 
+                    'xx-large', 'small/medium', 'large/x-large', 'mens', 'womens', 'kids', 
+                    'baby', 'toddler', 'in', 'oz', 'lb', 'kg', 'ml', 'bluetooth', 'wifi', 
+                    'usb', 'battery', 'power', 'kit', 'replacement', 'compatible'}
+
+KNOWN_MATERIALS = [
+    'cotton', 'polyester', 'wool', 'leather', 'silk', 'nylon', 'spandex', 
+    'denim', 'linen', 'viscose', 'rayon', 'acrylic', 'cashmere', 'suede',
+    'metal', 'plastic', 'wood', 'glass', 'ceramic', 'rubber', 'latex', 'silicone',
+    'canvas', 'chiffon', 'velvet', 'fleece', 'jersey', 'lace', 'satin', 'bamboo'
+]
+
+def read_header(filepath):
+    """Returns (fieldnames, byte offset of the first data record)."""
     csv.field_size_limit(sys.maxsize)
-    
-    with open(filepath, 'r', encoding='utf-8', errors='ignore') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            data.append(row)
-    return data
+    with open(filepath, 'rb') as f:
+        reader = csv.reader(_decoded_lines(f, 0, None))
+        fieldnames = next(reader, None)
+        return fieldnames, f.tell()
+
+def _decoded_lines(f, start, end):
+    """Physical lines of a binary file from `start` up to (not past) `end`."""
+    f.seek(start)
+    offset = start
+    while end is None or offset < end:
+        line = f.readline()
+        if not line:
+            return
+        offset += len(line)
+        yield line.decode('utf-8', errors='ignore')
+
+def iter_csv_rows(filepath, start=None, end=None, fieldnames=None):
+    """
+    Streams rows as dicts, optionally only the records in [start, end).
+    Offsets must be record boundaries (see find_chunk_boundaries).
+    """
+    csv.field_size_limit(sys.maxsize)
+    if fieldnames is None or start is None:
+        fieldnames, data_start = read_header(filepath)
+        if start is None:
+            start = data_start
+    if not fieldnames:
+        return
+
+    with open(filepath, 'rb') as f:
+        for record in csv.reader(_decoded_lines(f, start, end)):
+            yield dict(zip(fieldnames, record))
+
+def find_chunk_boundaries(filepath, data_start, num_chunks, end=None):
+    """
+    Splits the data section of a CSV (up to `end`, default EOF) into byte
+    ranges that start on record boundaries.
+
+    Quoted fields may contain newlines, so a newline only ends a record when
+    the number of quote characters before it is even. This is one sequential
+    pass that only counts bytes, which is much cheaper than parsing.
+    """
+    size = os.path.getsize(filepath) if end is None else end
+    targets = [data_start + (size - data_start) * i // num_chunks for i in range(1, num_chunks)]
+    boundaries = [data_start]
+
+    with open(filepath, 'rb') as f:
+        f.seek(data_start)
+        pos = data_start
+        odd = False  # quote parity before `pos`
+        while targets:
+            block = f.read(BLOCK_SIZE)
+            if not block:
+                break
+            block_end = pos + len(block)
+            i = 0
+            while targets and targets[0] < block_end:
+                # Advance parity to the target (or where we already are), then look for a newline outside quotes
+                j = max(targets[0] - pos, i)
+                odd ^= bool(block.count(b'"', i, j) & 1)
+                i = j
+                found = False
+                while True:
+                    nl = block.find(b'\n', i)
+                    if nl < 0:
+                        break
+                    odd ^= bool(block.count(b'"', i, nl) & 1)
+                    i = nl + 1
+                    if not odd:
+                        found = True
+                        break
+                if not found:
+                    break  # keep looking in the next block
+                boundary = pos + i
+                if boundary > boundaries[-1] and boundary < size:
+                    boundaries.append(boundary)
+                while targets and targets[0] <= boundary:
+                    targets.pop(0)
+            odd ^= bool(block.count(b'"', i) & 1)
+            pos = block_end
+
+    boundaries.append(size)
+    return list(zip(boundaries[:-1], boundaries[1:]))
 
 def parse_json_field(field_text):
     """Parses a text field that might contain JSON or python literals."""
@@ -40,155 +159,381 @@ def parse_json_field(field_text):
         except:
              return None
 
-def extract_categories_and_subcategories(data_list, min_count=5):
-    """Extracts top and leaf categories."""
-    categories = []
-    subcategories = []
+def row_categories(row):
+    """Returns (top level category, leaf subcategory) for a row; either may be None."""
+    parsed = parse_json_field(row.get('categories'))
     
-    for row in data_list:
-        cat_raw = row.get('categories')
-        parsed = parse_json_field(cat_raw)
-        
-        if parsed and isinstance(parsed, list) and len(parsed) > 0:
-            # Top level
-            if parsed[0]:
-                categories.append(parsed[0].strip().lower())
-            # Leaf (Subcategory)
-            if len(parsed) > 1:
-                subcategories.append(parsed[-1].strip().lower())
-        elif row.get('root_bs_category'):
-             categories.append(row.get('root_bs_category').strip().lower())
-             
-    # Filter by frequency
-    cat_counts = Counter(categories)
-    valid_categories = [cat for cat, count in cat_counts.items() if count >= min_count]
-    
-    sub_counts = Counter(subcategories)
-    valid_subcategories = [sub for sub, count in sub_counts.most_common(999)] # Limit subcategories
+    if parsed and isinstance(parsed, list) and len(parsed) > 0:
+        category = parsed[0].strip().lower() if parsed[0] else None
+        # Leaf (Subcategory)
+        subcategory = parsed[-1].strip().lower() if len(parsed) > 1 else None
+        return category, subcategory
+    elif row.get('root_bs_category'):
+        return row.get('root_bs_category').strip().lower(), None
+    return None, None
+
+class Vocabulary:
+    """
+    Token vocabularies for color and material extraction, compiled into
+    one TokenMatcher each so every row is scanned once per property.
+    """
+
+    def __init__(self, colors=VALID_COLOR_TOKENS, color_stop_words=COLOR_STOP_WORDS, materials=KNOWN_MATERIALS):
+        # Variation names split on separators; stop words never count as colors
+        self.colors = TokenMatcher(set(colors) - set(color_stop_words), separators=SEPARATORS)
+        # Materials must start a word ('lace' is not in 'necklace') but may
+        # carry a suffix ('wooden', 'leathers')
+        self.materials = TokenMatcher(materials, right='')
+        # Saved counts are only valid for the vocabulary that produced them
+        words = json.dumps([sorted(colors), sorted(color_stop_words), sorted(materials)])
+        self.signature = hashlib.sha256(words.encode('utf-8')).hexdigest()[:16]
+
+def load_vocabulary(filepath=None):
+    """Builds a Vocabulary, overriding defaults with keys from a JSON file if given."""
+    if not filepath:
+        return Vocabulary()
+    with open(filepath, 'r') as f:
+        overrides = json.load(f)
+    return Vocabulary(
+        colors=overrides.get('colors', VALID_COLOR_TOKENS),
+        color_stop_words=overrides.get('color_stop_words', COLOR_STOP_WORDS),
+        materials=overrides.get('materials', KNOWN_MATERIALS),
+    )
+
+DEFAULT_VOCABULARY = Vocabulary()
+
+def row_colors(row, vocab=DEFAULT_VOCABULARY):
+    """Extracts color names from a row's 'variations' names."""
+    colors = []
+    parsed = parse_json_field(row.get('variations'))
     
-    return sorted(list(set(valid_categories))), sorted(list(set(valid_subcategories)))
+    if parsed and isinstance(parsed, list):
+        for v in parsed:
+            if isinstance(v, dict) and 'name' in v:
+                name = v['name']
+                if not name: continue
+                
+                # Normalize
+                clean_name = name.lower().strip()
+                
+                # Reject if strictly numeric (already done, but verify)
+                if re.search(r'\d', clean_name):
+                    continue
+                
+                # Every color token in one scan, in order
+                # Logic: "Blue Large" -> "blue"
+                # "Dark Blue" -> "dark blue"
+                # "Black and White" -> "black white" (acceptable simplified form)
+                # "Bluetooth" -> (filtered out)
+                valid_tokens = vocab.colors.findall(clean_name)
+                if valid_tokens:
+                    colors.append(" ".join(valid_tokens))
+    return colors
+
+def row_materials(row, vocab=DEFAULT_VOCABULARY):
+    """Known materials mentioned in a row's description, features or details."""
+    desc = (row.get('description') or '') + " " + (row.get('features') or '') + " " + (row.get('product_details') or '')
+    return vocab.materials.find_set(desc.lower())
+
+def row_text(row):
+    """Classifier input for a row: title and description, as the parser sees them."""
+    return ((row.get('title') or '') + " " + (row.get('description') or '')).strip()
+
+class SchemaCounters:
+    """
+    Value counts for every schema property, fed one row at a time and mergeable.
+    Categories and materials come from small fixed sets and are counted
+    exactly. Subcategories, brands and colors are open-ended, so they go
+    into SpaceSaving sketches of `sketch_size`, keeping memory flat however
+    large the catalog gets. With train=True it also accumulates the
+    category/subcategory classifier.
+    """
+
+    def __init__(self, vocab=DEFAULT_VOCABULARY, train=False, sketch_size=SKETCH_SIZE):
+        self.vocab = vocab
+        self.rows = 0
+        self.categories = Counter()
+        self.subcategories = SpaceSaving(sketch_size)
+        self.brands = SpaceSaving(sketch_size)
+        self.colors = SpaceSaving(sketch_size)
+        self.materials = Counter()
+        self.trainer = CentroidTrainer() if train else None
+
+    def __getstate__(self):
+        # The vocabulary is rebuilt by the loader (its signature is saved with the state)
+        state = self.__dict__.copy()
+        state['vocab'] = None
+        return state
+
+    @property
+    def sketch_size(self):
+        return self.brands.capacity
+
+    def update(self, row):
+        """Runs every extractor over one row (each field is parsed once)."""
+        self.rows += 1
+        category, subcategory = row_categories(row)
+        if category:
+            self.categories[category] += 1
+        if subcategory:
+            self.subcategories.add(subcategory)
+        if self.trainer is not None:
+            self.trainer.add(row_text(row), category, subcategory)
 
-def extract_brands(data_list, top_n=999):
-    """Extracts top brands."""
-    brands = []
-    for row in data_list:
         b = row.get('brand')
         if b:
-            brands.append(b.strip()) # Keep original case for brands? Or Title Case?
-            
-    counts = Counter(brands)
-    # top_n most common brands
-    return sorted([item[0] for item in counts.most_common(top_n)])
-
-def extract_colors_from_variations(data_list, top_n=999):
-    """Extracts common colors from 'variations' names."""
-    colors = []
-    
-    # Extensive list of valid known colors and modifiers
-    valid_color_tokens = {
-        'beige', 'black', 'blue', 'brown', 'burgundy', 'camel', 'charcoal', 'cobalt', 'copper', 
-        'coral', 'cream', 'crimson', 'cyan', 'dark', 'gold', 'gray', 'green', 'grey', 'indigo', 
-        'ivory', 'khaki', 'lavender', 'light', 'lilac', 'magenta', 'maroon', 'matte', 'metallic', 
-        'mint', 'multicolor', 'mustard', 'navy', 'nude', 'olive', 'orange', 'peach', 'pink', 
-        'plum', 'purple', 'red', 'rose', 'royal', 'ruby', 'rust', 'sage', 'salmon', 'sand', 
-        'silver', 'sky', 'tan', 'taupe', 'teal', 'turquoise', 'violet', 'white', 'yellow', 
-        'amber', 'aqua', 'azure', 'bronze', 'chocolate', 'coffee', 'emerald', 'fuchsia', 
-        'garnet', 'hazel', 'jade', 'lime', 'mocha', 'pearl', 'platinum', 'sapphire', 'scarlet', 
-        'sienna', 'slate', 'smoke', 'steel', 'titanium', 'topaz', 'vanilla', 'zinc', 'champagne',
-        'clear', 'crystal', 'transparent'
-    }
-    
-    # Exclude misleading tokens that might look like colors or are common garbage
-    stop_words = {'large', 'medium', 'small', 'size', 'pack', 'set', 'pair', 'x-large', 
-                  'xx-large', 'small/medium', 'large/x-large', 'mens', 'womens', 'kids', 
-                  'baby', 'toddler', 'in', 'oz', 'lb', 'kg', 'ml', 'bluetooth', 'wifi', 
-                  'usb', 'battery', 'power', 'kit', 'replacement', 'compatible'}
-
-    for row in data_list:
-        vars_raw = row.get('variations')
-        parsed = parse_json_field(vars_raw)
-        
-        if parsed and isinstance(parsed, list):
-            for v in parsed:
-                if isinstance(v, dict) and 'name' in v:
-                    name = v['name']
-                    if not name: continue
-                    
-                    # Normalize
-                    clean_name = name.lower().strip()
-                    
-                    # 1. Reject if strictly numeric (already done, but verify)
-                    if re.search(r'\d', clean_name):
-                        continue
-                        
-                    # 2. Tokenize
-                    # Replace special chars with space to split e.g. "blue/green", "black-white"
-                    tokens = re.split(r'[\s/\-,&]+', clean_name)
-                    
-                    # 3. Filter tokens
-                    valid_tokens = []
-                    is_valid_entry = False
-                    
-                    for t in tokens:
-                        if t in stop_words:
-                            continue # explicitly skip known bad words
-                        if t in valid_color_tokens:
-                            valid_tokens.append(t)
-                            is_valid_entry = True
-                    
-                    # 4. Reconstruct
-                    # Only add if we found at least one valid color token
-                    if is_valid_entry:
-                        # Logic: "Blue Large" -> "blue"
-                        # "Dark Blue" -> "dark blue"
-                        # "Black and White" -> "black white" (acceptable simplified form)
-                        # "Bluetooth" -> (filtered out)
-                        final_color = " ".join(valid_tokens)
-                        if final_color:
-                            colors.append(final_color)
-    
-    counts = Counter(colors)
-    return sorted([item[0] for item in counts.most_common(top_n)])
+            self.brands.add(b.strip()) # Keep original case for brands? Or Title Case?
 
-def extract_materials(data_list, top_n=999):
-    """Extracts materials using regex from descriptions."""
-    materials = []
-    
-    known_materials = [
-        'cotton', 'polyester', 'wool', 'leather', 'silk', 'nylon', 'spandex', 
-        'denim', 'linen', 'viscose', 'rayon', 'acrylic', 'cashmere', 'suede',
-        'metal', 'plastic', 'wood', 'glass', 'ceramic', 'rubber', 'latex', 'silicone',
-        'canvas', 'chiffon', 'velvet', 'fleece', 'jersey', 'lace', 'satin', 'bamboo'
-    ]
-    
-    for row in data_list:
-        desc = (row.get('description') or '') + " " + (row.get('features') or '') + " " + (row.get('product_details') or '')
-        desc = desc.lower()
-        
-        for material in known_materials:
-            if material in desc:
-                materials.append(material)
-    
-    counts = Counter(materials)
-    return sorted([item[0] for item in counts.most_common(top_n)])
+        self.colors.update(row_colors(row, self.vocab))
+        self.materials.update(row_materials(row, self.vocab))
+
+    def merge(self, other):
+        self.rows += other.rows
+        self.categories.update(other.categories)
+        self.subcategories.merge(other.subcategories)
+        self.brands.merge(other.brands)
+        self.colors.merge(other.colors)
+        self.materials.update(other.materials)
+        if self.trainer is not None and other.trainer is not None:
+            self.trainer.merge(other.trainer)
+        return self
+
+def count_rows(rows, vocab=DEFAULT_VOCABULARY, train=False, sketch_size=SKETCH_SIZE):
+    counters = SchemaCounters(vocab, train, sketch_size)
+    for row in rows:
+        counters.update(row)
+    return counters
+
+def _count_range(job):
+    """Worker: counts one byte range of the CSV."""
+    filepath, start, end, fieldnames, vocab, train, sketch_size = job
+    return count_rows(iter_csv_rows(filepath, start, end, fieldnames), vocab, train, sketch_size)
+
+def count_file(filepath, workers=1, vocab=DEFAULT_VOCABULARY, train=False, start=None, end=None, fieldnames=None,
+               sketch_size=SKETCH_SIZE):
+    """
+    Single streaming pass over the CSV, or over the records in [start, end)
+    (record boundaries; see last_record_end). With workers > 1 the range is
+    split into byte ranges that are counted in separate processes and
+    merged. Peak memory is the size of the counters, not the dataset.
+    """
+    if not os.path.exists(filepath):
+        print(f"Warning: {filepath} not found.")
+        return SchemaCounters(vocab, train, sketch_size)
+
+    if workers <= 1:
+        return count_rows(iter_csv_rows(filepath, start, end, fieldnames), vocab, train, sketch_size)
+
+    if fieldnames is None or start is None:
+        fieldnames, data_start = read_header(filepath)
+        if start is None:
+            start = data_start
+    ranges = find_chunk_boundaries(filepath, start, workers * CHUNKS_PER_WORKER, end)
+    print(f"Counting {len(ranges)} chunks with {workers} workers...")
+    total = SchemaCounters(vocab, train, sketch_size)
+    with Pool(workers) as pool:
+        jobs = [(filepath, chunk_start, chunk_end, fieldnames, vocab, train, sketch_size)
+                for chunk_start, chunk_end in ranges]
+        for counters in pool.imap_unordered(_count_range, jobs):
+            total.merge(counters)
+    return total
+
+def last_record_end(filepath, start):
+    """
+    Offset just past the file's last complete record at or after `start`
+    (a record boundary), so a row that is still being appended is left for
+    the next run. As in find_chunk_boundaries, a newline only ends a record
+    when the quotes before it are even, so a half-written quoted field
+    with newlines in it is not cut. One forward pass counts the quotes in
+    each block; the last blocks are then searched backwards for a newline
+    with even parity.
+    """
+    parities = []  # (block offset, quote parity at its start)
+    with open(filepath, 'rb') as f:
+        f.seek(start)
+        pos = start
+        odd = False
+        while True:
+            block = f.read(BLOCK_SIZE)
+            if not block:
+                break
+            parities.append((pos, odd))
+            odd ^= bool(block.count(b'"') & 1)
+            pos += len(block)
+        end = pos
+        for block_start, odd in reversed(parities):
+            f.seek(block_start)
+            block = f.read(min(BLOCK_SIZE, end - block_start))
+            nl = len(block)
+            while True:
+                nl = block.rfind(b'\n', 0, nl)
+                if nl < 0:
+                    break
+                if not odd ^ bool(block.count(b'"', 0, nl) & 1):
+                    return block_start + nl + 1
+            end = block_start
+    return start
 
-def extract_sizes(data_list):
+def file_fingerprint(filepath, length):
+    """Hash of the first `length` bytes; it changes if the file is replaced rather than appended to."""
+    with open(filepath, 'rb') as f:
+        return hashlib.sha256(f.read(length)).hexdigest()
+
+def state_path(schema_path):
+    """schema.json -> schema.state"""
+    return os.path.splitext(schema_path)[0] + STATE_SUFFIX
+
+class SchemaState:
+    """
+    What a schema was generated from: the merged SchemaCounters (and
+    classifier trainer) plus, for every input file, the byte offset counted
+    up to and the CSV header. An incremental run counts only bytes past
+    each known file's offset, plus whole new files, merges the result and
+    saves the state again. The counters' size doesn't depend on the row
+    count (see SchemaCounters), and neither does the trainer's with
+    --train-classifier (see CentroidTrainer): it grows with the number of
+    classes, not rows. So the state file stays bounded as the catalog grows.
+    """
+
+    def __init__(self, counters):
+        self.format = STATE_FORMAT
+        self.counters = counters
+        self.vocab_signature = counters.vocab.signature
+        self.sources = {}  # absolute path -> {"offset", "fieldnames", "fingerprint", "fingerprint_bytes"}
+
+    def pending(self, filepath):
+        """
+        (start, end, fieldnames) of the rows in `filepath` not counted yet;
+        start is None for a file never seen. Raises ValueError if the file
+        was rewritten or truncated, since its old rows can't be uncounted.
+        """
+        source = self.sources.get(os.path.abspath(filepath))
+        if source is None:
+            fieldnames, data_start = read_header(filepath)
+            return None, last_record_end(filepath, data_start), fieldnames
+        if (os.path.getsize(filepath) < source["offset"]
+                or file_fingerprint(filepath, source["fingerprint_bytes"]) != source["fingerprint"]):
+            raise ValueError(f"{filepath} changed since it was counted (not just appended to); "
+                             f"regenerate without --incremental")
+        return source["offset"], last_record_end(filepath, source["offset"]), source["fieldnames"]
+
+    def mark(self, filepath, offset, fieldnames):
+        """Records that `filepath` has been counted up to `offset`."""
+        length = min(offset, FINGERPRINT_BYTES)
+        self.sources[os.path.abspath(filepath)] = {
+            "offset": offset,
+            "fieldnames": fieldnames,
+            "fingerprint": file_fingerprint(filepath, length),
+            "fingerprint_bytes": length,
+        }
+
+    def save(self, path):
+        tmp = path + ".tmp"
+        with open(tmp, 'wb') as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+def load_state(path, vocab):
+    """
+    The SchemaState saved at `path`, attached to `vocab`, or None if there
+    is none. Raises ValueError if it was built with another vocabulary or
+    by an incompatible version of this script.
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path, 'rb') as f:
+        state = pickle.load(f)
+    if getattr(state, 'format', None) != STATE_FORMAT:
+        raise ValueError(f"{path} was written by another version of generate_schema.py; regenerate without --incremental")
+    if state.vocab_signature != vocab.signature:
+        raise ValueError(f"{path} was counted with a different vocabulary; regenerate without --incremental")
+    state.counters.vocab = vocab
+    return state
+
+def top_values(counts, top_n):
+    """The top_n most common values, sorted. Ties break on the value so results don't depend on row order."""
+    ranked = sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+    return sorted(value for value, count in ranked[:top_n])
+
+def select_categories(counters, min_count=5):
+    """Top level categories seen at least min_count times, plus the most common leaf subcategories."""
+    valid_categories = [cat for cat, count in counters.categories.items() if count >= min_count]
+    valid_subcategories = top_values(counters.subcategories, 999) # Limit subcategories
+    return sorted(valid_categories), valid_subcategories
+
+def extract_sizes():
     return ['xs', 's', 'm', 'l', 'xl', 'xxl', 'xxxl']
 
 def main():
-    print("Loading dataset...")
-    data = load_csv_data(AMAZON_CSV)
+    arg_parser = argparse.ArgumentParser(description="Builds schema.json from product CSVs.")
+    arg_parser.add_argument('--input', nargs='+', default=[AMAZON_CSV], help="One or more product CSV files")
+    arg_parser.add_argument('--output', default=OUTPUT_SCHEMA)
+    arg_parser.add_argument('--state', default=None,
+                            help=f"Counter state for --incremental (default: the output's name with {STATE_SUFFIX})")
+    arg_parser.add_argument('--incremental', action='store_true',
+                            help="Count only rows appended since the last run and new files, merged into the saved state")
+    arg_parser.add_argument('--sketch-size', type=int, default=SKETCH_SIZE,
+                            help="Values tracked per subcategory/brand/color counter (memory bound)")
+    arg_parser.add_argument('--workers', type=int, default=1, help="Processes for parallel counting (default: 1)")
+    arg_parser.add_argument('--vocab', default=None, help="JSON file overriding 'colors', 'color_stop_words' and/or 'materials'")
+    arg_parser.add_argument('--train-classifier', action='store_true',
+                            help="Also train the category classifier (for CATEGORY_MODE=classifier)")
+    arg_parser.add_argument('--classifier', default=None,
+                            help=f"Where to save the category classifier (default: {CLASSIFIER_FILE} next to the schema)")
+    args = arg_parser.parse_args()
+    train = args.train_classifier
+    vocab = load_vocabulary(args.vocab)
+    state_file = args.state or state_path(args.output)
+
+    state = None
+    if args.incremental:
+        try:
+            state = load_state(state_file, vocab)
+        except ValueError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        if state is None:
+            print(f"No saved state at {state_file}; counting everything.")
+    if state is None:
+        state = SchemaState(SchemaCounters(vocab, train, args.sketch_size))
+    counters = state.counters
+    # New rows are counted the way the saved ones were, so the state stays consistent
+    learn = counters.trainer is not None
+    if train and not learn:
+        print("Saved state has no classifier data (made without --train-classifier); skipping the classifier.")
+        train = False
+
+    print("Scanning dataset...")
+    for filepath in args.input:
+        if not os.path.exists(filepath):
+            print(f"Warning: {filepath} not found.")
+            continue
+        try:
+            start, end, fieldnames = state.pending(filepath)
+        except ValueError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        if start is not None and end <= start:
+            print(f"{filepath}: no new rows.")
+            continue
+        before = counters.rows
+        counters.merge(count_file(filepath, workers=args.workers, vocab=vocab, train=learn, start=start, end=end,
+                                  fieldnames=fieldnames, sketch_size=counters.sketch_size))
+        state.mark(filepath, end, fieldnames)
+        print(f"{filepath}: {counters.rows - before} {'new ' if start is not None else ''}rows.")
+    state.save(state_file)
+    print(f"Saved counter state to {state_file}.")
     
-    if not data:
+    if not counters.rows:
         print("No data found!")
         return
 
-    print("Extracting schema properties...")
-    categories, subcategories = extract_categories_and_subcategories(data)
-    brands = extract_brands(data, top_n=999)
-    colors = extract_colors_from_variations(data)
-    materials = extract_materials(data)
-    sizes = extract_sizes(data)
+    print(f"Scanned {counters.rows} rows in total. Extracting schema properties...")
+    categories, subcategories = select_categories(counters)
+    brands = top_values(counters.brands, 999)
+    colors = top_values(counters.colors, 999)
+    materials = top_values(counters.materials, 999)
+    sizes = extract_sizes()
     
     # Construct schema structure
     # Now using detailed definitions
@@ -238,6 +583,8 @@ def main():
                 "items": { "type": "string" }
             }
         },
+        # What a parse must fill before rules/classifier alone may answer it
+        "required": ["category", "subcategory", "brand"],
         "inference_rules": [
             "If a mapped property is not a perfect match, choose the closest valid option for enums.",
             "For 'dimensions' and 'weight', extract the exact text if found.",
@@ -250,11 +597,22 @@ def main():
     print(f"Subcategories found: {len(subcategories)}")
     print(f"Brands found: {len(brands)}")
     print(f"Colors found: {len(colors)}")
+    for name, sketch in (("Subcategory", counters.subcategories), ("Brand", counters.brands), ("Color", counters.colors)):
+        if not sketch.exact:
+            print(f"{name} counts are approximate (each may be over by up to {sketch.floor}); "
+                  f"raise --sketch-size for exact ones.")
     print(f"Materials found: {len(materials)}")
     
-    print(f"Writing schema to {OUTPUT_SCHEMA}...")
-    with open(OUTPUT_SCHEMA, 'w') as f:
+    print(f"Writing schema to {args.output}...")
+    with open(args.output, 'w') as f:
         json.dump(schema, f, indent=2)
+
+    if train:
+        classifier_path = args.classifier or os.path.join(os.path.dirname(args.output), CLASSIFIER_FILE)
+        print(f"Training classifier on {counters.trainer.docs} labelled rows...")
+        model = counters.trainer.build({"category": categories, "subcategory": subcategories})
+        print(f"Writing classifier to {classifier_path}...")
+        model.save(classifier_path)
     print("Done.")
 
 if __name__ == "__main__":
@@ -0,0 +1,357 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+import httpx
+
+from metrics import IMAGE_SEARCHES, STAGE_SECONDS, process_alive
+
+
+IMAGE_PROVIDER = os.environ.get("IMAGE_PROVIDER", "ddgs")  # ddgs | stub | none
+IMAGE_TTL = 7 * 24 * 3600  # seconds to keep a found image
+NEGATIVE_TTL = 3600  # seconds to remember that nothing was found (or the search failed)
+MAX_ENTRIES = 10000
+MAX_RETRIES = 3
+RETRY_DELAY = 2.0
+SHARED_POLL = 0.1  # seconds between checks on a lookup another worker is running
+PRUNE_EVERY = 1000  # shared entries written between sweeps of expired and excess ones
+# Hosts ("host" or "host:port") that /parse callback_url may point at; unset = no callbacks
+IMAGE_CALLBACK_HOSTS = os.environ.get("IMAGE_CALLBACK_HOSTS", "")
+
+
+def parse_callback_hosts(spec):
+    """'hooks.example.com, 10.0.0.5:9000' -> frozenset({'hooks.example.com', '10.0.0.5:9000'})"""
+    return frozenset(item.strip().lower() for item in spec.split(",") if item.strip())
+
+
+class ImageProvider(ABC):
+    """Looks up an image URL for a product name. `search` may block; it runs in a worker thread."""
+
+    @abstractmethod
+    def search(self, keywords):
+        """The image URL for `keywords`, or None when there is none."""
+
+
+class DDGSImageProvider(ImageProvider):
+    """DuckDuckGo image search with retries for rate limits."""
+
+    def __init__(self, max_retries=MAX_RETRIES, retry_delay=RETRY_DELAY):
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+
+    def search(self, keywords):
+        from ddgs import DDGS
+        for attempt in range(self.max_retries):
+            try:
+                with DDGS() as ddgs:
+                    # Search for images
+                    images = list(ddgs.images(keywords, max_results=1))
+                    return images[0]["image"] if images else None
+            except Exception as e:
+                print(f"Image search attempt {attempt+1} failed: {e}")
+                if attempt < self.max_retries - 1:
+                    time.sleep(self.retry_delay) # Wait before retrying
+                else:
+                    raise
+
+
+class StubImageProvider(ImageProvider):
+    """Offline provider for tests: a fixed mapping, or one URL template for everything."""
+
+    def __init__(self, images=None, url_template=None, delay=0.0):
+        self.images = images or {}
+        self.url_template = url_template
+        self.delay = delay
+        self.calls = 0
+
+    def search(self, keywords):
+        self.calls += 1
+        if self.delay:
+            time.sleep(self.delay)
+        if keywords in self.images:
+            return self.images[keywords]
+        if self.url_template:
+            return self.url_template.format(keywords=keywords)
+        return None
+
+
+def default_provider():
+    """Provider selected by the IMAGE_PROVIDER env var (None disables enrichment)."""
+    if IMAGE_PROVIDER == "stub":
+        return StubImageProvider(url_template=os.environ.get("IMAGE_STUB_URL", "https://example.invalid/{keywords}.jpg"))
+    if IMAGE_PROVIDER == "none":
+        return None
+    return DDGSImageProvider()
+
+
+class SharedImageState:
+    """
+    Image lookup results and in-flight claims in a directory that every
+    worker of a prefork server shares (server.shared_dir), so a worker can
+    answer for a lookup another worker started.
+
+    A finished lookup is <hash>.json holding {"image_url", "expires"},
+    written through a per-pid tmp file and os.replace. A running one is
+    <hash>.pending holding the pid of the worker running it, created with
+    O_EXCL so only one worker claims a name. A claim whose process is gone
+    is taken over.
+    """
+
+    def __init__(self, directory, max_entries=MAX_ENTRIES):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_entries = max_entries
+        self._writes = 0
+
+    def _path(self, key, suffix):
+        return os.path.join(self.directory, hashlib.sha1(key.encode("utf-8")).hexdigest() + suffix)
+
+    def get(self, key):
+        """(image_url or None, expires) of a fresh result, or None."""
+        try:
+            with open(self._path(key, ".json")) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return (entry["image_url"], entry["expires"]) if entry["expires"] >= time.time() else None
+
+    def put(self, key, image_url, expires):
+        path = self._path(key, ".json")
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"image_url": image_url, "expires": expires}, f)
+        os.replace(tmp, path)
+        self._writes += 1
+        if self._writes % PRUNE_EVERY == 0:
+            self._prune()
+
+    def claimant(self, key):
+        """Pid of the live worker running a lookup for `key`, or None."""
+        try:
+            with open(self._path(key, ".pending")) as f:
+                pid = int(f.read())
+        except (OSError, ValueError):
+            return None
+        return pid if process_alive(pid) else None
+
+    def claim(self, key):
+        """True if this process now runs the lookup for `key`; False if another live worker does."""
+        path = self._path(key, ".pending")
+        for _ in range(2):
+            try:
+                fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL)
+            except FileExistsError:
+                if self.claimant(key) is not None:
+                    return False
+                # Left behind by a worker that died mid-lookup
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+                continue
+            with os.fdopen(fd, "w") as f:
+                f.write(str(os.getpid()))
+            return True
+        return False
+
+    def release(self, key):
+        try:
+            os.unlink(self._path(key, ".pending"))
+        except FileNotFoundError:
+            pass
+
+    def _prune(self):
+        """Drops expired results, then the oldest ones over max_entries."""
+        now = time.time()
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                with open(path) as f:
+                    expires = json.load(f)["expires"]
+                modified = os.path.getmtime(path)
+            except (OSError, ValueError, KeyError):
+                continue
+            if expires < now:
+                os.unlink(path)
+            else:
+                entries.append((modified, path))
+        entries.sort()
+        for _, path in entries[:max(0, len(entries) - self.max_entries)]:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+
+class ImageEnricher:
+    """
+    Finds images off the request path.
+
+    `request()` answers from the cache straight away or starts a background
+    lookup, which `status()` reports as pending until it finishes. Found
+    images are cached for `ttl`. Misses and provider errors are cached for
+    `negative_ttl`, so a name that has no image doesn't hit the provider on
+    every request. Concurrent requests for the same name share one lookup.
+    Callbacks only go to `callback_hosts`, which the operator configures,
+    never to wherever a client asks. With `shared_dir`, results and running
+    lookups are also kept there (SharedImageState), so the workers of a
+    prefork server answer for each other's lookups and don't repeat them.
+    """
+
+    def __init__(self, provider, ttl=IMAGE_TTL, negative_ttl=NEGATIVE_TTL, max_entries=MAX_ENTRIES,
+                 callback_hosts=None, shared_dir=None):
+        self.provider = provider
+        self.callback_hosts = parse_callback_hosts(IMAGE_CALLBACK_HOSTS) if callback_hosts is None \
+            else frozenset(host.lower() for host in callback_hosts)
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self._cache = OrderedDict()  # key -> (image_url or None, expires)
+        self._pending = {}  # key -> asyncio.Task
+        self._callbacks = set()  # keeps callback tasks referenced until they finish
+        self._shared = SharedImageState(shared_dir, max_entries) if shared_dir else None
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(product_name):
+        return " ".join(product_name.lower().split())
+
+    def cached(self, product_name):
+        """Returns (known, image_url). known is False when there is no fresh cache entry."""
+        key = self._key(product_name)
+        entry = self._cache.get(key)
+        if entry is not None and entry[1] < time.time():
+            del self._cache[key]
+            entry = None
+        if entry is None and self._shared is not None:
+            # Another worker may have looked it up
+            entry = self._shared.get(key)
+            if entry is not None:
+                self._remember(key, *entry)
+        if entry is None:
+            return False, None
+        self._cache.move_to_end(key)
+        return True, entry[0]
+
+    def _pending_elsewhere(self, key):
+        return self._shared is not None and self._shared.claimant(key) not in (None, os.getpid())
+
+    def status(self, product_name):
+        known, image_url = self.cached(product_name)
+        if known:
+            return {"product_name": product_name, "status": "found" if image_url else "not_found", "image_url": image_url}
+        key = self._key(product_name)
+        if key in self._pending or self._pending_elsewhere(key):
+            return {"product_name": product_name, "status": "pending", "image_url": None}
+        return {"product_name": product_name, "status": "unknown", "image_url": None}
+
+    def check_callback(self, callback_url):
+        """Raises ValueError unless `callback_url` is an http(s) URL on an allowed host."""
+        try:
+            url = httpx.URL(callback_url)
+        except Exception as e:
+            raise ValueError(f"Invalid callback_url: {e}")
+        if url.scheme not in ("http", "https") or not url.host:
+            raise ValueError("callback_url must be an http(s) URL")
+        host = url.host.lower()
+        if host not in self.callback_hosts and f"{host}:{url.port}" not in self.callback_hosts:
+            raise ValueError(f"callback_url host {host} is not in IMAGE_CALLBACK_HOSTS")
+
+    def request(self, product_name, callback_url=None):
+        """
+        Cached status, starting a background lookup on a miss. Must run on
+        the event loop. Raises ValueError for a callback_url that isn't allowed.
+        """
+        if callback_url:
+            self.check_callback(callback_url)
+        known, _ = self.cached(product_name)
+        if known:
+            self.hits += 1
+        else:
+            key = self._key(product_name)
+            if key not in self._pending and (self._shared is None or self._shared.claim(key)):
+                self.misses += 1
+                task = asyncio.get_running_loop().create_task(self._lookup(key, product_name))
+                self._pending[key] = task
+                task.add_done_callback(lambda _: self._pending.pop(key, None))
+        if callback_url:
+            # Cached answers (found or a known miss) are POSTed too
+            task = asyncio.get_running_loop().create_task(self._notify(product_name, callback_url))
+            self._callbacks.add(task)
+            task.add_done_callback(self._callbacks.discard)
+        return self.status(product_name)
+
+    async def lookup(self, product_name):
+        """Waits for the image URL (or None), using the cache and any in-flight lookup."""
+        known, image_url = self.cached(product_name)
+        if known:
+            return image_url
+        self.request(product_name)
+        await self.wait(product_name)
+        return self.cached(product_name)[1]
+
+    async def wait(self, product_name):
+        """
+        Waits for an in-flight lookup, if any, without starting one. Returns
+        the status. A lookup running in another worker is polled for.
+        """
+        key = self._key(product_name)
+        while True:
+            task = self._pending.get(key)
+            if task is not None:
+                await asyncio.shield(task)
+            elif self._pending_elsewhere(key) and not self.cached(product_name)[0]:
+                await asyncio.sleep(SHARED_POLL)
+            else:
+                return self.status(product_name)
+
+    async def _lookup(self, key, product_name):
+        try:
+            await self._search(key, product_name)
+        finally:
+            if self._shared is not None:
+                self._shared.release(key)
+
+    async def _search(self, key, product_name):
+        start = time.perf_counter()
+        try:
+            image_url = await asyncio.to_thread(self.provider.search, product_name)
+            IMAGE_SEARCHES.inc(outcome="found" if image_url else "not_found")
+        except Exception as e:
+            print(f"Image search failed after retries: {e}")
+            image_url = None
+            IMAGE_SEARCHES.inc(outcome="error")
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage="image_search")
+        expires = time.time() + (self.ttl if image_url else self.negative_ttl)
+        self._remember(key, image_url, expires)
+        if self._shared is not None:
+            try:
+                self._shared.put(key, image_url, expires)
+            except OSError as e:
+                print(f"Could not share image lookup result: {e}")
+
+    def _remember(self, key, image_url, expires):
+        self._cache[key] = (image_url, expires)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+    async def _notify(self, product_name, callback_url):
+        """POSTs the final status to a client-supplied callback URL."""
+        await self.wait(product_name)
+        try:
+            async with httpx.AsyncClient(timeout=10.0) as client:
+                await client.post(callback_url, json=self.status(product_name))
+        except Exception as e:
+            print(f"Image callback to {callback_url} failed: {e}")
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "pending": len(self._pending), "entries": len(self._cache)}
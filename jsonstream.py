@@ -0,0 +1,160 @@
+import json
+
+
+class JSONFieldStream:
+    """
+    Incremental parser for a JSON object that arrives in pieces.
+
+    `feed()` takes the next piece of text and returns the top-level
+    (key, value) pairs it completed, in order. A string value is complete
+    at its closing quote, an array or object at its closing bracket, and a
+    number/true/false/null at the following ',' or '}'. Only the scanner
+    state is kept between calls; each member is decoded with json.loads
+    once it is complete, so values are exactly what json.loads would give.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.fields = {}
+        self.done = False  # the closing '}' of the top-level object was seen
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._member_start = None
+        self._after_colon = False
+        self._emitted = False
+
+    def feed(self, chunk):
+        self.text += chunk
+        completed = []
+        text = self.text
+        for i in range(self._pos, len(text)):
+            ch = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._after_colon:
+                        self._emit(i + 1, completed)
+                continue
+            if self.done:
+                break
+            if ch == '"':
+                self._in_string = True
+            elif ch in '{[':
+                self._depth += 1
+                if self._depth == 1:
+                    self._start_member(i + 1)
+            elif ch in '}]':
+                self._depth -= 1
+                if self._depth == 1 and self._after_colon:
+                    self._emit(i + 1, completed)
+                elif self._depth == 0:
+                    self._emit(i, completed)
+                    self.done = True
+            elif self._depth == 1:
+                if ch == ':':
+                    self._after_colon = True
+                elif ch == ',':
+                    self._emit(i, completed)
+                    self._start_member(i + 1)
+        self._pos = len(text)
+        return completed
+
+    def _start_member(self, start):
+        self._member_start = start
+        self._after_colon = False
+        self._emitted = False
+
+    def _emit(self, end, completed):
+        if self._emitted or self._member_start is None:
+            return
+        member = self.text[self._member_start:end].strip()
+        if not member:
+            return
+        try:
+            decoded = json.loads("{" + member + "}")
+        except ValueError:
+            return  # malformed member; the final json.loads reports it
+        self._emitted = True
+        for key, value in decoded.items():
+            self.fields[key] = value
+            completed.append((key, value))
+
+
+_DECODER = json.JSONDecoder()
+MAX_REPAIR_CUTS = 16  # cut points tried from the end before giving up
+
+
+def repair_json(text):
+    """
+    Salvages a JSON object from almost-valid model output, without another
+    inference. Handles text or code fences around the object, trailing
+    commas, and output cut off (e.g. by num_predict): open brackets are
+    closed, and a member that was cut mid-value is dropped. Returns the
+    dict, or None if nothing usable is left.
+    """
+    start = text.find('{')
+    if start < 0:
+        return None
+    try:
+        value, _ = _DECODER.raw_decode(text, start)  # ignores anything after the object
+        return value if isinstance(value, dict) else None
+    except ValueError:
+        pass
+
+    # One scan: copy the text minus trailing commas, and note where members
+    # end (top-level commas) together with the brackets open at that point.
+    out = []
+    stack = []
+    cuts = []  # (length of out, open brackets) before each ',' outside strings
+    in_string = escape = False
+    for ch in text[start:]:
+        if in_string:
+            out.append(ch)
+            if escape:
+                escape = False
+            elif ch == '\\':
+                escape = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch in '{[':
+            stack.append('}' if ch == '{' else ']')
+        elif ch in '}]':
+            while out and out[-1].isspace():
+                out.pop()
+            if out and out[-1] == ',':
+                out.pop()
+            if not stack:
+                break
+            stack.pop()
+            out.append(ch)
+            if not stack:
+                break
+            continue
+        elif ch == ',':
+            cuts.append((len(out), ''.join(reversed(stack))))
+        out.append(ch)
+
+    body = ''.join(out)
+    closers = ''.join(reversed(stack))
+    # A value cut off inside a string (or a number, which could have had more
+    # digits) is partial, so it is dropped rather than closed
+    tail = body.rstrip()[-1:]
+    candidates = [] if in_string or tail.isdigit() or tail in ('.', '-', '+') else [body + closers]
+    candidates += [body[:length] + closing for length, closing in reversed(cuts[-MAX_REPAIR_CUTS:])]
+    for candidate in candidates:
+        try:
+            value = json.loads(candidate)
+        except ValueError:
+            continue
+        if isinstance(value, dict) and value:
+            return value
+    return None
@@ -0,0 +1,178 @@
+import difflib
+import functools
+from collections import Counter
+
+
+FUZZY_CUTOFF = 0.6
+MEMO_SIZE = 8192
+
+
+def _ratio(matches, length):
+    """Same similarity formula difflib uses, so thresholds compare identically."""
+    if length:
+        return 2.0 * matches / length
+    return 1.0
+
+
+class EnumMatcher:
+    """
+    Precomputed matcher for one list of enum values.
+
+    Returns exactly what `difflib.get_close_matches(word, values, n=1, cutoff)`
+    would, but only runs SequenceMatcher on a short candidate list.
+
+    Candidates come from a character-count index: for every value we know how
+    many of each character it contains, which gives the same upper bound as
+    `SequenceMatcher.quick_ratio()`. The per-value counters are packed into
+    lanes of one big integer, so bounding all values against a query costs a
+    handful of big-int additions instead of a Python loop over the list.
+    """
+
+    def __init__(self, values, cutoff=FUZZY_CUTOFF):
+        self.values = list(values)
+        self.cutoff = cutoff
+        self._exact = set(self.values)
+        self._lengths = [len(v) for v in self.values]
+
+        # Each lane must hold a count up to the longest value plus a flag bit
+        self._width = max(self._lengths + [1]).bit_length() + 1
+        self._top = 1 << (self._width - 1)
+        self._high_bits = 0
+        for i in range(len(self.values)):
+            self._high_bits |= self._top << (i * self._width)
+
+        # char -> [lanes of values with >= 1 of char, >= 2 of char, ...]
+        # Summing the first q levels adds min(q, count) to every lane.
+        self._levels = {}
+        for i, v in enumerate(self.values):
+            lane = 1 << (i * self._width)
+            for ch, count in Counter(v).items():
+                levels = self._levels.setdefault(ch, [])
+                while len(levels) < count:
+                    levels.append(0)
+                for k in range(count):
+                    levels[k] |= lane
+
+        self._bias_by_length = {}
+
+    def _bias(self, word_len):
+        """Per-lane offsets that set the flag bit once a value can pass the cutoff."""
+        bias = self._bias_by_length.get(word_len)
+        if bias is not None:
+            return bias
+
+        bias = 0
+        for i, value_len in enumerate(self._lengths):
+            length = value_len + word_len
+            # Smallest shared-character count that could still reach the cutoff
+            needed = 0
+            while needed <= value_len and _ratio(needed, length) < self.cutoff:
+                needed += 1
+            if needed > value_len:
+                continue  # Unreachable; lane never gets its flag bit
+            bias |= (self._top - needed) << (i * self._width)
+
+        self._bias_by_length[word_len] = bias
+        return bias
+
+    def _candidates(self, word):
+        """Yields (upper bound, value) for every value that could pass the cutoff."""
+        word_len = len(word)
+        total = 0
+        for ch, count in Counter(word).items():
+            levels = self._levels.get(ch)
+            if levels:
+                for k in range(min(count, len(levels))):
+                    total += levels[k]
+
+        flags = (total + self._bias(word_len)) & self._high_bits
+        lane_mask = self._top - 1
+        while flags:
+            low = flags & -flags
+            i = (low.bit_length() - 1) // self._width
+            shared = (total >> (i * self._width)) & lane_mask
+            yield _ratio(shared, self._lengths[i] + word_len), self.values[i]
+            flags ^= low
+
+    def closest(self, word):
+        """Best (score, value) at or above the cutoff, or None."""
+        best = None
+        s = difflib.SequenceMatcher()
+        s.set_seq2(word)
+        # Highest bound first; once a bound drops below the best real score
+        # nothing after it can win. Equal bounds still run, since difflib
+        # breaks score ties on the larger value.
+        for bound, value in sorted(self._candidates(word), reverse=True):
+            if best is not None and bound < best[0]:
+                break
+            s.set_seq1(value)
+            score = s.ratio()
+            if score >= self.cutoff and (best is None or (score, value) > best):
+                best = (score, value)
+        return best
+
+    def match(self, word):
+        """Returns (normalized value, score); score is 1.0 for exact hits, 0.0 for misses."""
+        if word in self._exact:
+            return word, 1.0
+        best = self.closest(word)
+        if best:
+            return best[1], best[0]
+        return word, 0.0
+
+
+class SchemaMatcher:
+    """Enum matchers for every enum property of a schema, with an LRU memo."""
+
+    def __init__(self, schema, cutoff=FUZZY_CUTOFF, memo_size=MEMO_SIZE):
+        self.fields = {}
+        for key, prop_def in schema.get("properties", {}).items():
+            if prop_def.get("type") == "enum":
+                self.fields[key] = EnumMatcher(prop_def.get("values", []), cutoff)
+        self.memo_size = memo_size
+        self.match = functools.lru_cache(maxsize=memo_size)(self._match)
+
+    def __getstate__(self):
+        # The memo wraps a bound method and can't be pickled; it is rebuilt empty
+        state = self.__dict__.copy()
+        del state['match']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.match = functools.lru_cache(maxsize=self.memo_size)(self._match)
+
+    def _match(self, field, raw):
+        """(field, raw value) -> (normalized value, score)."""
+        return self.fields[field].match(raw.lower().strip())
+
+    def normalize(self, field, value):
+        """Normalizes a single value, or returns None for empty input."""
+        if not value:
+            return None
+        return self.match(field, str(value))[0]
+
+
+# id(schema) -> (schema, SchemaMatcher); keeping the schema alive keeps the id valid
+_MATCHERS = {}
+
+
+def get_matcher(schema):
+    """Returns the matcher for a schema, building it on first use."""
+    entry = _MATCHERS.get(id(schema))
+    if entry is None or entry[0] is not schema:
+        entry = (schema, SchemaMatcher(schema))
+        _MATCHERS[id(schema)] = entry
+    return entry[1]
+
+
+def register_matcher(schema, matcher):
+    """Makes get_matcher(schema) return a prebuilt (e.g. unpickled) matcher."""
+    _MATCHERS[id(schema)] = (schema, matcher)
+
+
+def unregister_matcher(schema):
+    """Drops a schema's matcher, e.g. once a newer schema version has replaced it."""
+    entry = _MATCHERS.get(id(schema))
+    if entry is not None and entry[0] is schema:
+        _MATCHERS.pop(id(schema), None)
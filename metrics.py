@@ -0,0 +1,353 @@
+import bisect
+import os
+import pickle
+import threading
+import time
+from contextlib import contextmanager
+
+
+# Seconds; covers in-process stages (microseconds) through slow model calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+# Ollama reports these durations in nanoseconds
+OLLAMA_DURATIONS = ('load_duration', 'prompt_eval_duration', 'eval_duration', 'total_duration')
+SNAPSHOT_SUFFIX = ".metrics"
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    body = ",".join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for k, v in pairs)
+    return "{" + body + "}"
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}  # label values tuple -> value
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(labels[name] for name in self.labelnames)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+    def combine(self, snapshots):
+        """
+        One process's view from several processes' snapshots, as
+        (snapshot, process alive) pairs: values are summed per label set.
+        """
+        combined = {}
+        for values, _ in snapshots:
+            for key, value in values.items():
+                combined[key] = combined.get(key, 0) + value
+        return combined
+
+    def render(self, values=None):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        items = sorted((self.snapshot() if values is None else values).items())
+        for key, value in items:
+            lines.extend(self._samples(key, value))
+        return lines
+
+    def _samples(self, key, value):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    """`aggregate` says how worker processes combine: "sum" (in-flight counts) or "max" (durations)."""
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), aggregate="sum"):
+        super().__init__(name, documentation, labelnames)
+        self.aggregate = aggregate
+
+    def combine(self, snapshots):
+        # A dead worker's gauges describe nothing that still exists
+        combined = {}
+        for values, alive in snapshots:
+            if not alive:
+                continue
+            for key, value in values.items():
+                if key not in combined:
+                    combined[key] = value
+                elif self.aggregate == "max":
+                    combined[key] = max(combined[key], value)
+                else:
+                    combined[key] += value
+        return combined
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    @contextmanager
+    def track(self, **labels):
+        """Counts the block as in progress while it runs."""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket (non-cumulative) counts, sum, count
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def count(self, **labels):
+        state = self._values.get(self._key(labels))
+        return state[2] if state else 0
+
+    def snapshot(self):
+        with self._lock:
+            return {key: [list(counts), total, count] for key, (counts, total, count) in self._values.items()}
+
+    def combine(self, snapshots):
+        combined = {}
+        for values, _ in snapshots:
+            for key, (counts, total, count) in values.items():
+                state = combined.get(key)
+                if state is None:
+                    combined[key] = [list(counts), total, count]
+                else:
+                    state[0] = [a + b for a, b in zip(state[0], counts)]
+                    state[1] += total
+                    state[2] += count
+        return combined
+
+    def _samples(self, key, state):
+        counts, total, count = state
+        lines = []
+        cumulative = 0
+        for bound, n in zip(self.buckets + (float('inf'),), counts):
+            cumulative += n
+            labels = _format_labels(self.labelnames, key, [("le", _format_value(float(bound)))])
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    """
+    A set of metrics rendered together in the Prometheus text format.
+
+    Processes serving the same port (prefork workers) each dump a snapshot
+    into a shared directory (`dump`), and `render(directory)` combines all
+    of them, so a scrape sees the whole server whichever worker answers.
+    Counters and histograms of workers that have exited still count, so
+    totals don't go backwards; their gauges are dropped.
+    """
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=(), aggregate="sum"):
+        return self.register(Gauge(name, documentation, labelnames, aggregate))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def snapshot(self):
+        return {metric.name: metric.snapshot() for metric in self._metrics}
+
+    def dump(self, directory):
+        """Writes this process's snapshot into `directory` (atomically, as <pid>.metrics)."""
+        path = os.path.join(directory, f"{os.getpid()}{SNAPSHOT_SUFFIX}")
+        tmp = f"{path}.{threading.get_ident()}.tmp"  # the flush thread and /metrics may dump at once
+        with open(tmp, 'wb') as f:
+            pickle.dump(self.snapshot(), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+    def _load(self, directory):
+        """[(snapshot, process alive)] for every snapshot in `directory`."""
+        snapshots = []
+        for name in os.listdir(directory):
+            if not name.endswith(SNAPSHOT_SUFFIX):
+                continue
+            try:
+                with open(os.path.join(directory, name), 'rb') as f:
+                    snapshots.append((pickle.load(f), process_alive(int(name[:-len(SNAPSHOT_SUFFIX)]))))
+            except (OSError, ValueError, EOFError, pickle.UnpicklingError):
+                continue
+        return snapshots
+
+    def render(self, directory=None):
+        """This process's metrics, or with `directory` those of every process that dumped there."""
+        snapshots = self._load(directory) if directory is not None else None
+        lines = []
+        for metric in self._metrics:
+            if snapshots is None:
+                lines.extend(metric.render())
+            else:
+                lines.extend(metric.render(metric.combine([(snap.get(metric.name, {}), alive)
+                                                           for snap, alive in snapshots])))
+        return "\n".join(lines) + "\n"
+
+
+def process_alive(pid):
+    """Whether a process with this pid exists (one we may not signal counts)."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+REGISTRY = Registry()
+STAGE_SECONDS = REGISTRY.histogram(
+    "parser_stage_seconds", "Time spent in each stage of a parse request.", ["stage"])
+OLLAMA_SECONDS = REGISTRY.histogram(
+    "ollama_duration_seconds", "Durations reported by Ollama in its response.", ["phase"])
+REQUEST_SECONDS = REGISTRY.histogram(
+    "http_request_duration_seconds", "HTTP request latency.", ["method", "path", "status"])
+REQUESTS_IN_FLIGHT = REGISTRY.gauge(
+    "http_requests_in_flight", "HTTP requests currently being served.")
+OLLAMA_IN_FLIGHT = REGISTRY.gauge(
+    "ollama_requests_in_flight", "Chat requests currently waiting on Ollama.")
+PARSES = REGISTRY.counter(
+    "parser_requests_total", "Parse attempts by outcome (ok, cached, coalesced, rules, failed).", ["outcome"])
+CACHE_LOOKUPS = REGISTRY.counter(
+    "parser_cache_lookups_total", "Result cache lookups.", ["result"])
+OLLAMA_TOKENS = REGISTRY.counter(
+    "ollama_tokens_total", "Tokens processed by Ollama.", ["kind"])
+IMAGE_SEARCHES = REGISTRY.counter(
+    "image_searches_total", "Background image searches by outcome.", ["outcome"])
+JSON_REPAIRS = REGISTRY.counter(
+    "parser_json_repairs_total", "Model outputs that were not valid JSON, by repair result.", ["result"])
+BACKEND_OUTSTANDING = REGISTRY.gauge(
+    "ollama_backend_outstanding", "Requests in flight per Ollama host in the pool.", ["host"])
+BACKEND_ERRORS = REGISTRY.counter(
+    "ollama_backend_errors_total", "Failed requests per Ollama host in the pool.", ["host"])
+COLD_START_SECONDS = REGISTRY.gauge(
+    "api_cold_start_seconds", "Seconds from process start until the API (its slowest worker) was ready to serve.",
+    aggregate="max")
+WARMUP_SECONDS = REGISTRY.gauge(
+    "api_warmup_seconds", "Duration of each startup warm-up step (slowest worker).", ["model", "step"],
+    aggregate="max")
+CASCADE_TIER_SECONDS = REGISTRY.histogram(
+    "cascade_tier_seconds", "Time spent in each model of the cascade, per attempt.", ["model"])
+CASCADE_ESCALATIONS = REGISTRY.counter(
+    "cascade_escalations_total", "Answers passed on to a larger model, by model and reason.", ["model", "reason"])
+
+
+@contextmanager
+def stage(stats, name):
+    """Adds the block's wall time (seconds) to stats['timings'][name]; a no-op without stats."""
+    if stats is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings = stats.setdefault('timings', {})
+        timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
+
+
+def observe_parse(stats, ok):
+    """Records a finished parse (the `stats` dict filled by parser.parse_description*)."""
+    for name, seconds in stats.get('timings', {}).items():
+        STAGE_SECONDS.observe(seconds, stage=name)
+    if 'cached' in stats:
+        CACHE_LOOKUPS.inc(result="hit" if stats['cached'] else "miss")
+    if not ok:
+        PARSES.inc(outcome="failed")
+    elif stats.get('short_circuit'):
+        PARSES.inc(outcome="rules")
+    elif stats.get('cached'):
+        PARSES.inc(outcome="cached")
+    elif stats.get('coalesced'):
+        # Tokens and Ollama durations were recorded by the request that ran the model
+        PARSES.inc(outcome="coalesced")
+    else:
+        PARSES.inc(outcome="ok")
+        for field in OLLAMA_DURATIONS:
+            if stats.get(field):
+                OLLAMA_SECONDS.observe(stats[field] / 1e9, phase=field[:-len('_duration')])
+        observe_tokens(stats)
+
+
+def observe_tokens(stats):
+    """Adds a `stats` dict's token counts (one call's, or a packed batch's sums) to OLLAMA_TOKENS."""
+    for kind, field in (("prompt", 'prompt_eval_count'), ("output", 'eval_count')):
+        if stats.get(field):
+            OLLAMA_TOKENS.inc(stats[field], kind=kind)
+
+
+def server_timing(stats):
+    """Server-Timing header value (milliseconds) for a `stats` dict."""
+    entries = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in stats.get('timings', {}).items()]
+    if not stats.get('cached'):
+        for field in OLLAMA_DURATIONS[:-1]:
+            if stats.get(field):
+                name = "ollama-" + field[:-len('_duration')].replace('_', '-')
+                entries.append(f"{name};dur={stats[field] / 1e6:.2f}")
+    return ", ".join(entries)
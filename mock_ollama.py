@@ -0,0 +1,240 @@
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+DEFAULT_RESPONSE = {
+    "category": "tools & home improvement",
+    "subcategory": "extension cords",
+    "brand": "PowerMax",
+    "color": "ornage",
+    "material": None,
+    "size": "10ft",
+    "dimensions": None,
+    "weight": "2lbs",
+    "features": ["Heavy duty", "10ft"],
+}
+CHARS_PER_TOKEN = 4
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default backlog of 5 drops bursts of connections (1s SYN retry)
+    request_queue_size = 256
+
+
+class MockOllamaServer:
+    """
+    Local stand-in for the parts of the Ollama HTTP API this project uses.
+
+    /api/chat answers with a canned JSON document after `latency` seconds,
+    plus `prompt_token_latency` per prompt token and `token_latency` per
+    output token. It supports both stream=False and stream=True (NDJSON
+    chunks). Token counts are estimated from text length so callers see
+    realistic prompt_eval_count/eval_count fields. A packed request (a
+    format with an "items" array) gets the canned document once per item
+    id in the user message. `response` may be a dict, or a callable taking
+    the request body and returning a dict or string. With `strict_models`,
+    a chat for any model other than `model` gets Ollama's 404, as if it
+    wasn't pulled. Setting `chat_error` to an HTTP status makes every chat
+    fail with it while /api/tags still answers. Use port=0 to pick a free
+    port.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, token_latency=0.0, response=None, model="mistral",
+                 prompt_token_latency=0.0, strict_models=False):
+        self.latency = latency
+        self.token_latency = token_latency
+        self.prompt_token_latency = prompt_token_latency
+        self.response = DEFAULT_RESPONSE if response is None else response
+        self.model = model
+        self.strict_models = strict_models
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.healthy = True
+        self.chat_error = None
+        self._lock = threading.Lock()
+        self._server = _Server((host, port), self._handler())
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def content_for(self, body):
+        response = self.response(body) if callable(self.response) else self.response
+        ids = _packed_ids(body)
+        if ids is not None and isinstance(response, dict):
+            response = {"items": [{"id": item_id, **response} for item_id in ids]}
+        return response if isinstance(response, str) else json.dumps(response)
+
+    def _handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body go out as separate writes; without this the
+            # client's delayed ACK adds ~40ms to every response
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, status, payload):
+                data = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                if not mock.healthy:
+                    return self._send_json(503, {"error": "unhealthy"})
+                if self.path == "/api/tags":
+                    return self._send_json(200, {"models": [{"name": f"{mock.model}:latest", "model": f"{mock.model}:latest"}]})
+                if self.path == "/api/version":
+                    return self._send_json(200, {"version": "mock"})
+                if self.path == "/api/ps":
+                    return self._send_json(200, {"models": []})
+                self._send_json(404, {"error": "not found"})
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b'{}')
+                if not mock.healthy:
+                    return self._send_json(503, {"error": "unhealthy"})
+                if self.path not in ("/api/chat", "/api/generate"):
+                    return self._send_json(404, {"error": "not found"})
+                if mock.strict_models and body.get("model", "").split(":")[0] != mock.model:
+                    return self._send_json(404, {"error": f"model '{body.get('model')}' not found"})
+
+                with mock._lock:
+                    mock.requests += 1
+                    mock.in_flight += 1
+                    mock.max_in_flight = max(mock.max_in_flight, mock.in_flight)
+                try:
+                    if mock.chat_error:
+                        return self._send_json(mock.chat_error, {"error": "chat failed"})
+                    self._answer(body, generate=self.path == "/api/generate")
+                finally:
+                    with mock._lock:
+                        mock.in_flight -= 1
+
+            def _answer(self, body, generate=False):
+                started = time.perf_counter()
+                messages = body.get("messages") or []
+                # A load-only request (no messages / no prompt) just "loads" the model
+                if not messages and not body.get("prompt"):
+                    time.sleep(mock.latency)
+                    return self._send_json(200, {"model": body.get("model"), "created_at": _now(), "done": True,
+                                                 "done_reason": "load", "message": {"role": "assistant", "content": ""}})
+
+                prompt_text = "".join(m.get("content") or "" for m in messages) or body.get("prompt", "")
+                content = mock.content_for(body)
+                prompt_tokens = len(prompt_text) // CHARS_PER_TOKEN + 1
+                tokens = [content[i:i + CHARS_PER_TOKEN] for i in range(0, len(content), CHARS_PER_TOKEN)]
+                num_predict = (body.get("options") or {}).get("num_predict")
+                done_reason = "stop"
+                if num_predict and num_predict > 0 and len(tokens) > num_predict:
+                    tokens = tokens[:num_predict]
+                    done_reason = "length"
+                prompt_seconds = mock.prompt_token_latency * prompt_tokens
+                time.sleep(mock.latency + prompt_seconds)
+
+                def final(extra):
+                    elapsed = int((time.perf_counter() - started) * 1e9)
+                    prompt_duration = int(prompt_seconds * 1e9) or elapsed // 2
+                    return {"model": body.get("model"), "created_at": _now(), "done": True, "done_reason": done_reason,
+                            "total_duration": elapsed, "load_duration": 0,
+                            "prompt_eval_count": prompt_tokens, "prompt_eval_duration": prompt_duration,
+                            "eval_count": len(tokens), "eval_duration": max(1, elapsed - prompt_duration), **extra}
+
+                if body.get("stream") is False:
+                    time.sleep(mock.token_latency * len(tokens))
+                    if generate:
+                        return self._send_json(200, final({"response": "".join(tokens)}))
+                    return self._send_json(200, final({"message": {"role": "assistant", "content": "".join(tokens)}}))
+
+                # Streaming: one NDJSON line per token, then the summary line
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for token in tokens:
+                    time.sleep(mock.token_latency)
+                    self._chunk({"model": body.get("model"), "created_at": _now(), "done": False,
+                                 "message": {"role": "assistant", "content": token}})
+                self._chunk(final({"message": {"role": "assistant", "content": ""}}))
+                self.wfile.write(b"0\r\n\r\n")
+
+            def _chunk(self, payload):
+                data = (json.dumps(payload) + "\n").encode('utf-8')
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+
+        return Handler
+
+
+def _packed_ids(body):
+    """Item ids of a packed request (see parser.parse_packed), or None for a single-item request."""
+    output_format = body.get("format")
+    if not isinstance(output_format, dict) or "items" not in output_format.get("properties", {}):
+        return None
+    try:
+        items = json.loads((body.get("messages") or [{}])[-1].get("content") or "[]")
+        return [item["id"] for item in items]
+    except (ValueError, TypeError, KeyError):
+        return []
+
+
+def _now():
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Runs a mock Ollama server with canned JSON responses.")
+    arg_parser.add_argument('--port', type=int, default=11435)
+    arg_parser.add_argument('--latency', type=float, default=0.5, help="Seconds before each answer")
+    arg_parser.add_argument('--token-latency', type=float, default=0.0, help="Extra seconds per output token")
+    arg_parser.add_argument('--prompt-token-latency', type=float, default=0.0, help="Extra seconds per prompt token")
+    arg_parser.add_argument('--response', default=None, help="JSON file with the canned response")
+    arg_parser.add_argument('--model', default="mistral", help="Model name reported by /api/tags")
+    arg_parser.add_argument('--strict-models', action='store_true', help="Answer 404 for chats with any other model")
+    args = arg_parser.parse_args()
+
+    response = None
+    if args.response:
+        with open(args.response, 'r') as f:
+            response = json.load(f)
+    server = MockOllamaServer(port=args.port, latency=args.latency, token_latency=args.token_latency, response=response,
+                              model=args.model, prompt_token_latency=args.prompt_token_latency,
+                              strict_models=args.strict_models)
+    print(f"Mock Ollama listening on {server.url} (OLLAMA_HOST={server.url})")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
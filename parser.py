@@ -1,13 +1,97 @@
 import ollama
+import asyncio
+import httpx
 import json
 import os
 import sys
-import difflib
+import time
+import weakref
 
+from cache import make_key, open_cache
+from matcher import get_matcher
+from metrics import JSON_REPAIRS, OLLAMA_IN_FLIGHT, stage
+from classifier import load_classifier
+from jsonstream import JSONFieldStream, repair_json
+from rules import RuleExtractor, covers, required_fields
+from pool import DEFAULT_CONCURRENCY, OllamaPool, parse_hosts
+from singleflight import SingleFlight
 
-MODEL_NAME = "mistral"
+
+MODEL_NAME = os.environ.get("OLLAMA_MODEL", "mistral")
 SCHEMA_FILE = "schema.json"
 
+# Ollama connection settings (None -> OLLAMA_HOST env var or localhost)
+OLLAMA_HOST = os.environ.get("OLLAMA_HOST")
+REQUEST_TIMEOUT = float(os.environ.get("OLLAMA_TIMEOUT", "300"))
+CONNECT_TIMEOUT = 5.0
+MAX_CONNECTIONS = int(os.environ.get("OLLAMA_MAX_CONNECTIONS", "32"))
+# Several hosts serving the same model: "http://a:11434=8,http://b:11434" (=N caps a host's concurrency)
+OLLAMA_HOSTS = os.environ.get("OLLAMA_HOSTS")
+HOST_CONCURRENCY = int(os.environ.get("OLLAMA_HOST_CONCURRENCY", str(DEFAULT_CONCURRENCY)))
+
+# Model runtime settings. Changing num_ctx/num_thread between calls makes
+# Ollama reload the model, so these stay fixed for a given system prompt.
+KEEP_ALIVE = os.environ.get("OLLAMA_KEEP_ALIVE", "30m")
+NUM_CTX = int(os.environ["OLLAMA_NUM_CTX"]) if os.environ.get("OLLAMA_NUM_CTX") else None  # None -> auto
+NUM_THREAD = int(os.environ["OLLAMA_NUM_THREAD"]) if os.environ.get("OLLAMA_NUM_THREAD") else None
+NUM_PREDICT = int(os.environ["OLLAMA_NUM_PREDICT"]) if os.environ.get("OLLAMA_NUM_PREDICT") else None  # None -> from schema
+
+# Structured output: "schema" constrains decoding to a JSON schema built from
+# our schema (see output_format), "json" only to syntactically valid JSON
+OUTPUT_FORMAT = os.environ.get("OLLAMA_FORMAT", "schema")
+# Per-field output limits; they bound both the JSON schema and num_predict
+STRING_MAX_CHARS = 100
+ARRAY_MAX_ITEMS = 8
+ITEM_MAX_CHARS = 60
+# Enums the model must choose from; the others are extracted verbatim and fuzzy-matched afterwards
+CONSTRAINED_ENUMS = ("category",)
+
+# Who picks category/subcategory: the model ("llm") or the local classifier trained by generate_schema.py
+CATEGORY_MODE = os.environ.get("CATEGORY_MODE", "llm")
+
+# Automatic num_ctx: system prompt + room for a description + output budget
+INPUT_TOKEN_BUDGET = 512
+CTX_STEP = 1024
+CHARS_PER_TOKEN = 3.0  # conservative estimate until Ollama reports real counts
+
+# Few-shot example shown in the system prompt
+EXAMPLE_INPUT = ("Bright, big orange and black fedora made with quality polyester. Brand: HatMaster. "
+                 "Dimensions: 10x10x5 inches. Weight: 0.5 lbs. Features: Waterproof, sun protection.")
+EXAMPLE_OUTPUT = {
+    "category": "clothing, shoes & jewelry",
+    "subcategory": "hats",
+    "brand": "HatMaster",
+    "color": "orange",
+    "material": "polyester",
+    "size": "xl",
+    "dimensions": "10x10x5 inches",
+    "weight": "0.5 lbs",
+    "features": ["Waterproof", "sun protection"],
+}
+
+MAX_PROMPTS = 256  # memoized per-field-subset prompts
+
+# Packed mode (parse_packed): several descriptions share one chat call and one system prompt evaluation
+PACK_CTX = int(os.environ.get("OLLAMA_PACK_CTX", "8192"))  # num_ctx of a packed call; packs are sized to fit it
+PACK_MAX_ITEMS = int(os.environ.get("PACK_MAX_ITEMS", "16"))
+PACK_ITEM_TOKENS = 8  # per-item JSON wrapping and id, in and out
+PACKED_INSTRUCTIONS = """
+Packed Input:
+The user message is a JSON array of products, each {"id": <number>, "text": <description>}.
+Extract the fields above from EACH product's text separately; never mix up products.
+Return {"items": [...]} with one object per product, in the same order, each with the product's "id" and its fields.
+"""
+
+_client = None
+_pool = None
+_pool_configured = False
+# Identical descriptions parsed at the same time share one model call
+_inflight = SingleFlight()
+_prompts = {}  # (id(schema), fields) -> (schema, prompt)
+_decodings = {}  # (id(schema), fields) -> (schema, {'format': ..., 'num_predict': ...})
+_async_clients = weakref.WeakKeyDictionary()  # event loop -> AsyncClient
+_context_sizes = {}  # id(schema) -> (schema, (single-call num_ctx, packed num_ctx))
+
 def load_schema(filepath):
     """Loads the schema from a JSON file."""
     if not os.path.exists(filepath):
@@ -21,9 +105,14 @@ def load_schema(filepath):
         print(f"Error decoding JSON schema: {e}")
         sys.exit(1)
 
-def construct_prompt(schema):
-    """Constructs the system prompt based on the schema."""
+def construct_prompt(schema, fields=None):
+    """
+    Constructs the system prompt based on the schema.
+    If `fields` is given, only those properties are requested from the model.
+    """
     properties = schema.get("properties", {})
+    if fields is not None:
+        properties = {key: value for key, value in properties.items() if key in fields}
     inference_rules = schema.get("inference_rules", [])
     
     # Separate Category from others for Hybrid Prompting
@@ -53,6 +142,27 @@ def construct_prompt(schema):
     
     # Inject Category List
     cat_list_str = "\n".join([f"- {c}" for c in category_values])
+    categories_str = ""
+    if "category" in properties:
+        categories_str = f"""
+Valid Categories (Choose exactly one for 'category'):
+{cat_list_str}
+"""
+
+    # Rules about fields that are not requested are left out
+    rules = ["Return JSON only."]
+    if "category" in properties:
+        rules.append("For 'category', you MUST infer and choose the best fit from the 'Valid Categories' list above.")
+        rules.append("For ALL OTHER fields (brand, subcategory, etc.), extract the EXACT text found in the description. Do not guess.")
+    else:
+        rules.append("Extract the EXACT text found in the description. Do not guess.")
+    rules.append("If a property is not found, return null (or empty list for arrays).")
+    if "features" in properties:
+        rules.append("'features' should be a list of short strings highlighting key product features.")
+    numbered_rules = "\n".join(f"{i}. {rule}" for i, rule in enumerate(rules, 1))
+
+    example = [(key, value) for key, value in EXAMPLE_OUTPUT.items() if fields is None or key in fields]
+    example_str = ",\n".join(f'  "{key}": {json.dumps(value)}' for key, value in example)
     
     prompt = f"""
 You are a helpful assistant that parses product descriptions into a JSON structure.
@@ -61,105 +171,837 @@ You must extract the following properties from the input text.
 
 Fields to Extract:
 {fields_str}
-
-Valid Categories (Choose exactly one for 'category'):
-{cat_list_str}
-
+{categories_str}
 Rules:
-1. Return JSON only.
-2. For 'category', you MUST infer and choose the best fit from the 'Valid Categories' list above.
-3. For ALL OTHER fields (brand, subcategory, etc.), extract the EXACT text found in the description. Do not guess.
-4. If a property is not found, return null (or empty list for arrays).
-5. 'features' should be a list of short strings highlighting key product features.
+{numbered_rules}
 
 Inference Rules:
 {rules_str}
 
-Example Input: "Bright, big orange and black fedora made with quality polyester. Brand: HatMaster. Dimensions: 10x10x5 inches. Weight: 0.5 lbs. Features: Waterproof, sun protection."
+Example Input: "{EXAMPLE_INPUT}"
 Example Output:
 {{
-  "category": "clothing, shoes & jewelry",
-  "subcategory": "hats",
-  "brand": "HatMaster",
-  "color": "orange", 
-  "material": "polyester",
-  "size": "xl",
-  "dimensions": "10x10x5 inches",
-  "weight": "0.5 lbs",
-  "features": ["Waterproof", "sun protection"]
+{example_str}
 }}
 """
     return prompt
 
+def prompt_for(schema, fields):
+    """construct_prompt(schema, fields), memoized so repeated subsets send identical bytes."""
+    key = (id(schema), tuple(fields))
+    entry = _prompts.get(key)
+    # The stored schema reference keeps id(schema) from being reused
+    if entry is None or entry[0] is not schema:
+        if len(_prompts) >= MAX_PROMPTS:
+            _prompts.clear()
+        entry = _prompts[key] = (schema, construct_prompt(schema, fields))
+    return entry[1]
+
+def forget_schema(schema):
+    """Drops the memoized prompts and decodings of a schema that is no longer served."""
+    for memo in (_prompts, _decodings):
+        for key, entry in list(memo.items()):
+            if key[0] == id(schema) and entry[0] is schema:
+                memo.pop(key, None)
+    entry = _context_sizes.get(id(schema))
+    if entry is not None and entry[0] is schema:
+        _context_sizes.pop(id(schema), None)
+
+def _requested(schema, fields):
+    properties = schema.get("properties", {})
+    if fields is None:
+        return properties
+    return {key: value for key, value in properties.items() if key in fields}
+
+def output_format(schema, fields=None):
+    """
+    JSON schema for Ollama's `format`, so decoding can only produce an
+    object with exactly the requested fields. Constrained enums (category)
+    must be one of their values, arrays are lists of strings, and every
+    value is length-capped. Strings and enums may be null, as the prompt
+    allows; an array with nothing to list is empty rather than null.
+    """
+    properties = {}
+    for key, prop in _requested(schema, fields).items():
+        prop_type = prop.get("type")
+        if prop_type == "enum" and key in CONSTRAINED_ENUMS and prop.get("values"):
+            properties[key] = {"enum": list(prop["values"]) + [None]}
+        elif prop_type == "array":
+            properties[key] = {"type": "array", "items": {"type": "string", "maxLength": ITEM_MAX_CHARS},
+                               "maxItems": prop.get("maxItems", ARRAY_MAX_ITEMS)}
+        else:
+            properties[key] = {"type": ["string", "null"], "maxLength": prop.get("maxLength", STRING_MAX_CHARS)}
+    return {"type": "object", "properties": properties, "required": list(properties)}
+
+def output_budget(schema, fields=None):
+    """num_predict for an answer with the requested fields at their output_format limits."""
+    def tokens(chars):
+        return int(chars / CHARS_PER_TOKEN) + 1
+
+    budget = 4  # braces and whitespace
+    for key, prop in _requested(schema, fields).items():
+        budget += tokens(len(key)) + 4  # quotes, colon, comma, newline
+        prop_type = prop.get("type")
+        if prop_type == "enum" and key in CONSTRAINED_ENUMS and prop.get("values"):
+            budget += tokens(max(len(v) for v in prop["values"])) + 2
+        elif prop_type == "array":
+            budget += prop.get("maxItems", ARRAY_MAX_ITEMS) * (tokens(ITEM_MAX_CHARS) + 3) + 2
+        else:
+            budget += tokens(prop.get("maxLength", STRING_MAX_CHARS)) + 2
+    return budget
+
+def decoding_for(schema, fields=None):
+    """Memoized {'format', 'num_predict', 'num_ctx'} for a schema and field subset (None = all fields)."""
+    key = (id(schema), tuple(fields) if fields is not None else None)
+    entry = _decodings.get(key)
+    if entry is None or entry[0] is not schema:
+        if len(_decodings) >= MAX_PROMPTS:
+            _decodings.clear()
+        decoding = {
+            'format': output_format(schema, fields) if OUTPUT_FORMAT == "schema" else 'json',
+            'num_predict': NUM_PREDICT or output_budget(schema, fields),
+            'num_ctx': context_sizes(schema)[0],
+        }
+        entry = _decodings[key] = (schema, decoding)
+    return entry[1]
+
+def normalize_field(key, value, schema):
+    """Normalizes one extracted value; enum values are fuzzy-matched against the schema."""
+    prop_def = schema.get("properties", {}).get(key)
+    if prop_def is None or prop_def.get("type") != "enum" or not value:
+        return value
+
+    matcher = get_matcher(schema)
+    # Exact hit, then indexed fuzzy match (soft validation keeps misses)
+    # Handle list vs string
+    if isinstance(value, list):
+        new_list = []
+        for item in value:
+             matched = matcher.normalize(key, item)
+             if matched: new_list.append(matched)
+        # Ensure unique
+        return list(set(new_list)) if new_list else None
+    return matcher.normalize(key, value)
+
 def validate_and_normalize(result, schema):
     """Normalizes extracted values against schema enums using fuzzy matching."""
     if not result:
         return result
         
     properties = schema.get("properties", {})
-    
     for key, value in result.items():
-        if key not in properties:
-             continue
-             
-        prop_def = properties[key]
-        if prop_def.get("type") == "enum" and value:
-            valid_values = prop_def.get("values", [])
-            
-            # Helper to match single value
-            def match_val(v):
-                if not v: return None
-                v = str(v).lower().strip()
-                if v in valid_values:
-                    return v # Exact match
-                # Fuzzy match
-                matches = difflib.get_close_matches(v, valid_values, n=1, cutoff=0.6)
-                if matches:
-                    return matches[0]
-                return v # Return original value if no match found (soft validation)
-            
-            # Handle list vs string
-            if isinstance(value, list):
-                new_list = []
-                for item in value:
-                     matched = match_val(item)
-                     if matched: new_list.append(matched)
-                # Ensure unique
-                result[key] = list(set(new_list)) if new_list else None
-            else:
-                result[key] = match_val(value)
+        if key in properties:
+            result[key] = normalize_field(key, value, schema)
                 
     return result
 
-def parse_description(description, system_prompt, schema):
+def get_client():
+    """Shared, connection-pooled sync Ollama client."""
+    global _client
+    if _client is None:
+        _client = ollama.Client(**_client_options())
+    return _client
+
+def get_async_client():
+    """Shared, connection-pooled async Ollama client for the running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = ollama.AsyncClient(**_client_options())
+        _async_clients[loop] = client
+    return client
+
+async def close_async_client():
+    """Closes the running loop's async client (call on shutdown)."""
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client._client.aclose()
+    if _pool is not None:
+        await _pool.aclose()
+
+def configure_pool(hosts, share=1):
+    """
+    Routes all chat requests over an OllamaPool of `hosts` (a spec string
+    like OLLAMA_HOSTS, or a list of (host, max concurrency)). None or an
+    empty spec goes back to the single OLLAMA_HOST client. With `share`
+    processes using the same hosts, each gets 1/share of every host's cap
+    (rounded down), so together they stay within it. Only a cap smaller
+    than `share` is exceeded: every process still gets one slot.
+    """
+    global _pool, _pool_configured
+    if _pool is not None:
+        _pool.stop()
+    _pool_configured = True
+    if isinstance(hosts, str):
+        hosts = parse_hosts(hosts, HOST_CONCURRENCY)
+    if hosts and share > 1:
+        hosts = [(host, max(1, cap // share)) for host, cap in hosts]
+    options = {k: v for k, v in _client_options().items() if k != 'host'}
+    _pool = OllamaPool(hosts, options).start() if hosts else None
+    return _pool
+
+def get_pool():
+    """The active OllamaPool (built from OLLAMA_HOSTS on first use), or None for a single host."""
+    if not _pool_configured and OLLAMA_HOSTS:
+        configure_pool(OLLAMA_HOSTS)
+    return _pool
+
+def _chat(request):
+    pool = get_pool()
+    with OLLAMA_IN_FLIGHT.track():
+        return pool.chat(**request) if pool is not None else get_client().chat(**request)
+
+async def _chat_async(request):
+    pool = get_pool()
+    with OLLAMA_IN_FLIGHT.track():
+        if pool is not None:
+            return await pool.chat_async(**request)
+        return await get_async_client().chat(**request)
+
+async def _chat_stream(request):
+    pool = get_pool()
+    if pool is not None:
+        return pool.chat_stream(**request)
+    return await get_async_client().chat(**request, stream=True)
+
+def _client_options():
+    return {
+        'host': OLLAMA_HOST,
+        'timeout': httpx.Timeout(REQUEST_TIMEOUT, connect=CONNECT_TIMEOUT),
+        'limits': httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS),
+    }
+
+def estimate_tokens(text):
+    return int(len(text) / CHARS_PER_TOKEN) + 1
+
+def context_sizes(schema):
+    """
+    (num_ctx of a single call, num_ctx of a packed call) for a schema,
+    memoized. Ollama reloads the model whenever num_ctx changes, so both
+    are fixed per schema rather than sized per call, and every process
+    (API worker, CLI) computes the same ones. A single call gets room for
+    the full system prompt plus the input and whole-schema output budgets,
+    which covers every field subset. A packed call gets PACK_CTX, which
+    plan_packs fills. Both are rounded up to CTX_STEP; OLLAMA_NUM_CTX
+    overrides them.
+    """
+    entry = _context_sizes.get(id(schema))
+    if entry is None or entry[0] is not schema:
+        if NUM_CTX:
+            sizes = (NUM_CTX, NUM_CTX)
+        else:
+            single = _round_ctx(estimate_tokens(construct_prompt(schema)) + INPUT_TOKEN_BUDGET
+                                + (NUM_PREDICT or output_budget(schema)))
+            sizes = (single, max(_round_ctx(PACK_CTX), single))
+        entry = _context_sizes[id(schema)] = (schema, sizes)
+    return entry[1]
+
+def _round_ctx(tokens):
+    return -(-tokens // CTX_STEP) * CTX_STEP
+
+def ollama_options(decoding):
+    options = {
+        'num_ctx': decoding['num_ctx'],
+        'num_predict': decoding['num_predict'],
+    }
+    if NUM_THREAD:
+        options['num_thread'] = NUM_THREAD
+    return options
+
+def _chat_request(description, system_prompt, decoding, model=None):
+    """
+    Keyword arguments for client.chat, shared by the sync and async paths.
+    The system prompt is always the first message and is sent byte-for-byte
+    unchanged, so Ollama can reuse its KV cache for that prefix.
+    `decoding` (from decoding_for) gives the output format and token cap.
+    """
+    return {
+        'model': model or MODEL_NAME,
+        'messages': [
+            {
+                'role': 'system',
+                'content': system_prompt,
+            },
+            {
+                'role': 'user',
+                'content': description,
+            },
+        ],
+        'format': decoding['format'],
+        'options': ollama_options(decoding),
+        'keep_alive': KEEP_ALIVE,
+    }
+
+def _record_usage(response, num_ctx, stats):
+    """Copies Ollama's counters, and the num_ctx the call ran with, into `stats`."""
+    if stats is not None:
+        stats['cached'] = False
+        for field in ('prompt_eval_count', 'eval_count', 'total_duration', 'load_duration', 'prompt_eval_duration', 'eval_duration'):
+            stats[field] = response.get(field)
+        stats['num_ctx'] = num_ctx
+
+def _cache_lookup(cache, description, system_prompt, schema, decoding, model=None):
+    """
+    Returns (key, cached content or None). The key covers model, prompt,
+    schema and whitespace-normalized description; it also identifies
+    identical in-flight requests, so it is computed even without a cache.
+    """
+    key = _cache_key(description, system_prompt, schema, decoding, model)
+    return key, cache.get(key) if cache is not None else None
+
+async def _cache_lookup_async(cache, description, system_prompt, schema, decoding, model=None):
+    """_cache_lookup without blocking the event loop on the disk tier."""
+    key = _cache_key(description, system_prompt, schema, decoding, model)
+    return key, await cache.get_async(key) if cache is not None else None
+
+def _cache_key(description, system_prompt, schema, decoding, model=None):
+    # Only options that change the output belong in the key (not num_ctx/num_thread)
+    return make_key(model or MODEL_NAME, system_prompt, description, schema,
+                    {'format': OUTPUT_FORMAT, 'num_predict': decoding['num_predict']})
+
+def _shared_usage(shared, response, num_ctx, stats):
+    """_record_usage for the caller that ran the model; coalesced callers just say so."""
+    if not shared:
+        _record_usage(response, num_ctx, stats)
+    elif stats is not None:
+        stats['cached'] = False
+        stats['coalesced'] = True
+
+def coalescing_stats():
+    """How many parses shared an identical in-flight model call."""
+    return _inflight.stats()
+
+def select_fields(schema, fields):
+    """
+    Canonical form of a requested field subset: schema order without
+    duplicates, so equal subsets share prompts, decodings and cache
+    entries. None (or every field) means the whole schema. Raises
+    ValueError for an empty subset or names the schema doesn't have.
+    """
+    if fields is None:
+        return None
+    properties = schema.get("properties", {})
+    unknown = [key for key in fields if key not in properties]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    wanted = set(fields)
+    if not wanted:
+        raise ValueError("At least one field must be requested")
+    if len(wanted) == len(properties):
+        return None
+    return tuple(key for key in properties if key in wanted)
+
+def _prefill(description, system_prompt, schema, rules, stats, classifier=None, subset=None):
+    """
+    Runs the rule pre-extractor and the category classifier. Returns
+    (prefilled fields, fields still missing (None = all), system prompt
+    for them, finished result or None if the model is still needed).
+    A `subset` (see select_fields) limits all of that to those fields.
+    """
+    prefilled = {}
+    if rules is not None:
+        with stage(stats, 'rules'):
+            prefilled = rules.extract(description)
+    properties = schema.get("properties", {})
+    if subset is not None:
+        properties = {key: properties[key] for key in subset}
+        prefilled = {key: value for key, value in prefilled.items() if key in properties}
+    if classifier is not None:
+        with stage(stats, 'classify'):
+            predicted = classifier.predict(description)
+        # An exact rule hit beats the classifier
+        for key, value in predicted.items():
+            if key in properties:
+                prefilled.setdefault(key, value)
+    if not prefilled:
+        if subset is None:
+            return prefilled, None, system_prompt, None
+        return prefilled, list(subset), prompt_for(schema, subset), None
+    if stats is not None:
+        stats['prefilled'] = list(prefilled)
+
+    if rules is not None:
+        complete = rules.satisfies(prefilled, subset)
+    else:
+        complete = covers(prefilled, required_fields(schema), subset)
+    if complete:
+        if stats is not None:
+            stats['short_circuit'] = True
+        result = {key: prefilled.get(key, [] if prop.get("type") == "array" else None) for key, prop in properties.items()}
+        if stats is not None:
+            stats['raw_output'] = dict(result)
+        with stage(stats, 'validate'):
+            return prefilled, [], system_prompt, validate_and_normalize(result, schema)
+    missing = [key for key in properties if key not in prefilled]
+    return prefilled, missing, prompt_for(schema, missing), None
+
+def _decode(content, schema, cache=None, key=None, stats=None, prefilled=None, fields=None, background=False):
+    """
+    Decodes model output, caches it if it was fresh and valid JSON, then
+    normalizes. Output that is not valid JSON (cut off by num_predict,
+    wrapped in text) goes through repair_json instead of failing the parse,
+    but is not cached: a cut-off answer has lost fields, and the next
+    request for the description should get a fresh chance at a whole one.
+    With `fields`, anything else the model volunteered is dropped before
+    normalizing. Callers on an event loop pass `background` so the disk
+    write doesn't block it.
+    """
+    with stage(stats, 'decode'):
+        try:
+            raw_result = json.loads(content)
+        except ValueError:
+            raw_result = repair_json(content)
+            JSON_REPAIRS.inc(result="repaired" if raw_result is not None else "failed")
+            if raw_result is None:
+                raise
+            cache = None
+            if stats is not None:
+                stats['repaired'] = True
+    if cache is not None and key is not None:
+        cache.put(key, content, background=background)
+    if fields is not None:
+        raw_result = {key: value for key, value in raw_result.items() if key in fields}
+    if prefilled:
+        # Rule hits are exact; they win over the model
+        raw_result = {**raw_result, **prefilled}
+    if stats is not None:
+        # Pre-normalization output, so scoring can be re-run offline (see test_parser.py)
+        stats['raw_output'] = dict(raw_result)
+    # Post-process validation
+    with stage(stats, 'validate'):
+        return validate_and_normalize(raw_result, schema)
+
+def _complete(description, system_prompt, schema, cache, stats, prefilled, fields, model=None):
+    """The model half of parse_description: cache lookup, chat call, decode. Raises on errors."""
+    decoding = decoding_for(schema, fields)
+    with stage(stats, 'cache'):
+        key, content = _cache_lookup(cache, description, system_prompt, schema, decoding, model)
+    if content is not None:
+        if stats is not None:
+            stats['cached'] = True
+        return _decode(content, schema, stats=stats, prefilled=prefilled, fields=fields)
+
+    with stage(stats, 'prompt'):
+        request = _chat_request(description, system_prompt, decoding, model)
+    with stage(stats, 'ollama'):
+        response, shared = _inflight.do(key, lambda: _chat(request))
+    _shared_usage(shared, response, decoding['num_ctx'], stats)
+    return _decode(response['message']['content'], schema, cache, key, stats, prefilled, fields)
+
+async def _complete_async(description, system_prompt, schema, cache, stats, prefilled, fields, model=None):
+    decoding = decoding_for(schema, fields)
+    with stage(stats, 'cache'):
+        key, content = await _cache_lookup_async(cache, description, system_prompt, schema, decoding, model)
+    if content is not None:
+        if stats is not None:
+            stats['cached'] = True
+        return _decode(content, schema, stats=stats, prefilled=prefilled, fields=fields)
+
+    with stage(stats, 'prompt'):
+        request = _chat_request(description, system_prompt, decoding, model)
+    with stage(stats, 'ollama'):
+        response, shared = await _inflight.do_async(key, lambda: _chat_async(request))
+    _shared_usage(shared, response, decoding['num_ctx'], stats)
+    return _decode(response['message']['content'], schema, cache, key, stats, prefilled, fields, background=True)
+
+def parse_description(description, system_prompt, schema, cache=None, stats=None, rules=None, classifier=None,
+                      model=None, fields=None):
     """
     Sends the description to Ollama and returns the parsed JSON.
+    If a ResultCache is given, the raw model output is served from / stored in it.
+    Concurrent calls for the same model, prompt and (whitespace-normalized)
+    description share one model call; the extra callers get stats['coalesced'].
+    If a `stats` dict is given it receives Ollama's token counts and durations,
+    plus per-stage wall times (seconds) under stats['timings'].
+    If a RuleExtractor is given, fields it is sure of are filled without the
+    model, the model is asked only for the rest, and the call is answered
+    without the model when every required field was filled. A classifier
+    (see classifier.py) likewise pre-fills category and subcategory.
+    `model` overrides MODEL_NAME for this call (see cascade.py).
+    `fields` asks for just those properties: the model gets a smaller,
+    memoized prompt and output format, and only they are returned. An
+    unknown field name raises ValueError.
     """
+    subset = select_fields(schema, fields)
     try:
-        response = ollama.chat(
-            model=MODEL_NAME,
-            messages=[
-                {
-                    'role': 'system',
-                    'content': system_prompt,
-                },
-                {
-                    'role': 'user',
-                    'content': description,
-                },
-            ],
-            format='json',
-        )
-        content = response['message']['content']
-        raw_result = json.loads(content)
-        
-        # Post-process validation
-        return validate_and_normalize(raw_result, schema)
+        prefilled, fields, system_prompt, result = _prefill(description, system_prompt, schema, rules, stats, classifier,
+                                                            subset)
+        if result is not None:
+            return result
+        return _complete(description, system_prompt, schema, cache, stats, prefilled, fields, model)
+
+    except Exception as e:
+        print(f"Error communicating with Ollama: {e}")
+        return None
+
+async def parse_description_async(description, system_prompt, schema, cache=None, stats=None, rules=None,
+                                  classifier=None, model=None, fields=None):
+    """
+    Async version of parse_description. Does not block the event loop while
+    the model runs, so concurrent requests overlap on the Ollama server.
+    """
+    subset = select_fields(schema, fields)
+    try:
+        prefilled, fields, system_prompt, result = _prefill(description, system_prompt, schema, rules, stats, classifier,
+                                                            subset)
+        if result is not None:
+            return result
+        return await _complete_async(description, system_prompt, schema, cache, stats, prefilled, fields, model)
 
     except Exception as e:
         print(f"Error communicating with Ollama: {e}")
         return None
 
+async def warm_up_async(system_prompt, schema, model=None):
+    """
+    Gets the model ready for the first real request and returns the
+    seconds each step took. 'load' loads the model on every host, with the
+    num_ctx real requests use (a different one would reload it) and
+    KEEP_ALIVE. 'first_parse' runs one uncached parse of EXAMPLE_INPUT,
+    which evaluates the system prompt so Ollama can reuse that prefix and
+    fills the prompt, decoding and matcher memos. Raises if no host can
+    load the model.
+    """
+    timings = {}
+    decoding = decoding_for(schema)
+    request = {'model': model or MODEL_NAME, 'messages': [],
+               'options': ollama_options(decoding), 'keep_alive': KEEP_ALIVE}
+    started = time.perf_counter()
+    pool = get_pool()
+    if pool is None:
+        await get_async_client().chat(**request)
+    else:
+        loaded = await asyncio.gather(*(backend.async_client().chat(**request) for backend in pool.backends),
+                                      return_exceptions=True)
+        errors = [e for e in loaded if isinstance(e, Exception)]
+        for backend, error in zip(pool.backends, loaded):
+            if isinstance(error, Exception):
+                print(f"Warm-up: could not load {request['model']} on {backend.host}: {error}")
+        if len(errors) == len(loaded):
+            raise errors[0]
+    timings['load'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    await _complete_async(EXAMPLE_INPUT, system_prompt, schema, None, None, {}, None, model)
+    timings['first_parse'] = time.perf_counter() - started
+    return timings
+
+async def stream_description_async(description, system_prompt, schema, cache=None, stats=None, rules=None, classifier=None,
+                                   fields=None):
+    """
+    Streaming version of parse_description_async, `fields` included. An async generator of events:
+    {"event": "field", "field": key, "value": normalized value} as soon as each
+    top-level field is complete in the model's token stream (pre-filled and
+    cached fields come first), then {"event": "result", "result": {...}} with
+    the validated object, or {"event": "error", "error": message}.
+    stats['timings']['first_field'] is the time until the first field event.
+    """
+    started = time.perf_counter()
+    sent = set()
+
+    def field_event(key, value):
+        if stats is not None and not sent:
+            stats.setdefault('timings', {})['first_field'] = time.perf_counter() - started
+        sent.add(key)
+        return {"event": "field", "field": key, "value": normalize_field(key, value, schema)}
+
+    try:
+        subset = select_fields(schema, fields)
+        prefilled, fields, system_prompt, result = _prefill(description, system_prompt, schema, rules, stats, classifier,
+                                                            subset)
+        if result is not None:
+            for key, value in result.items():
+                yield field_event(key, value)
+            yield {"event": "result", "result": result}
+            return
+        for key, value in prefilled.items():
+            yield field_event(key, value)
+        decoding = decoding_for(schema, fields)
+
+        with stage(stats, 'cache'):
+            key, content = await _cache_lookup_async(cache, description, system_prompt, schema, decoding)
+        if content is not None:
+            if stats is not None:
+                stats['cached'] = True
+            result = _decode(content, schema, stats=stats, prefilled=prefilled, fields=fields)
+            for field, value in result.items():
+                if field not in sent:
+                    yield field_event(field, value)
+            yield {"event": "result", "result": result}
+            return
+
+        with stage(stats, 'prompt'):
+            request = _chat_request(description, system_prompt, decoding)
+        stream = JSONFieldStream()
+        with stage(stats, 'ollama'), OLLAMA_IN_FLIGHT.track():
+            async for part in await _chat_stream(request):
+                for field, value in stream.feed(part['message']['content'] or ''):
+                    # Rule hits win over the model, so they were already sent; fields nobody asked for are dropped
+                    if field not in sent and (fields is None or field in fields):
+                        yield field_event(field, value)
+                if part.get('done'):
+                    _record_usage(part, decoding['num_ctx'], stats)
+        yield {"event": "result", "result": _decode(stream.text, schema, cache, key, stats, prefilled, fields,
+                                                   background=True)}
+
+    except Exception as e:
+        print(f"Error communicating with Ollama: {e}")
+        yield {"event": "error", "error": str(e)}
+
+def packed_prompt(system_prompt):
+    """
+    System prompt for packed calls: the single-item prompt followed by the
+    packing rules, so it shares its cached prefix with single calls.
+    """
+    return system_prompt + PACKED_INSTRUCTIONS
+
+def plan_packs(items, system_prompt, schema):
+    """
+    Groups (index, description, ...) items into packs for parse_packed.
+    A pack holds as many items as fit in the context budget (NUM_CTX or
+    PACK_CTX): the packed prompt, plus each description and its full output
+    budget. It never holds more than PACK_MAX_ITEMS, so short listings pack
+    densely and long ones go a few at a time.
+    """
+    item_output = decoding_for(schema)['num_predict'] + PACK_ITEM_TOKENS
+    base = estimate_tokens(packed_prompt(system_prompt)) + PACK_ITEM_TOKENS
+    budget = NUM_CTX or PACK_CTX
+    packs, current, used = [], [], base
+    for item in items:
+        cost = estimate_tokens(item[1]) + PACK_ITEM_TOKENS + item_output
+        if current and (used + cost > budget or len(current) >= PACK_MAX_ITEMS):
+            packs.append(current)
+            current, used = [], base
+        current.append(item)
+        used += cost
+    if current:
+        packs.append(current)
+    return packs
+
+def _packed_request(pack, system_prompt, schema):
+    """client.chat kwargs for one pack. Items get ids 1..n in pack order."""
+    decoding = decoding_for(schema)
+    n = len(pack)
+    output_format = decoding['format']
+    if isinstance(output_format, dict):
+        item_format = {**output_format, "properties": {"id": {"type": "integer"}, **output_format["properties"]},
+                       "required": ["id", *output_format["required"]]}
+        output_format = {"type": "object", "required": ["items"], "properties": {
+            "items": {"type": "array", "items": item_format, "minItems": n, "maxItems": n}}}
+    num_predict = n * (decoding['num_predict'] + PACK_ITEM_TOKENS) + PACK_ITEM_TOKENS
+    options = {
+        'num_ctx': context_sizes(schema)[1],
+        'num_predict': num_predict,
+    }
+    if NUM_THREAD:
+        options['num_thread'] = NUM_THREAD
+    items = [{"id": i, "text": entry[1]} for i, entry in enumerate(pack, 1)]
+    return {
+        'model': MODEL_NAME,
+        'messages': [
+            {'role': 'system', 'content': packed_prompt(system_prompt)},
+            {'role': 'user', 'content': json.dumps(items, ensure_ascii=False)},
+        ],
+        'format': output_format,
+        'options': options,
+        'keep_alive': KEEP_ALIVE,
+    }
+
+def _split_packed(content, n, schema):
+    """
+    (per-item raw dicts of a packed answer in pack order, with None where an
+    item is missing or malformed; whether the answer needed repair_json).
+    """
+    repaired = False
+    try:
+        data = json.loads(content)
+    except ValueError:
+        data = repair_json(content)
+        repaired = True
+    items = data.get("items") if isinstance(data, dict) else None
+    properties = schema.get("properties", {})
+    by_id = {}
+    for item in items if isinstance(items, list) else ():
+        if isinstance(item, dict) and isinstance(item.get("id"), int):
+            item_id = item.pop("id")
+            if item_id not in by_id and any(key in properties for key in item):
+                by_id[item_id] = item
+    return [by_id.get(i) for i in range(1, n + 1)], repaired
+
+def _add_usage(stats, source):
+    for field in ('prompt_eval_count', 'eval_count', 'prompt_eval_duration', 'eval_duration'):
+        stats[field] = stats.get(field, 0) + (source.get(field) or 0)
+
+def _packed_setup(descriptions, system_prompt, schema, cache, rules, classifier, stats):
+    """
+    Answers what needs no model call (rules, cache). Returns the finished
+    [(index, result)] and the pending items as
+    (index, description, prefilled, missing fields, subset prompt, cache key).
+    """
+    stats.update({'items': len(descriptions), 'packed_calls': 0, 'packed_items': 0, 'single_calls': 0,
+                  'fallbacks': 0, 'short_circuits': 0, 'cached': 0})
+    packed = packed_prompt(system_prompt)
+    decoding = decoding_for(schema)
+    done, pending = [], []
+    for index, description in enumerate(descriptions):
+        try:
+            prefilled, fields, item_prompt, result = _prefill(description, system_prompt, schema, rules, None, classifier)
+            if result is not None:
+                stats['short_circuits'] += 1
+                done.append((index, result))
+                continue
+            # Packed answers are cached under the packed prompt, apart from single-call answers
+            key, content = _cache_lookup(cache, description, packed, schema, decoding)
+            if content is not None:
+                stats['cached'] += 1
+                done.append((index, _decode(content, schema, prefilled=prefilled)))
+                continue
+        except Exception as e:
+            print(f"Error parsing item {index}: {e}")
+            done.append((index, None))
+            continue
+        pending.append((index, description, prefilled, fields, item_prompt, key))
+    return done, pending
+
+def _packed_finish(pack, response, schema, cache, stats, background=False):
+    """
+    Splits and decodes a packed answer. Returns ([(index, result)], [items
+    to redo one by one]). `background` as in _decode.
+    """
+    stats['packed_calls'] += 1
+    _add_usage(stats, response)
+    raws, repaired = _split_packed(response['message']['content'], len(pack), schema)
+    if repaired:
+        cache = None  # the item that was cut off may have lost fields; don't keep any of them
+    done, retry = [], []
+    for entry, raw in zip(pack, raws):
+        index, _, prefilled, _, _, key = entry
+        try:
+            if raw is None:
+                raise ValueError("missing from packed answer")
+            done.append((index, _decode(json.dumps(raw), schema, cache, key, prefilled=prefilled,
+                                        background=background)))
+        except Exception:
+            retry.append(entry)
+    stats['packed_items'] += len(done)
+    return done, retry
+
+def _fallback(entry, schema, cache, stats, packed=True):
+    """
+    Parses one item with a regular single call: its packed answer was
+    unusable, or (packed=False) it was alone in its pack.
+    """
+    index, description, prefilled, fields, item_prompt, _ = entry
+    stats['fallbacks' if packed else 'single_calls'] += 1
+    usage = {}
+    try:
+        result = _complete(description, item_prompt, schema, cache, usage, prefilled, fields)
+    except Exception as e:
+        print(f"Error parsing item {index}: {e}")
+        result = None
+    _add_usage(stats, usage)
+    return index, result
+
+async def _fallback_async(entry, schema, cache, stats, packed=True):
+    index, description, prefilled, fields, item_prompt, _ = entry
+    stats['fallbacks' if packed else 'single_calls'] += 1
+    usage = {}
+    try:
+        result = await _complete_async(description, item_prompt, schema, cache, usage, prefilled, fields)
+    except Exception as e:
+        print(f"Error parsing item {index}: {e}")
+        result = None
+    _add_usage(stats, usage)
+    return index, result
+
+def parse_packed(descriptions, system_prompt, schema, cache=None, stats=None, rules=None, classifier=None):
+    """
+    Parses many descriptions with few chat calls. Descriptions are packed
+    into one call each up to the context budget (see plan_packs), and the
+    model answers {"items": [...]} keyed by item id. Each item is then split
+    out, cached and validated on its own. Items missing or malformed in the
+    packed answer, and whole packs whose call fails, fall back to single
+    calls. Rules and the classifier pre-fill fields as in parse_description.
+    An item alone in its pack is a plain single call, counted in
+    'single_calls' rather than 'fallbacks'. Returns results in input order
+    (None for items that failed). `stats` receives those counts and the
+    summed token counts and durations.
+    """
+    stats = {} if stats is None else stats
+    done, pending = _packed_setup(descriptions, system_prompt, schema, cache, rules, classifier, stats)
+    results = [None] * len(descriptions)
+    for pack in plan_packs(pending, system_prompt, schema):
+        retry = pack
+        if len(pack) > 1:
+            try:
+                response = _chat(_packed_request(pack, system_prompt, schema))
+                finished, retry = _packed_finish(pack, response, schema, cache, stats)
+                done.extend(finished)
+            except Exception as e:
+                print(f"Packed call for {len(pack)} items failed ({e}); parsing them one by one")
+        done.extend(_fallback(entry, schema, cache, stats, len(pack) > 1) for entry in retry)
+    for index, result in done:
+        results[index] = result
+    return results
+
+async def iter_packed_async(descriptions, system_prompt, schema, cache=None, stats=None, rules=None, classifier=None,
+                            concurrency=1):
+    """
+    Async version of parse_packed as a generator of (index, result), in
+    completion order, so a pack's items can be sent as soon as it returns.
+    Up to `concurrency` packs are in flight at once.
+    """
+    stats = {} if stats is None else stats
+    # Cache lookups may hit the disk tier; keep them off the event loop
+    done, pending = await asyncio.to_thread(_packed_setup, descriptions, system_prompt, schema, cache, rules,
+                                            classifier, stats)
+    for item in done:
+        yield item
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def run(pack):
+        async with semaphore:
+            finished, retry = [], pack
+            if len(pack) > 1:
+                try:
+                    response = await _chat_async(_packed_request(pack, system_prompt, schema))
+                    finished, retry = _packed_finish(pack, response, schema, cache, stats, background=True)
+                except Exception as e:
+                    print(f"Packed call for {len(pack)} items failed ({e}); parsing them one by one")
+            if retry:
+                finished += await asyncio.gather(*(_fallback_async(entry, schema, cache, stats, len(pack) > 1)
+                                                   for entry in retry))
+            return finished
+
+    tasks = [asyncio.ensure_future(run(pack)) for pack in plan_packs(pending, system_prompt, schema)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            for item in await next_done:
+                yield item
+    finally:
+        for task in tasks:
+            task.cancel()
+
+async def parse_packed_async(descriptions, system_prompt, schema, cache=None, stats=None, rules=None, classifier=None,
+                             concurrency=1):
+    """Async parse_packed: results in input order."""
+    results = [None] * len(descriptions)
+    async for index, result in iter_packed_async(descriptions, system_prompt, schema, cache, stats, rules, classifier,
+                                                 concurrency):
+        results[index] = result
+    return results
+
+def format_usage(stats):
+    """One-line summary of a `stats` dict for logs."""
+    if stats.get('short_circuit'):
+        return f"Usage: filled by rules ({', '.join(stats['prefilled'])})"
+    if stats.get('cached'):
+        return "Usage: served from cache"
+    if stats.get('coalesced'):
+        return "Usage: shared an identical in-flight request"
+    return (f"Usage: prompt_eval_count={stats.get('prompt_eval_count')} eval_count={stats.get('eval_count')} "
+            f"num_ctx={stats.get('num_ctx')}")
+
 def main():
     print("Ollama JSON Parser")
     print("------------------")
@@ -167,6 +1009,9 @@ def main():
     
     schema = load_schema(SCHEMA_FILE)
     system_prompt = construct_prompt(schema)
+    cache = open_cache()
+    rules = RuleExtractor(schema)
+    classifier = load_classifier() if CATEGORY_MODE == "classifier" else None
     # print("DEBUG: System Prompt:\n", system_prompt) # Uncomment for debugging
 
     while True:
@@ -179,10 +1024,12 @@ def main():
                 continue
 
             print("Parsing...")
-            result = parse_description(user_input, system_prompt, schema)
+            stats = {}
+            result = parse_description(user_input, system_prompt, schema, cache=cache, stats=stats, rules=rules, classifier=classifier)
             
             if result:
                 print(json.dumps(result, indent=2))
+                print(format_usage(stats))
             else:
                 print("Failed to parse input.")
                 
@@ -190,5 +1037,9 @@ def main():
             print("\nExiting...")
             break
 
+    print(f"Cache: {cache.stats()}")
+    print(f"Rules: {rules.stats()}")
+    cache.close()
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,333 @@
+import asyncio
+import threading
+import time
+import weakref
+
+import httpx
+import ollama
+
+from metrics import BACKEND_ERRORS, BACKEND_OUTSTANDING
+
+
+DEFAULT_CONCURRENCY = 4  # per-host cap when a host spec doesn't give one
+HEALTH_INTERVAL = 10.0  # seconds between health checks
+HEALTH_TIMEOUT = 2.0
+FAILURE_THRESHOLD = 3  # consecutive failures that open a host's circuit
+COOLDOWN = 15.0  # seconds an open circuit rejects traffic before a trial request
+LATENCY_ALPHA = 0.2  # EWMA weight of the newest latency sample
+SLOT_WAIT = 1.0  # longest wait for a freed slot before re-checking cooldowns and health
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+def parse_hosts(spec, default_concurrency=DEFAULT_CONCURRENCY):
+    """'http://a:11434=8, http://b:11434' -> [('http://a:11434', 8), ('http://b:11434', default)]"""
+    hosts = []
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        host, _, cap = item.rpartition("=") if "=" in item else (item, "", "")
+        hosts.append((host.strip(), int(cap) if cap else default_concurrency))
+    return hosts
+
+
+def is_retryable(error):
+    """Errors that say nothing about the request itself, so another host may succeed."""
+    if isinstance(error, ollama.ResponseError):
+        return error.status_code >= 500 or error.status_code < 0
+    return isinstance(error, (ConnectionError, httpx.TransportError, TimeoutError))
+
+
+def _wake(waiter):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class Backend:
+    """One Ollama host: its clients, in-flight count, latency estimate and circuit state."""
+
+    def __init__(self, host, max_concurrency, client_options=None):
+        self.host = host
+        self.max_concurrency = max_concurrency
+        self.client_options = client_options or {}
+        self.outstanding = 0
+        self.latency = None  # EWMA of successful request seconds
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.healthy = True
+        self._client = None
+        self._async_clients = weakref.WeakKeyDictionary()  # event loop -> AsyncClient
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = ollama.Client(host=self.host, **self.client_options)
+        return self._client
+
+    def async_client(self):
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = self._async_clients[loop] = ollama.AsyncClient(host=self.host, **self.client_options)
+        return client
+
+    def available(self, now):
+        """Whether the router may send this host a request right now."""
+        if not self.healthy or self.outstanding >= self.max_concurrency:
+            return False
+        if self.state == OPEN:
+            if now - self.opened_at < COOLDOWN:
+                return False
+            self.state = HALF_OPEN
+        # Half-open: one trial request at a time
+        return self.state != HALF_OPEN or self.outstanding == 0
+
+    def cost(self, default_latency):
+        """Expected wait if routed here: queue depth times typical latency."""
+        return (self.outstanding + 1) * (self.latency or default_latency)
+
+    def stats(self):
+        return {"host": self.host, "state": self.state, "healthy": self.healthy, "outstanding": self.outstanding,
+                "max_concurrency": self.max_concurrency, "requests": self.requests, "failures": self.failures,
+                "latency_ms": round(self.latency * 1000, 1) if self.latency else None}
+
+
+class OllamaPool:
+    """
+    Routes chat requests over several Ollama hosts serving the same model.
+
+    Each request goes to the available host with the lowest expected wait,
+    (outstanding + 1) x latency EWMA. With equal latencies this is least
+    outstanding requests. A host never gets more than its concurrency cap;
+    when all are full, callers wait for a slot. Connection errors, timeouts
+    and 5xx answers fail over to another host. After FAILURE_THRESHOLD
+    consecutive failures a host's circuit opens for COOLDOWN seconds, then
+    one trial request decides whether it closes again. A background thread
+    checks /api/tags on every host and takes unreachable hosts out of the
+    rotation until they answer again.
+    """
+
+    def __init__(self, hosts, client_options=None, health_interval=HEALTH_INTERVAL):
+        self.backends = [Backend(host, cap, client_options) for host, cap in hosts]
+        if not self.backends:
+            raise ValueError("OllamaPool needs at least one host")
+        self.health_interval = health_interval
+        self._cond = threading.Condition()
+        self._async_waiters = []  # (loop, future) of async callers waiting for a slot
+        self._health_thread = None
+        self._stopped = threading.Event()
+
+    # Routing
+
+    def _pick(self, exclude):
+        """Reserves a slot on the best available host, or returns None. Caller holds the lock."""
+        now = time.monotonic()
+        known = [b.latency for b in self.backends if b.latency]
+        default_latency = sum(known) / len(known) if known else 1.0
+        candidates = [b for b in self.backends if b not in exclude and b.available(now)]
+        if not candidates:
+            return None
+        backend = min(candidates, key=lambda b: b.cost(default_latency))
+        backend.outstanding += 1
+        BACKEND_OUTSTANDING.set(backend.outstanding, host=backend.host)
+        return backend
+
+    def _usable(self, exclude):
+        """Whether any host outside `exclude` could take a request once it has a free slot."""
+        now = time.monotonic()
+        return any(b not in exclude and b.healthy and (b.state != OPEN or now - b.opened_at >= COOLDOWN)
+                   for b in self.backends)
+
+    def acquire(self, exclude=()):
+        """Blocks until a host has a free slot; None if every other host is down."""
+        with self._cond:
+            while True:
+                backend = self._pick(exclude)
+                if backend is not None or not self._usable(exclude):
+                    return backend
+                self._cond.wait(timeout=SLOT_WAIT)
+
+    async def acquire_async(self, exclude=()):
+        """acquire() for coroutines: waits on a future that release() resolves, not on the lock."""
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._cond:
+                backend = self._pick(exclude)
+                if backend is not None or not self._usable(exclude):
+                    return backend
+                waiter = loop.create_future()
+                self._async_waiters.append((loop, waiter))
+            try:
+                await asyncio.wait_for(waiter, SLOT_WAIT)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                with self._cond:
+                    if (loop, waiter) in self._async_waiters:
+                        self._async_waiters.remove((loop, waiter))
+
+    def _notify(self, wake_all=False):
+        """Wakes threads and coroutines waiting for a slot. Caller holds the lock."""
+        if wake_all:
+            self._cond.notify_all()
+        else:
+            self._cond.notify()
+        waiters, self._async_waiters = self._async_waiters, []
+        for loop, waiter in waiters:
+            try:
+                loop.call_soon_threadsafe(_wake, waiter)
+            except RuntimeError:
+                pass  # that loop is closed
+
+    def release(self, backend, started, error=None):
+        """Frees the slot and records the outcome for routing and circuit breaking."""
+        with self._cond:
+            backend.outstanding -= 1
+            backend.requests += 1
+            BACKEND_OUTSTANDING.set(backend.outstanding, host=backend.host)
+            if error is None:
+                elapsed = time.monotonic() - started
+                backend.latency = elapsed if backend.latency is None else \
+                    (1 - LATENCY_ALPHA) * backend.latency + LATENCY_ALPHA * elapsed
+                backend.consecutive_failures = 0
+                backend.state = CLOSED
+            elif is_retryable(error):
+                backend.failures += 1
+                backend.consecutive_failures += 1
+                BACKEND_ERRORS.inc(host=backend.host)
+                if backend.state == HALF_OPEN or backend.consecutive_failures >= FAILURE_THRESHOLD:
+                    if backend.state != OPEN:
+                        print(f"Ollama host {backend.host} failing; circuit open for {COOLDOWN:.0f}s")
+                    backend.state = OPEN
+                    backend.opened_at = time.monotonic()
+            self._notify()
+
+    # Requests
+
+    def chat(self, **kwargs):
+        """client.chat on the best host, failing over on host errors."""
+        tried = []
+        while True:
+            backend = self.acquire(tried)
+            if backend is None:
+                raise ConnectionError(f"No Ollama host available (tried {', '.join(b.host for b in tried) or 'none'})")
+            started = time.monotonic()
+            try:
+                response = backend.client.chat(**kwargs)
+            except Exception as e:
+                self.release(backend, started, e)
+                if not is_retryable(e):
+                    raise
+                print(f"Ollama host {backend.host} failed ({e}); failing over")
+                tried.append(backend)
+                continue
+            except BaseException:
+                # Cancelled or interrupted mid-call; free the slot without blaming the host
+                self.release(backend, started, asyncio.CancelledError())
+                raise
+            self.release(backend, started)
+            return response
+
+    async def chat_async(self, **kwargs):
+        """Async client.chat on the best host, failing over on host errors. Not for stream=True."""
+        tried = []
+        while True:
+            backend = await self.acquire_async(tried)
+            if backend is None:
+                raise ConnectionError(f"No Ollama host available (tried {', '.join(b.host for b in tried) or 'none'})")
+            started = time.monotonic()
+            try:
+                response = await backend.async_client().chat(**kwargs)
+            except Exception as e:
+                self.release(backend, started, e)
+                if not is_retryable(e):
+                    raise
+                print(f"Ollama host {backend.host} failed ({e}); failing over")
+                tried.append(backend)
+                continue
+            except BaseException:
+                # Cancelled or interrupted mid-call; free the slot without blaming the host
+                self.release(backend, started, asyncio.CancelledError())
+                raise
+            self.release(backend, started)
+            return response
+
+    async def chat_stream(self, **kwargs):
+        """
+        Streamed chat parts from the best host. Fails over only until the
+        first part arrives; after that an error ends the stream.
+        """
+        tried = []
+        while True:
+            backend = await self.acquire_async(tried)
+            if backend is None:
+                raise ConnectionError(f"No Ollama host available (tried {', '.join(b.host for b in tried) or 'none'})")
+            started = time.monotonic()
+            received = False
+            try:
+                async for part in await backend.async_client().chat(**kwargs, stream=True):
+                    received = True
+                    yield part
+            except Exception as e:
+                self.release(backend, started, e)
+                if received or not is_retryable(e):
+                    raise
+                print(f"Ollama host {backend.host} failed ({e}); failing over")
+                tried.append(backend)
+                continue
+            except BaseException:
+                # Consumer went away (cancelled / closed); free the slot without blaming the host
+                self.release(backend, started, asyncio.CancelledError())
+                raise
+            self.release(backend, started)
+            return
+
+    async def aclose(self):
+        """Closes the running loop's async clients."""
+        loop = asyncio.get_running_loop()
+        for backend in self.backends:
+            client = backend._async_clients.pop(loop, None)
+            if client is not None:
+                await client._client.aclose()
+
+    # Health checks
+
+    def check_health(self):
+        """
+        One round of /api/tags probes. A host that answers goes back into
+        rotation, once its circuit (if open) has cooled down.
+        """
+        for backend in self.backends:
+            try:
+                httpx.get(f"{backend.host.rstrip('/')}/api/tags", timeout=HEALTH_TIMEOUT).raise_for_status()
+                healthy = True
+            except Exception:
+                healthy = False
+            with self._cond:
+                if healthy != backend.healthy:
+                    print(f"Ollama host {backend.host} is {'up' if healthy else 'down'}")
+                # An open circuit still waits out its cooldown: /api/tags can answer while chats fail
+                backend.healthy = healthy
+                self._notify(wake_all=True)
+
+    def start(self):
+        """Starts the background health-check thread (idempotent)."""
+        if self._health_thread is None and self.health_interval:
+            self._health_thread = threading.Thread(target=self._health_loop, daemon=True)
+            self._health_thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+
+    def _health_loop(self):
+        while not self._stopped.wait(self.health_interval):
+            self.check_health()
+
+    def stats(self):
+        with self._cond:
+            return [backend.stats() for backend in self.backends]
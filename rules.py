@@ -0,0 +1,152 @@
+import re
+
+from token_matcher import TokenMatcher
+
+
+# "Label: value" spellings that map onto schema fields (field names themselves always count)
+LABEL_ALIASES = {
+    "manufacturer": "brand",
+    "made by": "brand",
+    "colour": "color",
+    "dimension": "dimensions",
+    "product dimensions": "dimensions",
+    "item weight": "weight",
+    "materials": "material",
+    "product name": "product_name",
+    # Amazon-style "<Field> Name:" labels; also keeps them from reading as a bare "Name:"
+    "brand name": "brand",
+    "color name": "color",
+    "colour name": "color",
+    "size name": "size",
+    "material name": "material",
+}
+# A labelled value runs to the end of its sentence (a '.' inside '0.5 lbs' does not end it)
+VALUE_END = re.compile(r'[.;!?](?=\s|$)|\n|\s+-\s')
+MAX_VALUE_LENGTH = 80
+
+_UNIT_IN = r'(?:inches|inch|in\b|cm\b|mm\b|ft\b|feet|")'
+_NUMBER = r'\d+(?:\.\d+)?'
+# Unlabelled values we can recognise by shape. Only used when the text has exactly one.
+PATTERNS = {
+    "dimensions": re.compile(rf'\b{_NUMBER}\s*{_UNIT_IN}?\s*[x×]\s*{_NUMBER}\s*{_UNIT_IN}?(?:\s*[x×]\s*{_NUMBER})?\s*{_UNIT_IN}?', re.I),
+    "weight": re.compile(rf'\b{_NUMBER}\s*(?:lbs?|pounds?|oz|ounces?|kg|kilograms?|grams?|g)\b', re.I),
+    "price": re.compile(r'[$€£¥]\s?\d[\d,]*(?:\.\d{1,2})?'),
+}
+# Enum fields whose values are matched verbatim in the text (brand/subcategory are too noisy)
+ENUM_SCAN_FIELDS = ("category", "color", "material")
+
+
+def required_fields(schema):
+    """
+    Fields a parse must fill before it can skip the model, and that the
+    cascade expects to be non-empty: the schema's "required" list, else
+    every non-array field (lists of features are never pre-extracted).
+    """
+    if schema.get("required"):
+        return list(schema["required"])
+    return [key for key, prop in schema.get("properties", {}).items() if prop.get("type") != "array"]
+
+
+def covers(found, required, fields=None):
+    """
+    Whether `found` is complete enough to skip the model: every required
+    field, or with a `fields` subset every required field in it. A subset
+    without required fields needs all of its fields.
+    """
+    if fields is not None:
+        required = [field for field in required if field in fields]
+        if not required:
+            return all(field in found for field in fields)
+    return all(field in found for field in required)
+
+
+class RuleExtractor:
+    """
+    Deterministic pre-extractor for one schema.
+
+    `extract()` returns only the fields it is confident about: explicit
+    "Label: value" pairs, values recognisable by shape (dimensions,
+    weight, price) that occur exactly once, and enum values that appear
+    verbatim and unambiguously in the text. Everything is compiled once
+    per schema, so a call costs a few regex scans.
+    """
+
+    def __init__(self, schema):
+        self.schema = schema
+        properties = schema.get("properties", {})
+        self.fields = {key: prop for key, prop in properties.items() if prop.get("type") != "array"}
+
+        labels = {key.replace("_", " "): key for key in self.fields}
+        labels.update({alias: key for alias, key in LABEL_ALIASES.items() if key in self.fields})
+        self.labels = labels
+        self.label_pattern = re.compile(
+            r'(?<![\w-])(' + "|".join(re.escape(l) for l in sorted(labels, key=len, reverse=True)) + r')\s*:\s*', re.I)
+
+        self.patterns = {key: pattern for key, pattern in PATTERNS.items()
+                         if key in self.fields and self.fields[key].get("type") == "string"}
+        self.enums = {}
+        for key in ENUM_SCAN_FIELDS:
+            prop = self.fields.get(key)
+            if prop and prop.get("type") == "enum" and prop.get("values"):
+                values = {v.lower(): v for v in prop["values"] if v}
+                self.enums[key] = (TokenMatcher(list(values)), values)
+
+        self.required = required_fields(schema)
+        self.calls = 0
+        self.short_circuits = 0
+        self.fields_filled = 0
+
+    def labelled(self, text):
+        """Values of "Label: value" pairs, keyed by field (first occurrence wins)."""
+        found = {}
+        matches = list(self.label_pattern.finditer(text))
+        for i, match in enumerate(matches):
+            field = self.labels[match.group(1).lower()]
+            end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+            value = text[match.end():end]
+            stop = VALUE_END.search(value)
+            if stop:
+                value = value[:stop.start()]
+            value = value.strip(" \t,")
+            if value and len(value) <= MAX_VALUE_LENGTH and field not in found:
+                found[field] = value
+        return found
+
+    def extract(self, text):
+        """Confidently known fields of `text`, as {field: value}."""
+        found = self.labelled(text)
+        for field, pattern in self.patterns.items():
+            if field in found:
+                continue
+            hits = {m.group(0).strip() for m in pattern.finditer(text)}
+            if len(hits) == 1:
+                found[field] = hits.pop()
+        if self.enums:
+            lowered = text.lower()
+            for field, (matcher, values) in self.enums.items():
+                if field in found:
+                    continue
+                hits = matcher.find_set(lowered)
+                if len(hits) == 1:
+                    found[field] = values[hits.pop()]
+        self.calls += 1
+        self.fields_filled += len(found)
+        return found
+
+    def satisfies(self, found, fields=None):
+        """
+        True (and counted as a short circuit) when `found` covers the
+        required fields, or with `fields` that subset (see covers()).
+        """
+        if covers(found, self.required, fields):
+            self.short_circuits += 1
+            return True
+        return False
+
+    def stats(self):
+        return {
+            "calls": self.calls,
+            "short_circuits": self.short_circuits,
+            "short_circuit_rate": self.short_circuits / self.calls if self.calls else 0.0,
+            "fields_filled": self.fields_filled,
+        }
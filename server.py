@@ -0,0 +1,165 @@
+import gc
+import mmap
+import os
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import time
+
+import uvicorn
+
+
+BACKLOG = 2048
+RESTART_DELAY = 1.0  # seconds before replacing a worker that died...
+MAX_RESTART_DELAY = 60.0  # ...doubling, up to this, while replacements keep dying young
+STABLE_AFTER = 30.0  # seconds a worker must live for its slot's delay to reset
+POLL_INTERVAL = 0.1  # supervisor wake-ups while a restart is scheduled
+
+_worker = None  # (WorkerStates, worker number, shared directory) inside a forked worker
+
+
+class WorkerStates:
+    """One byte per worker in memory shared across fork: 1 once that worker is ready to serve."""
+
+    def __init__(self, workers):
+        self._states = mmap.mmap(-1, workers)
+
+    def set(self, number, ready):
+        self._states[number] = 1 if ready else 0
+
+    def counts(self):
+        """(ready workers, all workers)"""
+        return sum(self._states[:]), len(self._states)
+
+
+def mark_ready():
+    """Records that this worker is ready; a no-op outside a prefork server."""
+    if _worker is not None:
+        states, number, _ = _worker
+        states.set(number, True)
+
+
+def workers_ready():
+    """(ready workers, all workers) of this prefork server, or None for a single process."""
+    return _worker[0].counts() if _worker is not None else None
+
+
+def shared_dir():
+    """A scratch directory every worker of this prefork server can read and write, or None."""
+    return _worker[2] if _worker is not None else None
+
+
+def restart_delay(failures):
+    """Seconds to wait before the next replacement after `failures` workers in a row died young."""
+    return min(RESTART_DELAY * 2 ** max(failures - 1, 0), MAX_RESTART_DELAY)
+
+
+def bind_socket(host, port, backlog=BACKLOG):
+    """A listening TCP socket that forked workers inherit and accept on together."""
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def serve(create_app, preload, host="0.0.0.0", port=8000, workers=1, log_level="info"):
+    """
+    Runs `create_app(preload())` under uvicorn in `workers` processes.
+
+    `preload()` runs once, here, before any worker exists. Its result (the
+    compiled schema, matcher indexes, classifier) is then shared with
+    every worker through fork's copy-on-write pages instead of each worker
+    loading its own copy. gc.freeze() moves it out of the collector's reach,
+    so collections in the workers don't write to (and so copy) those pages.
+    `create_app` runs in each worker after the fork. Anything holding
+    sockets, threads, database handles or an event loop belongs there,
+    not in `preload`. Workers accept from one shared listening socket, and
+    one that dies is replaced after RESTART_DELAY. The delay doubles for
+    each replacement in that slot that dies within STABLE_AFTER, so a
+    worker that can't start doesn't spin. Each worker's readiness
+    (mark_ready) is kept in shared memory, so any worker can answer for
+    all of them (workers_ready), and `shared_dir()` is a directory they
+    share (removed on exit). SIGINT/SIGTERM stop them all gracefully.
+    """
+    shared = preload()
+    if workers <= 1:
+        uvicorn.run(create_app(shared), host=host, port=port, log_level=log_level)
+        return
+
+    sock = bind_socket(host, port)
+    gc.collect()
+    gc.freeze()
+    children = {}  # pid -> (worker number, started)
+    failures = [0] * workers  # per slot: replacements in a row that died young
+    restarts = {}  # worker number -> when to start its replacement
+    stopping = False
+    states = WorkerStates(workers)
+    directory = tempfile.mkdtemp(prefix="api-workers-")
+
+    def spawn(number):
+        states.set(number, False)
+        pid = os.fork()
+        if pid == 0:
+            global _worker
+            _worker = (states, number, directory)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            code = 0
+            try:
+                config = uvicorn.Config(create_app(shared), log_level=log_level)
+                uvicorn.Server(config).run(sockets=[sock])
+            except BaseException as e:
+                print(f"Worker {os.getpid()} failed: {e}", file=sys.stderr)
+                code = 1
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(code)
+        children[pid] = (number, time.monotonic())
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    for number in range(workers):
+        spawn(number)
+    print(f"Serving on {host}:{port} with {workers} workers (pids {', '.join(map(str, children))})")
+
+    while children or (restarts and not stopping):
+        now = time.monotonic()
+        for number, due in list(restarts.items()):
+            if due <= now and not stopping:
+                del restarts[number]
+                spawn(number)
+        try:
+            # Block until a worker exits, unless a restart is due before then
+            pid, status = os.waitpid(-1, os.WNOHANG if restarts else 0)
+        except ChildProcessError:
+            if not restarts:
+                break
+            pid = 0
+        if pid == 0:
+            time.sleep(POLL_INTERVAL)
+            continue
+        entry = children.pop(pid, None)
+        if entry is None or stopping:
+            continue
+        number, started = entry
+        failures[number] = 0 if time.monotonic() - started >= STABLE_AFTER else failures[number] + 1
+        delay = restart_delay(failures[number])
+        print(f"Worker {pid} exited with status {status}; starting a new one in {delay:.0f}s", file=sys.stderr)
+        restarts[number] = time.monotonic() + delay
+    sock.close()
+    shutil.rmtree(directory, ignore_errors=True)
@@ -0,0 +1,83 @@
+import asyncio
+import threading
+import weakref
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key into one execution.
+
+    The first caller for a key (the leader) runs the function; callers
+    that arrive while it is still running wait for it and get the same
+    result, or the same exception. Nothing is kept once the call finishes,
+    so this deduplicates only in-flight work; the result cache covers the
+    rest. Thread callers use `do`, coroutines use `do_async`. Each event
+    loop has its own set of in-flight calls.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}  # key -> _Call
+        self._tasks = weakref.WeakKeyDictionary()  # event loop -> {key: Task}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        """Returns (fn() result, shared) where `shared` is True if another caller ran it."""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+                leader = True
+            else:
+                self.coalesced += 1
+                leader = False
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    async def do_async(self, key, fn):
+        """
+        Awaits fn() once per key. The call runs as its own task, so a
+        cancelled caller, even the leader, doesn't cancel it for the others.
+        """
+        tasks = self._tasks.setdefault(asyncio.get_running_loop(), {})
+        task = tasks.get(key)
+        shared = task is not None
+        if shared:
+            self.coalesced += 1
+        else:
+            task = tasks[key] = asyncio.ensure_future(fn())
+            task.add_done_callback(lambda _: tasks.pop(key, None))
+            self.leaders += 1
+        return await asyncio.shield(task), shared
+
+    def stats(self):
+        calls = self.leaders + self.coalesced
+        return {
+            "calls": calls,
+            "coalesced": self.coalesced,
+            "coalesced_rate": round(self.coalesced / calls, 4) if calls else 0.0,
+        }
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
@@ -0,0 +1,81 @@
+class SpaceSaving:
+    """
+    Bounded-memory heavy-hitter counts (Space-Saving, with batched eviction).
+
+    Tracks at most 2 * capacity values. When that fills up, the least
+    frequent half is dropped and `floor` becomes the largest count dropped.
+    A value seen for the first time after that starts at `floor`, since it
+    may have been one of the dropped ones, so every count is an upper bound
+    that is off by at most its `errors` entry. Until the first eviction the
+    counts are exact. Any value occurring more than N / capacity times in N
+    updates is guaranteed to be kept. Sketches merge by adding counts, with
+    a missing value counted at the other sketch's floor, so byte ranges and
+    incremental runs can be counted separately and combined.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.counts = {}  # value -> estimated count (upper bound)
+        self.errors = {}  # value -> how much of that count may be overestimate
+        self.floor = 0
+        self.total = 0
+
+    def add(self, value, count=1):
+        self.total += count
+        current = self.counts.get(value)
+        if current is not None:
+            self.counts[value] = current + count
+            return
+        self.counts[value] = self.floor + count
+        if self.floor:
+            self.errors[value] = self.floor
+        if len(self.counts) > 2 * self.capacity:
+            self._prune(self.capacity)
+
+    def update(self, values):
+        """Counter.update for an iterable: adds one for each value."""
+        for value in values:
+            self.add(value)
+
+    def _prune(self, keep):
+        ranked = sorted(self.counts.items(), key=lambda item: (-item[1], item[0]))
+        if len(ranked) <= keep:
+            return
+        self.floor = max(self.floor, ranked[keep][1])
+        self.counts = dict(ranked[:keep])
+        self.errors = {value: error for value, error in self.errors.items() if value in self.counts}
+
+    def merge(self, other):
+        """Adds another sketch's counts into this one."""
+        for value in self.counts.keys() - other.counts.keys():
+            self.counts[value] += other.floor
+            if other.floor:
+                self.errors[value] = self.errors.get(value, 0) + other.floor
+        for value, count in other.counts.items():
+            if value in self.counts:
+                self.counts[value] += count
+                error = self.errors.get(value, 0) + other.errors.get(value, 0)
+            else:
+                self.counts[value] = self.floor + count
+                error = self.floor + other.errors.get(value, 0)
+            if error:
+                self.errors[value] = error
+        self.floor += other.floor
+        self.total += other.total
+        if len(self.counts) > 2 * self.capacity:
+            self._prune(self.capacity)
+        return self
+
+    def items(self):
+        return self.counts.items()
+
+    def __len__(self):
+        return len(self.counts)
+
+    def __getitem__(self, value):
+        return self.counts.get(value, self.floor)
+
+    @property
+    def exact(self):
+        """True while nothing has been evicted, i.e. every count is exact."""
+        return self.floor == 0
@@ -9,28 +9,71 @@ cleanup() {
 
 trap cleanup SIGINT SIGTERM
 
+# API worker processes: ./start.sh --workers 4 (or API_WORKERS=4 ./start.sh)
+WORKERS=${API_WORKERS:-1}
+OLLAMA_URL=${OLLAMA_URL:-http://localhost:11434}
+API_URL=${API_URL:-http://localhost:8000}
+READY_TIMEOUT=${READY_TIMEOUT:-300} # seconds to wait for the model to load
+while [ $# -gt 0 ]; do
+    case "$1" in
+        -w|--workers)
+            WORKERS="$2"
+            shift 2
+            ;;
+        *)
+            echo "Usage: $0 [--workers N]"
+            exit 1
+            ;;
+    esac
+done
+
+# Polls a URL until it answers 2xx; fails after $2 seconds
+wait_for() {
+    local url=$1 timeout=$2 waited=0
+    until curl -sf "$url" > /dev/null; do
+        if [ "$waited" -ge "$timeout" ]; then
+            return 1
+        fi
+        sleep 1
+        waited=$((waited + 1))
+    done
+}
+
 echo "Starting AI Product Parser Stack..."
 
 # 1. Check/Start Ollama
 if ! pgrep -x "ollama" > /dev/null; then
     echo "Starting Ollama..."
     ollama serve &
-    sleep 5 # Wait for Ollama to initialize
+    if ! wait_for "$OLLAMA_URL/api/tags" 60; then
+        echo "Ollama did not answer on $OLLAMA_URL within 60s"
+        cleanup
+    fi
 else
     echo "Ollama is already running."
 fi
 
-# Ensure Mistral model is available
-echo "Checking for Mistral model..."
-ollama pull mistral || true
+# Ensure every model the API calls is available: OLLAMA_MODEL (streaming, packed batches) and CASCADE_MODELS
+MODELS="${OLLAMA_MODEL:-mistral} ${CASCADE_MODELS//,/ }"
+for model in $MODELS; do
+    echo "Checking for model $model..."
+    ollama pull "$model" || true
+done
 
 # 2. Start Backend
-echo "Starting Backend (FastAPI)..."
+echo "Starting Backend (FastAPI, $WORKERS worker(s))..."
 source ./venv/bin/activate
 cd /home/neliq/Coding/json-ollama-parser
-nohup python api.py > api.log 2>&1 &
+nohup python api.py --workers "$WORKERS" > api.log 2>&1 &
 BACKEND_PID=$!
 echo "Backend running (PID: $BACKEND_PID), logs in api.log"
+# /readyz turns 200 once the model is loaded and a first parse has run
+echo "Waiting for the backend to warm up (model load)..."
+if wait_for "$API_URL/readyz" "$READY_TIMEOUT"; then
+    echo "Backend ready: $(curl -s "$API_URL/readyz")"
+else
+    echo "Backend not ready after ${READY_TIMEOUT}s; see api.log. Continuing anyway."
+fi
 
 # 3. Start Frontend
 echo "Starting Frontend (Next.js)..."
@@ -1,7 +1,15 @@
 import parser
+from artifact import load_or_compile
+from benchmark import percentile
+from cache import open_cache
+from classifier import CLASSIFIER_FILE, load_classifier
+from dataset import build_description
+from concurrent.futures import ThreadPoolExecutor
+import argparse
 import json
 import sys
 import os
+import time
 import csv
 import random
 import ast
@@ -12,6 +20,16 @@ sys.path.append('.')
 
 DATASET_FILE = 'archive/amazon-products.csv'
 SAMPLE_SIZE = 50
+SEED = 42
+CONCURRENCY = 4
+PREDICTIONS_FILE = 'eval_predictions.jsonl'
+# Prompt variant -> (rule pre-extraction, classifier for category/subcategory)
+VARIANTS = {
+    "full": (False, False),  # the whole schema prompt, model fills every field
+    "rules": (True, False),  # rules fill what they can, the model gets a field-subset prompt
+    "classifier": (True, True),  # as "rules", plus the local category classifier
+}
+DEFAULT_VARIANT = "classifier" if parser.CATEGORY_MODE == "classifier" else "rules"
 
 def normalize(text):
     if not text:
@@ -40,178 +58,307 @@ def parse_json_field(field_text):
         except:
              return None
 
-def main():
-    print(f"Loading dataset from {DATASET_FILE}...")
-    if not os.path.exists(DATASET_FILE):
-        print("Error: Dataset file not found.")
-        sys.exit(1)
+def subcategory_match(pred_subcategory, gt_subcategory):
+    """Fuzzy subcategory match: either contains the other."""
+    if gt_subcategory and pred_subcategory:
+        return pred_subcategory in gt_subcategory or gt_subcategory in pred_subcategory
+    return False
 
-    # Increase field size limit
-    csv.field_size_limit(sys.maxsize)
-
-    data = []
-    with open(DATASET_FILE, 'r', encoding='utf-8', errors='ignore') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            data.append(row)
-    
-    if not data:
-        print("Error: Dataset is empty.")
-        sys.exit(1)
+def ground_truth(row):
+    """The fields we score against, extracted from a dataset row."""
+    # Category: schema 'category' matches the ROOT (index 0), 'subcategory' the LEAF (last index)
+    parsed_cat = parse_json_field(row.get('categories'))
+    gt_category = ""
+    gt_subcategory = ""
+    if parsed_cat and isinstance(parsed_cat, list) and len(parsed_cat) > 0:
+        gt_category = normalize(parsed_cat[0])
+        gt_subcategory = normalize(parsed_cat[-1]) if len(parsed_cat) > 1 else gt_category
+    elif row.get('root_bs_category'):
+        gt_category = normalize(row.get('root_bs_category'))
+        gt_subcategory = gt_category  # fallback
 
-    print(f"Loaded {len(data)} records. Selecting {SAMPLE_SIZE} random samples...")
-    # Filter for rows that have at least some category info to be fail
-    valid_data = [d for d in data if d.get('categories') and d.get('categories') != 'null']
-    if len(valid_data) < SAMPLE_SIZE:
-        samples = valid_data
-    else:
-        samples = random.sample(valid_data, SAMPLE_SIZE)
+    # Color (from variations)
+    gt_colors = []
+    parsed_vars = parse_json_field(row.get('variations'))
+    if parsed_vars and isinstance(parsed_vars, list):
+        for v in parsed_vars:
+            if isinstance(v, dict) and v.get('name'):
+                gt_colors.append(normalize(v['name']))
 
-    # Load schema once
-    print("Loading schema...")
-    schema = parser.load_schema(parser.SCHEMA_FILE)
-    system_prompt = parser.construct_prompt(schema)
+    return {
+        "category": gt_category,
+        "subcategory": gt_subcategory,
+        "colors": gt_colors,
+        "brand": normalize(row.get('brand')),
+        "dimensions": row.get('product_dimensions'),
+        "weight": row.get('item_weight'),
+    }
 
-    correct_categories = 0
-    correct_colors = 0
-    correct_brands = 0
-    correct_subcategories = 0
-    found_dimensions = 0
-    total_samples = len(samples)
-
-    print("\n--- Starting Verification ---")
-
-    for i, row in enumerate(samples):
-        print(f"\nSample {i+1}/{total_samples}:")
-        
-        # Prepare input
-        # Amazon has title, description, features
-        description = (row.get('title') or '') + " " + (row.get('description') or '')
-        description = description.strip()
-        # Truncate if too long to save context window and time
-        if len(description) > 1000:
-            description = description[:1000] + "..."
-            
-        if not description:
-            print("Skipping empty description.")
-            continue
-            
-        # Ground Truth - Category
-        cat_raw = row.get('categories')
-        parsed_cat = parse_json_field(cat_raw)
-        gt_category = ""
-        gt_subcategory = "" # New variable for leaf
-        
-        if parsed_cat and isinstance(parsed_cat, list) and len(parsed_cat) > 0:
-            # Schema 'category' matches the ROOT (index 0)
-            gt_category = normalize(parsed_cat[0])
-            # Schema 'subcategory' matches the LEAF (last index) (if different)
-            if len(parsed_cat) > 1:
-                gt_subcategory = normalize(parsed_cat[-1])
+def reservoir_sample(filepath, k, seed):
+    """
+    k uniformly random rows with category info, in one streaming pass
+    (Algorithm R). The same file and seed always give the same rows.
+    Returns [(row number, row)] in file order.
+    """
+    rng = random.Random(seed)
+    sample = []
+    seen = 0
+    with open(filepath, 'r', encoding='utf-8', errors='ignore', newline='') as f:
+        for i, row in enumerate(csv.DictReader(f)):
+            # Only rows that have at least some category info can be scored fairly
+            if not row.get('categories') or row.get('categories') == 'null':
+                continue
+            if seen < k:
+                sample.append((i, row))
+            else:
+                j = rng.randint(0, seen)
+                if j < k:
+                    sample[j] = (i, row)
+            seen += 1
+    return sorted(sample, key=lambda item: item[0])
+
+def run_predictions(samples, model, variant, compiled, classifier, cache, concurrency):
+    """Runs the parser over the samples with `concurrency` requests in flight. Returns one record per sample."""
+    use_rules, use_classifier = VARIANTS[variant]
+    rules = compiled.rules if use_rules else None
+    clf = classifier if use_classifier else None
+
+    def predict(sample):
+        row_number, row = sample
+        description = build_description(row)
+        stats = {}
+        started = time.perf_counter()
+        result = parser.parse_description(description, compiled.system_prompt, compiled.schema, cache=cache,
+                                          stats=stats, rules=rules, classifier=clf,
+                                          model=model) if description else None
+        record = {
+            "type": "prediction",
+            "model": model,
+            "variant": variant,
+            "row": row_number,
+            "description": description,
+            "gt": ground_truth(row),
+            "raw": stats.get('raw_output') if result else None,
+            "latency": time.perf_counter() - started,
+        }
+        for field in ('prompt_eval_count', 'eval_count', 'prompt_eval_duration', 'eval_duration',
+                      'cached', 'coalesced', 'short_circuit', 'prefilled'):
+            if stats.get(field) is not None:
+                record[field] = stats[field]
+        return record
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return list(executor.map(predict, samples))
+
+def load_predictions(filepath):
+    """Saved run and prediction records, grouped by (model, variant) in file order."""
+    runs, groups = {}, {}
+    with open(filepath, 'r', encoding='utf-8') as f:
+        for line in f:
+            record = json.loads(line)
+            key = (record["model"], record["variant"])
+            if record["type"] == "run":
+                runs[key] = record
             else:
-                 gt_subcategory = gt_category
-                 
-        elif row.get('root_bs_category'):
-            gt_category = normalize(row.get('root_bs_category'))
-            gt_subcategory = gt_category # fallback
-
-        # Ground Truth - Color (from variations)
-        vars_raw = row.get('variations')
-        parsed_vars = parse_json_field(vars_raw)
-        gt_colors = []
-        if parsed_vars and isinstance(parsed_vars, list):
-             for v in parsed_vars:
-                 if isinstance(v, dict) and 'name' in v:
-                     name = v['name']
-                     if name:
-                         gt_colors.append(normalize(name))
-
-        # Ground Truth - New Fields
-        gt_brand = normalize(row.get('brand'))
-        gt_dimensions = row.get('product_dimensions')
-        gt_weight = row.get('item_weight')
-        gt_features_raw = parse_json_field(row.get('features'))
-        
-        print(f"Ground Truth -> Category: '{gt_category}', Subcategory: '{gt_category}', Brand: '{gt_brand}'")
-        
-        # Prediction
-        result = parser.parse_description(description, system_prompt, schema)
-        
+                groups.setdefault(key, []).append(record)
+    return runs, groups
+
+def score(records, schema, classifier=None, verbose=False):
+    """
+    Normalizes the saved raw outputs with the current schema and matcher,
+    scores them against ground truth and summarizes accuracy, latency and
+    token throughput. Needs no model, so it can be re-run at will.
+    """
+    total = len(records)
+    correct = {"category": 0, "subcategory": 0, "brand": 0, "color": 0}
+    found_dimensions = 0
+    failures = 0
+    clf_correct = {"category": 0, "subcategory": 0}
+    clf_seconds = 0.0
+
+    for record in records:
+        gt = record["gt"]
+        if classifier is not None:
+            started = time.perf_counter()
+            predicted = classifier.predict(record["description"])
+            clf_seconds += time.perf_counter() - started
+            clf_category = normalize(predicted.get('category'))
+            clf_subcategory = normalize(predicted.get('subcategory'))
+            if clf_category == gt["category"]: clf_correct["category"] += 1
+            if subcategory_match(clf_subcategory, gt["subcategory"]): clf_correct["subcategory"] += 1
+
+        result = parser.validate_and_normalize(dict(record["raw"]), schema) if record.get("raw") else None
         if not result:
-            print("FAILURE: Parser returned Error/None")
+            failures += 1
+            if verbose:
+                print(f"Row {record['row']}: FAILURE: Parser returned Error/None")
             continue
 
-        pred_category = ""
         pred_cat_list = normalize_output_list(result.get('category'))
-        if pred_cat_list:
-            pred_category = pred_cat_list[0]
-
+        pred_category = pred_cat_list[0] if pred_cat_list else ""
         pred_subcategory = normalize(result.get("subcategory"))
         pred_brand = normalize(result.get("brand"))
-        pred_dimensions = result.get("dimensions")
-        pred_weight = result.get("weight")
-        pred_features = result.get("features")
         pred_colors = normalize_output_list(result.get('color'))
-        
-        print(f"Prediction   -> Cat: '{pred_category}', Sub: '{pred_subcategory}', Brand: '{pred_brand}', Dim: {pred_dimensions}, Wgt: {pred_weight}")
-        
-        # Verification Logic
-        
+
         # 1. Category (Broad Match)
-        cat_match = (pred_category == gt_category)
-        if cat_match: correct_categories += 1
-        
+        cat_match = pred_category == gt["category"]
         # 2. Subcategory (Fuzzy Match)
-        # Check against pure GT subcategory
-        sub_match = False
-        if gt_subcategory and pred_subcategory:
-            if pred_subcategory in gt_subcategory or gt_subcategory in pred_subcategory:
-                sub_match = True
-        
+        sub_match = subcategory_match(pred_subcategory, gt["subcategory"])
         # 3. Brand (Fuzzy Match)
-        brand_match = False
-        if gt_brand and pred_brand:
-            if pred_brand in gt_brand or gt_brand in pred_brand:
-                brand_match = True
-        elif not gt_brand and not pred_brand:
-            brand_match = True
-            
+        if gt["brand"] and pred_brand:
+            brand_match = pred_brand in gt["brand"] or gt["brand"] in pred_brand
+        else:
+            brand_match = not gt["brand"] and not pred_brand
         # 4. Color (Intersection)
-        col_match = False
-        if not gt_colors and not pred_colors:
-             col_match = True
-        elif gt_colors and pred_colors:
-             for p in pred_colors:
-                 for g in gt_colors:
-                     if p in g or g in p:
-                         col_match = True
-                         break
-                 if col_match: break
-
-        if col_match: correct_colors += 1
-        if brand_match: correct_brands += 1
-        if sub_match: correct_subcategories += 1
-        
-        print(f"Matches -> Cat: {cat_match}, Sub: {sub_match}, Brand: {brand_match}, Color: {col_match}")
-        
+        if not gt["colors"] and not pred_colors:
+            col_match = True
+        else:
+            col_match = any(p in g or g in p for p in pred_colors for g in gt["colors"])
+
+        correct["category"] += cat_match
+        correct["subcategory"] += sub_match
+        correct["brand"] += brand_match
+        correct["color"] += col_match
         # Simple existence check for extensive fields
-        has_dims_pred = bool(pred_dimensions)
-        has_dims_gt = bool(gt_dimensions)
-        if has_dims_pred and has_dims_gt: found_dimensions += 1
-        print(f"Dimensions Found: {has_dims_pred} (GT: {has_dims_gt})")
-
-        
-    # We will just print per-line status rather than global stats for all new fields to avoid clutter,
-    # but let's accumulate Brand accuracy.
-    # ...
-
-
-    print("\n--- Results ---")
-    print(f"Category Accuracy:    {correct_categories}/{total_samples} ({correct_categories/total_samples*100:.1f}%)")
-    print(f"Subcategory Accuracy: {correct_subcategories}/{total_samples} ({correct_subcategories/total_samples*100:.1f}%)")
-    print(f"Brand Accuracy:       {correct_brands}/{total_samples} ({correct_brands/total_samples*100:.1f}%)")
-    print(f"Color Accuracy:       {correct_colors}/{total_samples} ({correct_colors/total_samples*100:.1f}%)")
-    print(f"Dimensions Found:     {found_dimensions}/{total_samples} (where GT existed)")
+        if result.get("dimensions") and gt["dimensions"]:
+            found_dimensions += 1
+
+        if verbose:
+            print(f"Row {record['row']}:")
+            print(f"  Ground Truth -> Category: '{gt['category']}', Subcategory: '{gt['subcategory']}', Brand: '{gt['brand']}'")
+            print(f"  Prediction   -> Cat: '{pred_category}', Sub: '{pred_subcategory}', Brand: '{pred_brand}', "
+                  f"Dim: {result.get('dimensions')}, Wgt: {result.get('weight')}")
+            print(f"  Matches      -> Cat: {cat_match}, Sub: {sub_match}, Brand: {brand_match}, Color: {col_match}")
+
+    # Latency percentiles cover every sample as a caller sees it (cache hits and
+    # short-circuits included, see 'cached'/'short_circuits'); token rates only model calls
+    latencies = sorted(r["latency"] for r in records)
+    model_calls = [r for r in records if r.get("eval_count")]
+    eval_seconds = sum(r.get("eval_duration") or 0 for r in model_calls) / 1e9
+    prompt_seconds = sum(r.get("prompt_eval_duration") or 0 for r in model_calls) / 1e9
+    eval_tokens = sum(r["eval_count"] for r in model_calls)
+    prompt_tokens = sum(r.get("prompt_eval_count") or 0 for r in model_calls)
+    return {
+        "samples": total,
+        "failures": failures,
+        "accuracy": {field: n / total if total else 0.0 for field, n in correct.items()},
+        "correct": correct,
+        "found_dimensions": found_dimensions,
+        "latency_ms": {f"p{pct}": round(percentile(latencies, pct) * 1000, 1) if latencies else None
+                       for pct in (50, 95, 99)},
+        "prompt_tokens": prompt_tokens,
+        "eval_tokens": eval_tokens,
+        "eval_tokens_per_sec": round(eval_tokens / eval_seconds, 1) if eval_seconds else None,
+        "prompt_tokens_per_sec": round(prompt_tokens / prompt_seconds, 1) if prompt_seconds else None,
+        "short_circuits": sum(1 for r in records if r.get("short_circuit")),
+        "fields_prefilled": sum(len(r.get("prefilled") or ()) for r in records),
+        "cached": sum(1 for r in records if r.get("cached")),
+        "classifier": {
+            "accuracy": {field: n / total if total else 0.0 for field, n in clf_correct.items()},
+            "correct": clf_correct,
+            "latency_ms": clf_seconds / total * 1000 if total else 0.0,
+        } if classifier is not None else None,
+    }
+
+def print_summary(model, variant, summary, run=None):
+    total = summary["samples"] or 1
+    correct = summary["correct"]
+    latency = summary["latency_ms"]
+    print(f"\n--- Results: {model} / {variant} ---")
+    print(f"Category Accuracy:    {correct['category']}/{summary['samples']} ({correct['category']/total*100:.1f}%)")
+    print(f"Subcategory Accuracy: {correct['subcategory']}/{summary['samples']} ({correct['subcategory']/total*100:.1f}%)")
+    print(f"Brand Accuracy:       {correct['brand']}/{summary['samples']} ({correct['brand']/total*100:.1f}%)")
+    print(f"Color Accuracy:       {correct['color']}/{summary['samples']} ({correct['color']/total*100:.1f}%)")
+    print(f"Dimensions Found:     {summary['found_dimensions']}/{summary['samples']} (where GT existed)")
+    print(f"Failures:             {summary['failures']}")
+    print(f"Parse Latency:        p50={latency['p50']} ms, p95={latency['p95']} ms, p99={latency['p99']} ms")
+    if run is not None:
+        print(f"Throughput:           {summary['samples']/run['seconds']:.2f} samples/sec at concurrency {run['concurrency']}")
+    print(f"Tokens:               prompt_eval_count={summary['prompt_tokens']}, eval_count={summary['eval_tokens']} "
+          f"({summary['prompt_tokens_per_sec']} prompt tok/s, {summary['eval_tokens_per_sec']} output tok/s)")
+    print(f"Rules:                {summary['short_circuits']}/{summary['samples']} answered without the model "
+          f"({summary['short_circuits']/total*100:.1f}%), {summary['fields_prefilled']} fields pre-filled")
+    if summary["cached"]:
+        print(f"Result Cache:         {summary['cached']} served from cache")
+    clf = summary["classifier"]
+    if clf is not None:
+        print(f"Classifier Category:  {clf['correct']['category']}/{summary['samples']} ({clf['accuracy']['category']*100:.1f}%)")
+        print(f"Classifier Subcat:    {clf['correct']['subcategory']}/{summary['samples']} ({clf['accuracy']['subcategory']*100:.1f}%)")
+        print(f"Classifier Latency:   {clf['latency_ms']:.3f} ms/sample")
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Measures parser accuracy, latency and token throughput against the dataset.")
+    arg_parser.add_argument('--input', default=DATASET_FILE, help="CSV dataset with ground truth columns")
+    arg_parser.add_argument('--samples', type=int, default=SAMPLE_SIZE, help="Rows to sample")
+    arg_parser.add_argument('--seed', type=int, default=SEED, help="Sampling seed (same seed, same rows)")
+    arg_parser.add_argument('--concurrency', type=int, default=CONCURRENCY, help="Parse requests in flight")
+    arg_parser.add_argument('--models', default=parser.MODEL_NAME, help="Comma-separated Ollama models to compare")
+    arg_parser.add_argument('--variants', default=DEFAULT_VARIANT,
+                            help=f"Comma-separated prompt variants to compare ({', '.join(VARIANTS)})")
+    arg_parser.add_argument('--schema', default=parser.SCHEMA_FILE)
+    arg_parser.add_argument('--predictions', default=PREDICTIONS_FILE, help="JSONL file raw model outputs are saved to")
+    arg_parser.add_argument('--rescore', action='store_true',
+                            help="Don't call the model; re-score the saved predictions with the current code")
+    arg_parser.add_argument('--cache', action='store_true', help="Use the result cache (latencies then include cache hits)")
+    arg_parser.add_argument('--verbose', action='store_true', help="Print every sample's prediction and matches")
+    args = arg_parser.parse_args()
+
+    variants = [v.strip() for v in args.variants.split(",") if v.strip()]
+    unknown = [v for v in variants if v not in VARIANTS]
+    if unknown:
+        arg_parser.error(f"unknown variant(s) {', '.join(unknown)}; choose from {', '.join(VARIANTS)}")
+
+    print("Loading schema...")
+    compiled = load_or_compile(args.schema)
+    # The classifier is scored side by side with the model whenever it exists;
+    # the "classifier" variant also uses it in place of the model for those fields
+    classifier = load_classifier() if os.path.exists(CLASSIFIER_FILE) else None
+
+    if not args.rescore:
+        if not os.path.exists(args.input):
+            print(f"Error: Dataset file '{args.input}' not found.")
+            sys.exit(1)
+        # Increase field size limit
+        csv.field_size_limit(sys.maxsize)
+        print(f"Sampling {args.samples} rows from {args.input} (seed {args.seed})...")
+        samples = reservoir_sample(args.input, args.samples, args.seed)
+        if not samples:
+            print("Error: Dataset is empty.")
+            sys.exit(1)
+
+        cache = open_cache() if args.cache else None
+        with open(args.predictions, 'w', encoding='utf-8') as out:
+            for model in [m.strip() for m in args.models.split(",") if m.strip()]:
+                for variant in variants:
+                    print(f"Running {len(samples)} samples: model={model} variant={variant} concurrency={args.concurrency}")
+                    started = time.perf_counter()
+                    records = run_predictions(samples, model, variant, compiled, classifier, cache, args.concurrency)
+                    run = {"type": "run", "model": model, "variant": variant, "seconds": time.perf_counter() - started,
+                           "concurrency": args.concurrency, "seed": args.seed, "samples": len(samples),
+                           "schema_version": compiled.version}
+                    for record in [run] + records:
+                        out.write(json.dumps(record) + "\n")
+                    out.flush()
+        if cache is not None:
+            cache.close()
+        print(f"Saved raw outputs to {args.predictions}; rerun with --rescore to score them again without the model.")
+    elif not os.path.exists(args.predictions):
+        print(f"Error: Predictions file '{args.predictions}' not found; run without --rescore first.")
+        sys.exit(1)
+
+    runs, groups = load_predictions(args.predictions)
+    for (model, variant), records in groups.items():
+        run = runs.get((model, variant))
+        if run is not None and run.get("schema_version") != compiled.version:
+            print(f"Note: {model}/{variant} was predicted with schema version {run.get('schema_version')}, "
+                  f"scoring with {compiled.version}")
+        print_summary(model, variant, score(records, compiled.schema, classifier, args.verbose), run)
+
+    pool = parser.get_pool()
+    if pool is not None and not args.rescore:
+        for host in pool.stats():
+            print(f"Host {host['host']}: {host['requests']} requests, {host['failures']} failed, "
+                  f"{host['latency_ms']} ms avg, {host['state']}")
 
 if __name__ == "__main__":
     main()
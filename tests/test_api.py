@@ -0,0 +1,59 @@
+import asyncio
+from types import SimpleNamespace
+
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+import api
+import metrics
+from api import RequestMetrics
+
+
+def test_streamed_request_is_timed_until_its_last_chunk():
+    app = FastAPI()
+    app.add_middleware(RequestMetrics)
+    in_flight = []
+
+    @app.get("/slow-stream")
+    async def slow_stream():
+        async def chunks():
+            for _ in range(3):
+                await asyncio.sleep(0.1)
+                in_flight.append(metrics.REQUESTS_IN_FLIGHT.value())
+                yield b"chunk\n"
+        return StreamingResponse(chunks())
+
+    labels = dict(method="GET", path="/slow-stream", status="200")
+    before = metrics.REQUEST_SECONDS.count(**labels)
+    with TestClient(app) as client:
+        assert client.get("/slow-stream").text == "chunk\n" * 3
+
+    assert metrics.REQUEST_SECONDS.count(**labels) == before + 1
+    assert metrics.REQUEST_SECONDS._values[metrics.REQUEST_SECONDS._key(labels)][1] >= 0.3
+    # Still counted in flight while the body was being sent, released after
+    assert min(in_flight) >= 1 and metrics.REQUESTS_IN_FLIGHT.value() == 0
+
+
+def test_get_stream_accepts_a_field_subset(monkeypatch):
+    schema = {"properties": {"brand": {"type": "string"}, "color": {"type": "string"}, "weight": {"type": "string"}}}
+    service = SimpleNamespace(store=SimpleNamespace(current=SimpleNamespace(schema=schema, version="v1")),
+                              enricher=None)
+    seen = []
+
+    async def stream_events(service, compiled, description, callback_url, fields):
+        seen.append(fields)
+        yield "event: result\ndata: {}\n\n"
+
+    monkeypatch.setattr(api, "stream_events", stream_events)
+    app = FastAPI()
+    app.include_router(api.router)
+    app.dependency_overrides[api.get_service] = lambda: service
+    with TestClient(app) as client:
+        response = client.get("/parse/stream", params={"description": "Acme drill", "fields": ["color", "brand"]})
+        assert response.status_code == 200 and "event: result" in response.text
+        assert client.get("/parse/stream", params={"description": "Acme drill"}).status_code == 200
+        assert client.get("/parse/stream", params={"description": "Acme drill", "fields": ["nope"]}).status_code == 400
+
+    # Schema order, as with POST; no fields means the whole schema
+    assert seen == [("brand", "color"), None]
@@ -0,0 +1,80 @@
+import asyncio
+import json
+import os
+import pickle
+
+import artifact
+import cache
+import matcher
+from artifact import SchemaStore, artifact_path, load_or_compile
+
+
+def write_schema(path, brands):
+    path.write_text(json.dumps({"properties": {"brand": {"type": "enum", "values": brands}}}))
+
+
+def test_reloads_drop_retired_versions_from_the_memos(tmp_path):
+    path = tmp_path / "schema.json"
+    write_schema(path, ["Acme"])
+    store = SchemaStore(str(path))
+    first = store.current
+    cache.schema_fingerprint(first.schema)
+    for brands in (["Acme", "Globex"], ["Acme", "Globex", "Initech"]):
+        write_schema(path, brands)
+        store.reload()
+    # The version two swaps back is gone; the one just replaced may still serve old requests
+    assert id(first.schema) not in matcher._MATCHERS
+    assert id(first.schema) not in cache._FINGERPRINTS
+    assert matcher.get_matcher(store.current.schema) is store.current.matcher
+
+
+def test_artifact_from_other_code_is_rebuilt(tmp_path):
+    path = tmp_path / "schema.json"
+    write_schema(path, ["Acme"])
+    compiled = load_or_compile(str(path))
+    assert load_or_compile(str(path)).compiled_at == compiled.compiled_at
+    compiled.compiler = "0" * 16
+    with open(artifact_path(str(path)), 'wb') as f:
+        pickle.dump(compiled, f)
+    assert load_or_compile(str(path)).compiled_at != compiled.compiled_at
+
+
+def test_failed_reload_is_retried_by_the_watcher(tmp_path, monkeypatch):
+    path = tmp_path / "schema.json"
+    write_schema(path, ["Acme"])
+    store = SchemaStore(str(path), poll_interval=0.01)
+    first = store.current.version
+    write_schema(path, ["Acme", "Globex"])
+    real_load = artifact.load_or_compile
+    calls = []
+
+    def flaky_load(schema_path):
+        calls.append(schema_path)
+        if len(calls) == 1:
+            raise OSError("artifact replaced underneath us")
+        return real_load(schema_path)
+
+    monkeypatch.setattr(artifact, "load_or_compile", flaky_load)
+
+    async def watch_until_swapped():
+        task = asyncio.create_task(store.watch())
+        try:
+            while store.current.version == first:
+                await asyncio.sleep(0.01)
+        finally:
+            task.cancel()
+
+    asyncio.run(asyncio.wait_for(watch_until_swapped(), 5))
+    assert len(calls) == 2 and store.last_error is None
+    assert store.current.schema["properties"]["brand"]["values"] == ["Acme", "Globex"]
+
+
+def test_compile_writes_through_a_per_process_tmp_file(tmp_path):
+    path = tmp_path / "schema.json"
+    write_schema(path, ["Acme"])
+    # Another worker's tmp file for the same artifact is left alone, and ours is gone
+    other = tmp_path / (os.path.basename(artifact_path(str(path))) + ".1.tmp")
+    other.write_bytes(b"partial")
+    artifact.compile_schema(str(path))
+    assert {p.name for p in tmp_path.iterdir()} == {"schema.json", other.name,
+                                                     os.path.basename(artifact_path(str(path)))}
@@ -0,0 +1,45 @@
+import asyncio
+import threading
+
+from cache import ResultCache
+
+
+def test_async_get_reads_the_disk_tier_off_the_loop(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    cache = ResultCache(path)
+    cache.put("key", "{}")
+    cache.close()
+
+    cache = ResultCache(path)
+    readers = []
+    read = cache._from_disk
+    cache._from_disk = lambda *args: readers.append(threading.current_thread()) or read(*args)
+
+    async def lookup():
+        return await cache.get_async("key"), await cache.get_async("key")
+
+    assert asyncio.run(lookup()) == ("{}", "{}")
+    # The second lookup is a memory hit and never reaches the disk tier
+    assert len(readers) == 1 and readers[0] is not threading.main_thread()
+    assert cache.stats()["disk_hits"] == 1
+    cache.close()
+
+
+def test_background_put_is_in_memory_at_once_and_on_disk_after_close(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    cache = ResultCache(path)
+    cache.put("key", "{}", background=True)
+    assert cache.get("key") == "{}"
+    cache.close()
+
+    cache = ResultCache(path, memory_items=0)
+    assert cache.get("key") == "{}"
+    cache.close()
+
+
+def test_memory_only_cache_counts_async_misses():
+    cache = ResultCache(None)
+    assert asyncio.run(cache.get_async("key")) is None
+    cache.put("key", "{}", background=True)
+    assert asyncio.run(cache.get_async("key")) == "{}"
+    assert (cache.stats()["hits"], cache.stats()["misses"]) == (1, 1)
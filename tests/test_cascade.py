@@ -0,0 +1,93 @@
+import pytest
+
+import parser
+from cascade import Cascade
+from matcher import get_matcher
+
+
+SCHEMA = {
+    "properties": {
+        "category": {"type": "enum", "values": ["automotive", "beauty", "electronics"]},
+        "brand": {"type": "enum", "values": ["Acme", "Globex"]},
+        "color": {"type": "enum", "values": ["black", "white"]},
+        "weight": {"type": "string"},
+        "features": {"type": "array"},
+    },
+    "required": ["category", "brand"],
+}
+GOOD = {"category": "electronics", "brand": "Acme", "color": "black", "weight": "2 lbs", "features": ["Quiet"]}
+
+
+def fuzzy_score(key, value):
+    score = get_matcher(SCHEMA).match(key, value)[1]
+    assert 0.0 < score < 1.0
+    return score
+
+
+def cascade(**thresholds):
+    return Cascade(["small", "large"], **thresholds)
+
+
+def test_exact_answer_is_accepted():
+    assert cascade().assess(GOOD, SCHEMA) == (1.0, [])
+
+
+def test_unknown_brand_and_free_text_do_not_escalate():
+    answer = {**GOOD, "brand": "Initech", "weight": "whatever the model said"}
+    assert cascade().assess(answer, SCHEMA) == (1.0, [])
+
+
+def test_unknown_category_is_weak():
+    confidence, reasons = cascade().assess({**GOOD, "category": "garden"}, SCHEMA)
+    assert "weak_enum" in reasons
+
+
+def test_fuzzy_match_against_enum_threshold():
+    answer = {**GOOD, "color": "blakc"}
+    score = fuzzy_score("color", "blakc")
+    assert cascade(min_enum_score=score, min_confidence=0.0).assess(answer, SCHEMA)[1] == []
+    assert cascade(min_enum_score=score + 0.01, min_confidence=0.0).assess(answer, SCHEMA)[1] == ["weak_enum"]
+
+
+def test_mean_score_against_confidence_threshold():
+    answer = {**GOOD, "color": "blakc"}
+    mean = (1.0 + 1.0 + fuzzy_score("color", "blakc")) / 3  # category, brand, color
+    confidence, reasons = cascade(min_enum_score=0.0, min_confidence=mean).assess(answer, SCHEMA)
+    assert confidence == pytest.approx(mean) and reasons == []
+    _, reasons = cascade(min_enum_score=0.0, min_confidence=mean + 0.01).assess(answer, SCHEMA)
+    assert reasons == ["low_confidence"]
+
+
+def test_empty_required_fields():
+    answer = {**GOOD, "brand": None}
+    assert cascade().assess(answer, SCHEMA)[1] == []
+    answer["category"] = None
+    assert cascade().assess(answer, SCHEMA)[1] == ["empty_required"]
+    # Only the requested fields count
+    assert cascade().assess(answer, SCHEMA, fields=("brand", "color"))[1] == []
+
+
+def test_invalid_and_repaired_output():
+    assert cascade().assess(None, SCHEMA) == (0.0, ["invalid_json"])
+    confidence, reasons = cascade().assess(GOOD, SCHEMA, repaired=True)
+    assert confidence == 0.5 and reasons == ["repaired_json", "low_confidence"]
+
+
+def test_parse_escalates_only_doubtful_answers(monkeypatch):
+    answers = {"small": {**GOOD, "category": "garden"}, "large": GOOD}
+    calls = []
+
+    def fake_parse(description, system_prompt, schema, cache, stats, rules, classifier, model=None, fields=None):
+        calls.append(model)
+        stats['raw_output'] = dict(answers[model])
+        return dict(answers[model])
+
+    monkeypatch.setattr(parser, "parse_description", fake_parse)
+    stats = {}
+    result = cascade().parse("A drill", "prompt", SCHEMA, stats=stats)
+    assert result == GOOD and calls == ["small", "large"]
+    assert stats['model'] == "large" and [tier["accepted"] for tier in stats['tiers']] == [False, True]
+
+    answers["small"] = GOOD
+    calls.clear()
+    assert cascade().parse("A drill", "prompt", SCHEMA) == GOOD and calls == ["small"]
@@ -0,0 +1,75 @@
+import json
+
+import parser
+from classifier import CentroidClassifier, CentroidTrainer, load_classifier
+
+
+CORPUS = [
+    ("Heavy duty floor mats for cars and trucks, all weather rubber liner", "automotive", "floor mats"),
+    ("Custom fit floor liner for the front row of your car", "automotive", "floor mats"),
+    ("Car phone mount for the dashboard air vent", "automotive", "interior accessories"),
+    ("Dashboard cup holder organizer for car interior", "automotive", "interior accessories"),
+    ("Moisturizing face cream with hyaluronic acid for dry skin", "beauty", "skin care"),
+    ("Night cream for the face, anti aging skin moisturizer", "beauty", "skin care"),
+    ("Matte liquid lipstick, long lasting lip color", "beauty", "makeup"),
+    ("Waterproof mascara and eyeliner makeup set", "beauty", "makeup"),
+]
+SCHEMA = {
+    "properties": {
+        "category": {"type": "enum", "values": ["automotive", "beauty"]},
+        "subcategory": {"type": "enum", "values": ["floor mats", "interior accessories", "skin care", "makeup"]},
+        "features": {"type": "array"},
+    },
+}
+
+
+def train(rows=CORPUS):
+    trainer = CentroidTrainer()
+    for text, category, subcategory in rows:
+        trainer.add(text, category, subcategory)
+    return trainer
+
+
+def test_predicts_category_and_subcategory():
+    classifier = train().build()
+    assert classifier.predict("All weather floor mats for my truck") == {"category": "automotive", "subcategory": "floor mats"}
+    assert classifier.predict("Hydrating face moisturizer cream") == {"category": "beauty", "subcategory": "skin care"}
+    assert classifier.predict("") == {}
+
+
+def test_save_and_load_round_trip(tmp_path):
+    classifier = train().build()
+    path = str(tmp_path / "classifier.json")
+    classifier.save(path)
+    loaded = load_classifier(path)
+    for text, _, _ in CORPUS:
+        assert loaded.predict(text) == classifier.predict(text)
+
+    with open(path) as f:
+        data = json.load(f)
+    data["version"] += 1
+    with open(path, "w") as f:
+        json.dump(data, f)
+    assert load_classifier(path) is None
+    assert load_classifier(str(tmp_path / "missing.json")) is None
+
+
+def test_merged_trainers_match_one_pass():
+    whole = train()
+    merged = train(CORPUS[::2]).merge(train(CORPUS[1::2]))
+    assert merged.docs == whole.docs and merged.df == whole.df
+    assert merged.class_docs == whole.class_docs and merged.parents == whole.parents
+    a, b = whole.build(), merged.build()
+    assert isinstance(b, CentroidClassifier)
+    for text, category, subcategory in CORPUS:
+        assert b.predict(text) == a.predict(text) == {"category": category, "subcategory": subcategory}
+
+
+def test_classifier_fills_category_without_the_model():
+    stats = {}
+    prefilled, missing, _, result = parser._prefill("Lip color that lasts all day, matte liquid lipstick",
+                                                    parser.construct_prompt(SCHEMA), SCHEMA, None, stats,
+                                                    classifier=train().build())
+    assert prefilled == {"category": "beauty", "subcategory": "makeup"}
+    assert stats.get("short_circuit") and missing == []
+    assert result["category"] == "beauty" and result["subcategory"] == "makeup" and result["features"] == []
@@ -0,0 +1,19 @@
+import os
+
+import parser
+
+
+SCHEMA = parser.load_schema(os.path.join(os.path.dirname(__file__), "..", "schema.json"))
+
+
+def test_num_ctx_is_fixed_per_schema_and_call_kind():
+    single, packed = parser.context_sizes(SCHEMA)
+    assert single % parser.CTX_STEP == 0 and single < packed == parser.PACK_CTX
+    prompt = parser.construct_prompt(SCHEMA)
+    subset = parser.decoding_for(SCHEMA, ["brand"])
+    assert parser.decoding_for(SCHEMA)["num_ctx"] == subset["num_ctx"] == single
+    pack = [(i, f"Item {i} by Acme", {}, None, prompt, None) for i in range(3)]
+    assert parser._packed_request(pack, prompt, SCHEMA)["options"]["num_ctx"] == packed
+    # A packed call doesn't raise what later single calls use
+    request = parser._chat_request("Red mug", prompt, parser.decoding_for(SCHEMA))
+    assert request["options"]["num_ctx"] == single
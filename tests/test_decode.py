@@ -0,0 +1,56 @@
+import asyncio
+import json
+import os
+
+import parser
+from cache import ResultCache
+
+
+SCHEMA = parser.load_schema(os.path.join(os.path.dirname(__file__), "..", "schema.json"))
+
+
+def test_valid_output_is_cached():
+    cache = ResultCache(path=None)
+    parser._decode(json.dumps({"brand": "Acme"}), SCHEMA, cache, "key")
+    assert cache.get("key") is not None
+
+
+def test_repaired_output_is_returned_but_not_cached():
+    cache = ResultCache(path=None)
+    stats = {}
+    result = parser._decode('{"brand": "Acme", "color": "re', SCHEMA, cache, "key", stats)
+    assert result is not None
+    assert stats["repaired"]
+    assert cache.get("key") is None
+
+
+def test_split_packed_reports_repair():
+    raws, repaired = parser._split_packed('{"items": [{"id": 1, "brand": "Acme"}, {"id": 2, "bra', 2, SCHEMA)
+    assert repaired
+    assert raws[0]["brand"] == "Acme"
+    assert parser._split_packed('{"items": [{"id": 1, "brand": "Acme"}]}', 1, SCHEMA)[1] is False
+
+
+def test_stream_honors_requested_fields(monkeypatch):
+    answer = json.dumps({"brand": "Acme", "color": "Red", "material": "steel"})
+    requests = []
+
+    async def fake_stream(request):
+        requests.append(request)
+
+        async def parts():
+            for i in range(0, len(answer), 5):
+                yield {"message": {"content": answer[i:i + 5]}, "done": False}
+            yield {"message": {"content": ""}, "done": True}
+        return parts()
+
+    monkeypatch.setattr(parser, "_chat_stream", fake_stream)
+
+    async def collect():
+        return [event async for event in parser.stream_description_async(
+            "A red widget", parser.construct_prompt(SCHEMA), SCHEMA, fields=["brand", "color"])]
+
+    events = asyncio.run(collect())
+    assert [e["field"] for e in events if e["event"] == "field"] == ["brand", "color"]
+    assert set(events[-1]["result"]) == {"brand", "color"}
+    assert set(requests[0]["format"]["properties"]) == {"brand", "color"}
@@ -0,0 +1,103 @@
+import csv
+import json
+import random
+import sys
+
+import generate_schema
+from generate_schema import find_chunk_boundaries, last_record_end, read_header
+
+
+HEADER = b'title,description,brand\n'
+ROWS = [b'Drill,"20V, cordless",Acme\n', b'Lamp,"Warm light\nwith dimmer",Globex\n', b'Saw,Sharp,Initech\n']
+
+
+def write(tmp_path, data):
+    path = tmp_path / "products.csv"
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_last_record_end_skips_a_half_written_row(tmp_path):
+    complete = HEADER + b"".join(ROWS)
+    path = write(tmp_path, complete + b'Fan,"Quiet')
+    _, data_start = read_header(path)
+    assert last_record_end(path, data_start) == len(complete)
+
+
+def test_last_record_end_ignores_newlines_inside_quotes(tmp_path, monkeypatch):
+    # The unfinished row's quoted field already spans a line; that newline doesn't end a record
+    complete = HEADER + b"".join(ROWS)
+    path = write(tmp_path, complete + b'Fan,"Quiet\nthree speeds')
+    _, data_start = read_header(path)
+    assert last_record_end(path, data_start) == len(complete)
+    # Same answer when the scan has to cross block boundaries
+    monkeypatch.setattr(generate_schema, "BLOCK_SIZE", 7)
+    assert last_record_end(path, data_start) == len(complete)
+
+
+def test_chunks_and_record_end_agree(tmp_path):
+    complete = HEADER + b"".join(ROWS * 50)
+    path = write(tmp_path, complete + b'Fan,"Quiet\n')
+    _, data_start = read_header(path)
+    end = last_record_end(path, data_start)
+    assert end == len(complete)
+    ranges = find_chunk_boundaries(path, data_start, 4, end)
+    record_starts = {data_start}
+    for row in ROWS * 50:
+        record_starts.add(max(record_starts) + len(row))
+    assert ranges[-1][1] == end
+    assert {offset for chunk in ranges for offset in chunk} <= record_starts
+
+
+def product_rows(n, seed=5):
+    rng = random.Random(seed)
+    categories = [["Automotive", "Floor Mats"], ["Automotive", "Interior"], ["Beauty", "Skin Care"], ["Home", "Lamps"]]
+    brands = ["Acme", "Globex", "Initech", "Umbrella", "Hooli", "Stark"]
+    colors = ["Black", "Dark Blue", "Red/White", "Silver & Black", "Navy"]
+    rows = []
+    for i in range(n):
+        variations = [{"name": rng.choice(colors), "asin": f"B{i}"}]
+        rows.append({
+            "title": f"Item {i}",
+            "description": rng.choice(["Soft cotton cover", "Leather strap, wooden handle", "Glass lid", "A necklace"]),
+            "brand": rng.choice(brands),
+            "categories": json.dumps(rng.choice(categories)),
+            "variations": json.dumps(variations),
+        })
+    return rows
+
+
+def write_csv(path, rows, header=True, mode="w"):
+    with open(path, mode, newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        if header:
+            writer.writeheader()
+        writer.writerows(rows)
+
+
+def generate(monkeypatch, *args):
+    monkeypatch.setattr(sys, "argv", ["generate_schema.py", *args])
+    generate_schema.main()
+
+
+def test_incremental_run_over_appended_rows_matches_a_full_run(tmp_path, monkeypatch):
+    rows = product_rows(120)
+    full_csv, growing_csv = str(tmp_path / "full.csv"), str(tmp_path / "growing.csv")
+    write_csv(full_csv, rows)
+    generate(monkeypatch, "--input", full_csv, "--output", str(tmp_path / "full.json"))
+
+    write_csv(growing_csv, rows[:50])
+    incremental = ["--input", growing_csv, "--output", str(tmp_path / "incremental.json"), "--incremental"]
+    generate(monkeypatch, *incremental)
+    write_csv(growing_csv, rows[50:90], header=False, mode="a")
+    generate(monkeypatch, *incremental)
+    write_csv(growing_csv, rows[90:], header=False, mode="a")
+    generate(monkeypatch, *incremental)
+
+    with open(tmp_path / "full.json") as f:
+        full = json.load(f)
+    with open(tmp_path / "incremental.json") as f:
+        assert json.load(f) == full
+    assert full["properties"]["category"]["values"] == ["automotive", "beauty", "home"]
+    state = generate_schema.load_state(str(tmp_path / "incremental.state"), generate_schema.DEFAULT_VOCABULARY)
+    assert state.counters.rows == len(rows)
@@ -0,0 +1,86 @@
+import asyncio
+import json
+import multiprocessing
+
+import httpx
+
+from images import ImageEnricher, StubImageProvider
+
+
+def run_worker(directory, started, finish):
+    """A second prefork worker: starts a slow lookup and keeps running until told to stop."""
+    async def main():
+        enricher = ImageEnricher(StubImageProvider(url_template="https://img.test/{keywords}.jpg", delay=0.5),
+                                 shared_dir=directory)
+        enricher.request("Acme Drill")
+        started.set()
+        await enricher.wait("Acme Drill")
+        await asyncio.to_thread(finish.wait, 10)
+
+    asyncio.run(main())
+
+
+def test_workers_answer_for_each_others_lookups(tmp_path):
+    context = multiprocessing.get_context("fork")
+    started, finish = context.Event(), context.Event()
+    worker = context.Process(target=run_worker, args=(str(tmp_path), started, finish))
+    worker.start()
+    try:
+        assert started.wait(10)
+        provider = StubImageProvider(url_template="https://other.test/{keywords}.jpg")
+        enricher = ImageEnricher(provider, shared_dir=str(tmp_path))
+
+        async def poll():
+            pending = enricher.request("acme  drill")  # same key; must join, not start another search
+            return pending, await asyncio.wait_for(enricher.wait("Acme Drill"), 5)
+
+        pending, done = asyncio.run(poll())
+        assert pending["status"] == "pending"
+        assert done["status"] == "found" and done["image_url"] == "https://img.test/Acme Drill.jpg"
+        assert provider.calls == 0
+    finally:
+        finish.set()
+        worker.join(10)
+
+
+def test_claim_of_a_dead_worker_is_taken_over(tmp_path):
+    enricher = ImageEnricher(StubImageProvider(url_template="https://img.test/{keywords}.jpg"),
+                             shared_dir=str(tmp_path))
+    with open(enricher._shared._path("acme drill", ".pending"), "w") as f:
+        f.write("999999999")
+    assert enricher.status("Acme Drill")["status"] == "unknown"
+
+    async def lookup():
+        return await asyncio.wait_for(enricher.lookup("Acme Drill"), 5)
+
+    assert asyncio.run(lookup()) == "https://img.test/Acme Drill.jpg"
+
+
+def test_callback_is_posted_for_cached_products(monkeypatch):
+    posts = []
+    client_class = httpx.AsyncClient
+
+    def handler(request):
+        posts.append((str(request.url), json.loads(request.content)))
+        return httpx.Response(204)
+
+    monkeypatch.setattr(httpx, "AsyncClient", lambda **kwargs: client_class(transport=httpx.MockTransport(handler), **kwargs))
+    provider = StubImageProvider(images={"Acme Drill": "https://img.test/drill.jpg"})
+    enricher = ImageEnricher(provider, callback_hosts=["hooks.test"])
+
+    async def scenario():
+        for name in ("Acme Drill", "Nameless Widget"):
+            await enricher.lookup(name)
+        # Both are cached now, one as found and one as a known miss
+        first = enricher.request("Acme Drill", callback_url="http://hooks.test/a")
+        second = enricher.request("Nameless Widget", callback_url="http://hooks.test/b")
+        await asyncio.wait_for(asyncio.gather(*enricher._callbacks), 5)
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert first["status"] == "found" and second["status"] == "not_found"
+    assert provider.calls == 2
+    assert sorted(posts) == [
+        ("http://hooks.test/a", {"product_name": "Acme Drill", "status": "found", "image_url": "https://img.test/drill.jpg"}),
+        ("http://hooks.test/b", {"product_name": "Nameless Widget", "status": "not_found", "image_url": None}),
+    ]
@@ -0,0 +1,56 @@
+import json
+import random
+
+from jsonstream import JSONFieldStream, repair_json
+
+
+ANSWER = {"brand": "Acme \"Pro\" \\ Co", "features": ["a, b", "[c]"], "size": {"w": 1, "h": [2, 3]},
+          "weight": 2.5, "color": None, "in_stock": True, "note": "braces } and { inside"}
+
+
+def feed_in_pieces(text, rng):
+    stream = JSONFieldStream()
+    events = []
+    i = 0
+    while i < len(text):
+        step = rng.randint(1, 7)
+        events.extend(stream.feed(text[i:i + step]))
+        i += step
+    return stream, events
+
+
+def test_fields_match_json_loads_however_the_text_is_split():
+    text = json.dumps(ANSWER, indent=2)
+    rng = random.Random(0)
+    for _ in range(50):
+        stream, events = feed_in_pieces(text, rng)
+        assert events == list(ANSWER.items())
+        assert stream.done and stream.fields == ANSWER and stream.text == text
+
+
+def test_field_is_emitted_as_soon_as_its_value_closes():
+    stream = JSONFieldStream()
+    assert stream.feed('{"brand": "Ac') == []
+    assert stream.feed('me", "weight": 2') == [("brand", "Acme")]
+    # A number could still have more digits until the ',' or '}'
+    assert stream.feed('.5') == []
+    assert stream.feed(', "features": ["x"') == [("weight", 2.5)]
+    assert stream.feed(']}') == [("features", ["x"])]
+    assert stream.done
+
+
+def test_text_after_the_object_is_ignored():
+    stream = JSONFieldStream()
+    assert stream.feed('{"a": 1} trailing {"b": 2}') == [("a", 1)]
+    assert stream.fields == {"a": 1}
+
+
+def test_repair_json():
+    assert repair_json('Sure! ```json\n{"a": 1}\n``` Hope that helps') == {"a": 1}
+    assert repair_json('{"a": 1, "b": [1, 2,],}') == {"a": 1, "b": [1, 2]}
+    # Cut off mid-string or mid-number: that member is dropped, the rest kept
+    assert repair_json('{"a": "x", "b": "unfinish') == {"a": "x"}
+    assert repair_json('{"a": "x", "b": 12') == {"a": "x"}
+    assert repair_json('{"a": ["x", {"y": "z"') == {"a": ["x", {"y": "z"}]}
+    assert repair_json('no object here') is None
+    assert repair_json('{"a": "unfinish') is None
@@ -0,0 +1,171 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+import pool as pool_module
+from mock_ollama import MockOllamaServer
+from pool import FAILURE_THRESHOLD, OllamaPool
+
+
+class SlowClient:
+    """Stands in for ollama.AsyncClient: chat answers after `delay` seconds."""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.calls = 0
+
+    async def chat(self, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return {"message": {"content": "{}"}}
+
+
+def make_pool(client, cap=1):
+    pool = OllamaPool([("http://ollama.test:11434", cap)], health_interval=0)
+    pool.backends[0].async_client = lambda: client
+    return pool
+
+
+def test_cancelled_chat_releases_its_slot():
+    pool = make_pool(SlowClient(10.0))
+    backend = pool.backends[0]
+
+    async def scenario():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(pool.chat_async(model="m", messages=[]), 0.05)
+        assert backend.outstanding == 0
+        assert backend.failures == 0 and backend.state == "closed"
+        # The slot is usable again: a fast call doesn't wait for the abandoned one
+        backend.async_client = lambda: SlowClient(0.0)
+        return await asyncio.wait_for(pool.chat_async(model="m", messages=[]), 1.0)
+
+    assert asyncio.run(scenario()) == {"message": {"content": "{}"}}
+    assert backend.outstanding == 0
+
+
+def test_waiter_wakes_when_a_slot_frees():
+    pool = make_pool(SlowClient(0.0))
+    held = pool.acquire()
+
+    async def scenario():
+        threading.Timer(0.05, pool.release, (held, time.monotonic())).start()
+        started = time.monotonic()
+        backend = await pool.acquire_async()
+        return backend, time.monotonic() - started
+
+    backend, waited = asyncio.run(scenario())
+    assert backend is held
+    # Woken by release(), well before the SLOT_WAIT re-check
+    assert waited < 0.5
+    assert not pool._async_waiters
+
+
+@pytest.fixture
+def stubs():
+    servers = [MockOllamaServer(latency=0.05).start() for _ in range(3)]
+    yield servers
+    for server in servers:
+        server.stop()
+
+
+def wait_until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def chat_request():
+    return {"model": "mistral", "messages": [{"role": "user", "content": "Red cotton shirt"}], "format": "json"}
+
+
+def test_spreads_over_stubs_by_outstanding_requests(stubs):
+    pool = OllamaPool([(stub.url, 4) for stub in stubs], health_interval=0)
+
+    async def scenario():
+        try:
+            return await asyncio.gather(*(pool.chat_async(**chat_request()) for _ in range(6)))
+        finally:
+            await pool.aclose()
+
+    assert len(asyncio.run(scenario())) == 6
+    # Six concurrent calls over three idle hosts: two each, never stacked on one
+    assert [stub.requests for stub in stubs] == [2, 2, 2]
+    assert [stub.max_in_flight for stub in stubs] == [2, 2, 2]
+    assert all(b.outstanding == 0 for b in pool.backends)
+
+
+def test_fails_over_when_a_stub_answers_503(stubs):
+    down, up = stubs[:2]
+    down.healthy = False
+    pool = OllamaPool([(down.url, 4), (up.url, 4)], health_interval=0)
+
+    response = pool.chat(**chat_request())
+
+    assert response["message"]["content"]
+    assert up.requests == 1
+    assert pool.backends[0].failures == 1 and pool.backends[0].state == "closed"
+
+
+def test_circuit_opens_after_repeated_failures(stubs, monkeypatch):
+    down, up = stubs[:2]
+    down.healthy = False
+    pool = OllamaPool([(down.url, 4), (up.url, 4)], health_interval=0)
+
+    for _ in range(10):
+        assert pool.chat(**chat_request())["message"]["content"]
+
+    failing = pool.backends[0]
+    assert failing.state == "open"
+    # Tried until the circuit opened, then left alone for the cooldown
+    assert failing.failures == FAILURE_THRESHOLD
+    assert up.requests == 10
+
+    # After the cooldown one trial request closes the circuit again
+    down.healthy = True
+    monkeypatch.setattr(pool_module, "COOLDOWN", 0.0)
+    pool.chat(**chat_request())
+    assert failing.state == "closed"
+    assert down.requests == 1
+
+
+def test_health_thread_takes_a_downed_stub_out_and_back(stubs):
+    stub, other = stubs[:2]
+    pool = OllamaPool([(stub.url, 4), (other.url, 4)], health_interval=0.02).start()
+    try:
+        backend = pool.backends[0]
+        stub.healthy = False
+        assert wait_until(lambda: not backend.healthy)
+        assert not backend.available(time.monotonic())
+        pool.chat(**chat_request())
+        assert stub.requests == 0 and other.requests == 1
+
+        stub.healthy = True
+        assert wait_until(lambda: backend.healthy)
+        assert backend.available(time.monotonic())
+    finally:
+        pool.stop()
+
+
+def test_answering_tags_does_not_cut_the_cooldown_short(stubs):
+    failing, up = stubs[:2]
+    failing.chat_error = 500
+    pool = OllamaPool([(failing.url, 4), (up.url, 4)], health_interval=0.02).start()
+    try:
+        for _ in range(5):
+            pool.chat(**chat_request())
+        backend = pool.backends[0]
+        assert backend.state == "open" and failing.requests == FAILURE_THRESHOLD
+
+        # Several health rounds see /api/tags answer; the circuit stays open for COOLDOWN
+        time.sleep(0.2)
+        assert backend.healthy and backend.state == "open"
+        for _ in range(5):
+            pool.chat(**chat_request())
+        assert failing.requests == FAILURE_THRESHOLD and up.requests == 10
+    finally:
+        pool.stop()
@@ -0,0 +1,64 @@
+import os
+
+import parser
+from rules import RuleExtractor, required_fields
+
+
+SCHEMA = parser.load_schema(os.path.join(os.path.dirname(__file__), "..", "schema.json"))
+
+
+def test_required_fields_default_skips_arrays():
+    schema = {"properties": {"brand": {"type": "string"}, "features": {"type": "array"}}}
+    assert required_fields(schema) == ["brand"]
+    assert required_fields(SCHEMA) == ["category", "subcategory", "brand"]
+
+
+def test_labelled_description_skips_the_model():
+    rules = RuleExtractor(SCHEMA)
+    stats = {}
+    description = ("Category: Automotive. Subcategory: Accessories. Brand: 3D MAXpider. "
+                   "Custom fit floor liner for the front row.")
+    prefilled, missing, _, result = parser._prefill(description, parser.construct_prompt(SCHEMA), SCHEMA, rules,
+                                                    stats)
+    assert stats.get("short_circuit")
+    assert missing == []
+    assert (result["category"], result["subcategory"], result["brand"]) == ("automotive", "accessories", "3D MAXpider")
+    assert rules.stats()["short_circuits"] == 1
+
+
+def test_missing_required_field_still_asks_the_model():
+    rules = RuleExtractor(SCHEMA)
+    stats = {}
+    _, missing, _, result = parser._prefill("Brand: 3D MAXpider. Color: black.", parser.construct_prompt(SCHEMA),
+                                            SCHEMA, rules, stats)
+    assert result is None and not stats.get("short_circuit")
+    assert "category" in missing and "brand" not in missing
+
+
+def test_subset_short_circuit_is_counted():
+    rules = RuleExtractor(SCHEMA)
+    stats = {}
+    subset = parser.select_fields(SCHEMA, ["brand", "color"])
+    _, _, _, result = parser._prefill("Brand: 3D MAXpider. Floor liner.", parser.construct_prompt(SCHEMA), SCHEMA,
+                                      rules, stats, subset=subset)
+    assert stats.get("short_circuit") and result["brand"] == "3D MAXpider"
+    assert rules.stats()["short_circuits"] == 1
+
+
+def test_compound_name_labels_fill_their_own_fields():
+    schema = parser.load_schema(os.path.join(os.path.dirname(__file__), "..", "api_schema.json"))
+    found = RuleExtractor(schema).extract("Acme cordless drill. Color Name: Black. Brand Name: Acme. "
+                                          "Size Name: Large. Style Name: Compact. Item Weight: 3 pounds")
+    assert found == {"color": "Black", "brand": "Acme", "size": "Large"}
+    assert RuleExtractor(schema).extract("Product Name: Acme Drill")["product_name"] == "Acme Drill"
+
+
+def test_subset_without_required_fields_needs_all_of_them():
+    rules = RuleExtractor(SCHEMA)
+    stats = {}
+    subset = parser.select_fields(SCHEMA, ["color", "features", "weight"])
+    _, missing, _, result = parser._prefill("Weight: 2 lbs. Bright crimson waterproof jacket with hood",
+                                            parser.construct_prompt(SCHEMA), SCHEMA, rules, stats, subset=subset)
+    assert result is None and not stats.get("short_circuit")
+    assert missing == ["features"]
+    assert rules.stats()["short_circuits"] == 0
@@ -0,0 +1,63 @@
+import random
+from collections import Counter
+
+from sketch import SpaceSaving
+
+
+CAPACITY = 20
+
+
+def stream(seed, n):
+    """Skewed values: a few heavy hitters over a long tail."""
+    rng = random.Random(seed)
+    return [f"v{int(rng.paretovariate(0.8))}" for _ in range(n)]
+
+
+def check_bounds(sketch, values):
+    truth = Counter(values)
+    assert sketch.total == len(values)
+    for value, count in truth.items():
+        if count > len(values) / sketch.capacity:
+            assert value in sketch.counts, value
+    for value, estimate in sketch.items():
+        assert estimate - sketch.errors.get(value, 0) <= truth[value] <= estimate, value
+    assert len(sketch) <= 2 * sketch.capacity
+
+
+def test_add_keeps_heavy_hitters_within_their_errors():
+    for seed in range(5):
+        values = stream(seed, 5000)
+        sketch = SpaceSaving(CAPACITY)
+        sketch.update(values)
+        assert not sketch.exact
+        check_bounds(sketch, values)
+
+
+def test_counts_are_exact_until_the_first_eviction():
+    values = ["a", "b", "a", "c", "a", "b"]
+    sketch = SpaceSaving(CAPACITY)
+    sketch.update(values)
+    assert sketch.exact and dict(sketch.items()) == Counter(values) and not sketch.errors
+    assert sketch["missing"] == 0
+
+
+def test_prune_raises_the_floor_to_the_largest_dropped_count():
+    sketch = SpaceSaving(CAPACITY)
+    for value, count in {"a": 9, "b": 5, "c": 3, "d": 2}.items():
+        sketch.add(value, count)
+    sketch._prune(2)
+    assert dict(sketch.items()) == {"a": 9, "b": 5} and sketch.floor == 3
+    # A dropped value may have been counted before, so it comes back at the floor
+    sketch.add("c")
+    assert sketch["c"] == 4 and sketch.errors["c"] == 3
+
+
+def test_merged_sketches_keep_the_bounds_of_the_whole_stream():
+    for seed in range(5):
+        parts = [stream(seed * 10 + i, n) for i, n in enumerate((3000, 500, 2000))]
+        merged = SpaceSaving(CAPACITY)
+        for part in parts:
+            sketch = SpaceSaving(CAPACITY)
+            sketch.update(part)
+            merged.merge(sketch)
+        check_bounds(merged, [value for part in parts for value in part])
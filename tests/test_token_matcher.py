@@ -0,0 +1,21 @@
+import re
+
+import bench_vocab
+import generate_schema as gs
+
+
+def test_materials_are_the_old_hits_that_start_a_word():
+    rows = bench_vocab.synthetic_rows(300, seed=7)
+    for row in rows:
+        old = bench_vocab.legacy_materials(row)
+        desc = " ".join(row[key] for key in ("description", "features", "product_details")).lower()
+        assert gs.row_materials(row) == {m for m in old if re.search(r'\b' + m, desc)}
+    row = {"description": "Lace-up boots with a replacement necklace, wooden soles and leathers"}
+    assert bench_vocab.legacy_materials(row) == {"lace", "wood", "leather"}
+    assert gs.row_materials(row) == {"lace", "wood", "leather"}
+    assert gs.row_materials({"description": "A necklace and a replacement strap"}) == set()
+
+
+def test_colors_match_the_old_split():
+    rows = bench_vocab.synthetic_rows(300, seed=7)
+    assert [gs.row_colors(row) for row in rows] == [bench_vocab.legacy_colors(row) for row in rows]
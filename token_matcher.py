@@ -0,0 +1,58 @@
+import re
+
+
+# Boundaries for TokenMatcher: what may (not) touch a token on either side
+WORD_START = r'\b'
+WORD_END = r'\b'
+# Separator characters for variation names like 'blue/green' or 'black-white'
+SEPARATORS = r'\s/\-,&'
+
+
+def _trie_pattern(tokens):
+    """Regex matching any of the tokens, e.g. ['silk', 'silicone'] -> 'sil(?:icone|k)'."""
+    trie = {}
+    for token in tokens:
+        node = trie
+        for ch in token:
+            node = node.setdefault(ch, {})
+        node[''] = None  # end of a token
+
+    def render(node):
+        branches = [re.escape(ch) + render(child) for ch, child in sorted(node.items()) if ch != '']
+        if not branches:
+            return ''
+        if '' not in node:
+            return branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        # A token ends here but longer ones continue; greedy '?' tries the longer first
+        return '(?:' + '|'.join(branches) + ')?'
+
+    return '(?:' + render(trie) + ')'
+
+
+class TokenMatcher:
+    """
+    Finds every vocabulary token in a text with one compiled regex scan.
+
+    All tokens are compiled into a single alternation factored as a prefix
+    trie, so the regex engine rejects a position after one character test
+    instead of trying every token. Longer tokens win over their prefixes.
+    `left`/`right` say what must surround a match: regex assertions such as
+    WORD_START, or `separators=` (the body of a character class), meaning
+    only those characters or the string edge may touch the token.
+    """
+
+    def __init__(self, tokens, left=WORD_START, right=WORD_END, separators=None, flags=0):
+        self.tokens = sorted(set(tokens), key=lambda t: (-len(t), t))
+        if separators:
+            left = rf'(?<![^{separators}])'
+            right = rf'(?![^{separators}])'
+        # A pattern that never matches when the vocabulary is empty
+        self.pattern = re.compile(f"{left}{_trie_pattern(self.tokens)}{right}" if self.tokens else r'(?!)', flags)
+
+    def findall(self, text):
+        """All token occurrences, in order (duplicates kept)."""
+        return self.pattern.findall(text)
+
+    def find_set(self, text):
+        """Distinct tokens present in the text."""
+        return set(self.pattern.findall(text))